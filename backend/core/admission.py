@@ -0,0 +1,186 @@
+"""
+Admission control for slow endpoints.
+
+Requests that may wait seconds on geocoding, routing or PDF rendering run in
+lanes, each with a cap on requests in flight and a short queue. A request
+that finds its lane full waits in the queue up to the lane's `max_wait`. It
+is rejected at once with 429 and a Retry-After estimate when the queue is
+full, or when the expected wait (from the lane's recent service times)
+already exceeds `max_wait`. A streamed response (such as a PDF export,
+rendered while it is sent) keeps its slot until the body is finished or
+the response is closed. Trip requests and location searches that can be
+answered from the cache go to a separate, wider lane, so they are not stuck
+behind the slow ones. Endpoints not listed in ROUTES are not limited.
+
+Limits are per worker process; they matter with threaded (gthread) or
+gevent workers, where one process serves many requests at once.
+"""
+import json
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import swrcache
+from .geocoding import _query_key
+from .routing import _points_key
+
+# Lane settings: in-flight limit, queue length, longest wait (s), initial service time estimate (s)
+LANES = {
+    'trip': {'limit': 4, 'queue': 8, 'max_wait': 5.0, 'service_time': 2.0},
+    'search': {'limit': 2, 'queue': 8, 'max_wait': 2.0, 'service_time': 1.0},
+    'cached': {'limit': 16, 'queue': 32, 'max_wait': 1.0, 'service_time': 0.2},
+}
+# URL name -> lane
+ROUTES = {
+    'trip': 'trip',
+    'optimize_trip': 'trip',
+    'departure_sweep': 'trip',
+    'assign_fleet': 'trip',
+    'export_logs': 'trip',
+    'location_search': 'search',
+}
+# Weight of the latest request in the service time average
+SERVICE_TIME_ALPHA = 0.2
+
+class Lane:
+    def __init__(self, name, limit, queue, max_wait, service_time):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.service_time = service_time
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def expected_wait(self, ahead):
+        """Seconds until a slot frees for a request with `ahead` requests queued before it."""
+        return self.service_time * math.ceil((ahead + 1) / self.limit)
+
+    def acquire(self):
+        """Take a slot. Returns None once admitted, or the suggested retry delay (s) if rejected."""
+        with self._cond:
+            if self.in_flight < self.limit and not self.waiting:
+                self.in_flight += 1
+                return None
+            wait = self.expected_wait(self.waiting)
+            if self.waiting >= self.queue or wait > self.max_wait:
+                return wait
+            self.waiting += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return self.expected_wait(self.waiting)
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed):
+        with self._cond:
+            self.in_flight -= 1
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+            self._cond.notify()
+
+class _HeldSlot:
+    """A streaming body that releases its lane slot once sent or closed."""
+    def __init__(self, content, lane, started):
+        self.content = content
+        self.lane = lane
+        self.started = started
+        self.released = False
+
+    def __iter__(self):
+        try:
+            yield from self.content
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self.lane.release(time.monotonic() - self.started)
+
+# Shared by every handler in the process
+lanes = {}
+_lanes_lock = threading.Lock()
+
+def get_lane(name):
+    if not lanes:
+        with _lanes_lock:
+            if not lanes:
+                overrides = getattr(settings, 'ADMISSION_LANES', {})
+                for lane, config in LANES.items():
+                    lanes[lane] = Lane(lane, **{**config, **overrides.get(lane, {})})
+    return lanes.get(name)
+
+def _cached(key):
+    return swrcache.lookup(key)[0]
+
+def trip_is_cached(data):
+    """True if every location of a trip request body and its route are cached."""
+    if not isinstance(data, dict):
+        return False
+    stops = data.get('stops') or []
+    names = [data.get('current_location')]
+    if stops:
+        names += [stop.get('location') for stop in stops if isinstance(stop, dict)]
+    else:
+        names += [data.get('pickup_location'), data.get('dropoff_location')]
+    if not all(isinstance(name, str) and name for name in names):
+        return False
+    points = [_cached(_query_key('geocode', name)) for name in names]
+    if not all(points):
+        return False
+    return _cached(_points_key('route', points)) is not None
+
+def search_is_cached(request):
+    return _cached(_query_key('search_5', request.GET.get('q', ''))) is not None
+
+class AdmissionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'ADMISSION_CONTROL', True)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        admitted = getattr(request, '_admission', None)
+        if admitted:
+            lane, started = admitted
+            if response.streaming and not response.is_async:
+                response.streaming_content = _HeldSlot(response.streaming_content, lane, started)
+            else:
+                lane.release(time.monotonic() - started)
+        return response
+
+    def _lane_for(self, request):
+        name = ROUTES.get(request.resolver_match.url_name)
+        if name == 'trip' and request.resolver_match.url_name == 'trip':
+            try:
+                if trip_is_cached(json.loads(request.body or b'null')):
+                    name = 'cached'
+            except ValueError:
+                pass
+        elif name == 'search' and search_is_cached(request):
+            name = 'cached'
+        return get_lane(name)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.enabled or request.method == 'OPTIONS':
+            return None
+        lane = self._lane_for(request)
+        if lane is None:
+            return None
+        retry_after = lane.acquire()
+        if retry_after is not None:
+            response = JsonResponse({'error': 'Server busy, please retry shortly'}, status=429)
+            response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return response
+        request._admission = (lane, time.monotonic())
+        return None
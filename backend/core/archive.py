@@ -0,0 +1,268 @@
+"""
+Cold archive of old trips.
+
+Trips older than a cutoff are moved out of the database into one file per
+month (by creation date) under ARCHIVE_DIR. Each trip is stored as a
+zlib-compressed block holding its detail representation column by column
+(one list per stop and log field), followed by its generated PDFs as raw
+segments. An index mapping trip id to block and PDF offsets sits at the end
+of the file:
+
+    magic | trip blocks and PDFs ... | compressed JSON index | index offset, size | magic
+
+Reads memory-map the file and decompress only the requested trip's block,
+so an archived trip is served without loading the rest of the month.
+Archiving streams trips from the database and PDFs from storage into the
+file one at a time, so memory does not grow with the size of the month.
+
+PDFs are found by their `trip_<id>_` prefix. Older PDFs were saved as
+`logs/<date>.pdf` with no trip id. Such a file is taken to belong to the
+trip whose first log day is that date and that was created at most
+LEGACY_MATCH_SECONDS before the file was written.
+"""
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import LogEntry, Trip
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TLARC1\n'
+FOOTER = struct.Struct('<QI7s')
+SUFFIX = '.tla'
+PDF_DIR = 'logs'
+COMPRESS_LEVEL = 9
+# Trips loaded from the database at a time while archiving
+CHUNK_SIZE = 100
+LEGACY_MATCH_SECONDS = 300
+COPY_BUFFER = 1024 * 1024
+
+re_legacy_pdf = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:_\w+)?\.pdf$')
+
+# path -> (stat key, mmap, index)
+_open = {}
+_open_lock = threading.Lock()
+
+def _archive_dir():
+    return settings.ARCHIVE_DIR
+
+def _month_path(month):
+    return os.path.join(_archive_dir(), f'{month}{SUFFIX}')
+
+def _to_columns(rows):
+    if not rows:
+        return {}
+    return {field: [row[field] for row in rows] for field in rows[0]}
+
+def _from_columns(columns):
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*columns.values())]
+
+def _encode_trip(data):
+    data = dict(data)
+    data['stops'] = _to_columns(data['stops'])
+    data['logs'] = _to_columns(data['logs'])
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode(), COMPRESS_LEVEL)
+
+def _decode_trip(block):
+    data = json.loads(zlib.decompress(block))
+    data['stops'] = _from_columns(data['stops'])
+    data['logs'] = _from_columns(data['logs'])
+    return data
+
+def _read_index(buf):
+    """The index of a mapped archive file, or None if it is not one."""
+    if len(buf) < len(MAGIC) + FOOTER.size or buf[:len(MAGIC)] != MAGIC:
+        return None
+    offset, size, magic = FOOTER.unpack_from(buf, len(buf) - FOOTER.size)
+    if magic != MAGIC:
+        return None
+    index = json.loads(zlib.decompress(buf[offset:offset + size]))
+    return {int(trip_id): entry for trip_id, entry in index.items()}
+
+def _mapped(path):
+    """(mmap, index) for an archive file, remapped when the file is replaced."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if st.st_size < len(MAGIC) + FOOTER.size:
+        # Also covers empty files, which cannot be mapped
+        logger.warning(f"Not an archive file: {path}")
+        return None
+    with _open_lock:
+        cached = _open.get(path)
+        if cached and cached[0] == key:
+            return cached[1], cached[2]
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = _read_index(buf)
+        if index is None:
+            buf.close()
+            logger.warning(f"Not an archive file: {path}")
+            return None
+        # Readers may still hold the previous map; it is released when they drop it
+        _open[path] = (key, buf, index)
+        return buf, index
+
+def archive_months():
+    """Months with an archive file, oldest first."""
+    try:
+        names = os.listdir(_archive_dir())
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len(SUFFIX)] for name in names if name.endswith(SUFFIX))
+
+def _locate(trip_id):
+    for month in reversed(archive_months()):
+        mapped = _mapped(_month_path(month))
+        if mapped and trip_id in mapped[1]:
+            return mapped[0], mapped[1][trip_id]
+    return None, None
+
+def read_trip(trip_id):
+    """An archived trip in TripDetailSerializer form, or None if it is not archived."""
+    buf, entry = _locate(trip_id)
+    if entry is None:
+        return None
+    offset, size = entry['block']
+    return _decode_trip(buf[offset:offset + size])
+
+def read_file(trip_id, name):
+    """The bytes of one of an archived trip's PDFs, or None."""
+    buf, entry = _locate(trip_id)
+    if entry is None or name not in entry['files']:
+        return None
+    offset, size = entry['files'][name]
+    return buf[offset:offset + size]
+
+def _write_month(month, entries):
+    """
+    Write `entries` (trip id, block, PDF names under PDF_DIR) to the month's
+    file, keeping the trips already archived there. Each entry is written as
+    it is produced and PDFs are copied from storage in chunks. The file is
+    replaced atomically.
+    """
+    path = _month_path(month)
+    os.makedirs(_archive_dir(), exist_ok=True)
+    existing = _mapped(path)
+    tmp = f'{path}.tmp'
+    index = {}
+    with open(tmp, 'wb') as out:
+        out.write(MAGIC)
+
+        def segment(data):
+            start = out.tell()
+            out.write(data)
+            return [start, len(data)]
+
+        def copy(name):
+            start = out.tell()
+            with default_storage.open(f'{PDF_DIR}/{name}', 'rb') as f:
+                shutil.copyfileobj(f, out, COPY_BUFFER)
+            return [start, out.tell() - start]
+
+        for trip_id, block, names in entries:
+            index[trip_id] = {
+                'block': segment(block),
+                'files': {name: copy(name) for name in names},
+            }
+        if existing:
+            buf, old_index = existing
+            for trip_id, entry in old_index.items():
+                if trip_id in index:
+                    continue
+                offset, size = entry['block']
+                index[trip_id] = {
+                    'block': segment(buf[offset:offset + size]),
+                    'files': {name: segment(buf[o:o + s]) for name, (o, s) in entry['files'].items()},
+                }
+        data = zlib.compress(json.dumps(index, separators=(',', ':')).encode(), COMPRESS_LEVEL)
+        offset = out.tell()
+        out.write(data)
+        out.write(FOOTER.pack(offset, len(data), MAGIC))
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, path)
+
+def _trip_files(trip_id, names):
+    prefix = f'trip_{trip_id}_'
+    return [name for name in names if name.startswith(prefix) and name.endswith('.pdf')]
+
+def _legacy_files(names):
+    """{date: [(modified time, name)]} for PDFs saved without a trip id."""
+    legacy = defaultdict(list)
+    for name in names:
+        match = re_legacy_pdf.match(name)
+        if match:
+            legacy[match.group(1)].append((default_storage.get_modified_time(f'{PDF_DIR}/{name}'), name))
+    return legacy
+
+def _claim_legacy_files(trip, legacy):
+    """Take the legacy PDFs written shortly after `trip` was created for its first log day."""
+    first = next(iter(trip.logentry_set.all()), None)
+    if first is None:
+        return []
+    candidates = legacy.get(first.date.isoformat(), [])
+    claimed = [(modified, name) for modified, name in candidates
+               if 0 <= (modified - trip.created_at).total_seconds() <= LEGACY_MATCH_SECONDS]
+    for item in claimed:
+        candidates.remove(item)
+    return [name for _, name in claimed]
+
+def archive_trips(before, dry_run=False):
+    """
+    Move trips created before `before` (an aware datetime) into the monthly
+    archive files, then delete them and their PDFs. Returns
+    {month: trip count}.
+    """
+    from .serializers import TripDetailSerializer
+
+    by_month = defaultdict(list)
+    trips = Trip.objects.filter(created_at__lt=before).order_by('created_at', 'id')
+    for trip_id, created_at in trips.values_list('id', 'created_at').iterator():
+        by_month[f'{timezone.localtime(created_at):%Y-%m}'].append(trip_id)
+    counts = {month: len(ids) for month, ids in by_month.items()}
+    if dry_run or not by_month:
+        return counts
+
+    try:
+        pdf_names = default_storage.listdir(PDF_DIR)[1]
+    except FileNotFoundError:
+        pdf_names = []
+    legacy = _legacy_files(pdf_names)
+    logs = Prefetch('logentry_set', queryset=LogEntry.objects.order_by('date', 'start_time', 'id'))
+    for month, ids in by_month.items():
+        paths = []
+
+        def entries():
+            for i in range(0, len(ids), CHUNK_SIZE):
+                chunk = Trip.objects.filter(id__in=ids[i:i + CHUNK_SIZE]).prefetch_related('stops', logs)
+                for trip in chunk.order_by('created_at', 'id'):
+                    names = _trip_files(trip.id, pdf_names) + _claim_legacy_files(trip, legacy)
+                    paths.extend(f'{PDF_DIR}/{name}' for name in names)
+                    yield trip.id, _encode_trip(TripDetailSerializer(trip).data), names
+
+        _write_month(month, entries())
+        # Only delete once the month's file is safely on disk
+        with transaction.atomic():
+            for i in range(0, len(ids), CHUNK_SIZE):
+                Trip.objects.filter(id__in=ids[i:i + CHUNK_SIZE]).delete()
+        for path in paths:
+            default_storage.delete(path)
+    return counts
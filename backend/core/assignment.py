@@ -0,0 +1,161 @@
+"""
+Driver-to-load assignment across a fleet.
+
+Every (driver, load) pair is planned with the HOS scheduler from the
+driver's live clocks: deadhead to the pickup, load, drive the lane and
+unload. Deadhead distances come from one routing table request and lane
+routes from the (cached) router, so each distance is looked up once for the
+whole N x M evaluation, which runs on the shared process pool for large
+fleets. The pairing minimizing late deliveries, then total lateness, then
+total arrival time is found with the Hungarian algorithm.
+"""
+import math
+
+from django.utils import timezone
+
+from .procpool import get_pool
+from .routing import router
+from .services import make_stop, plan_hos_schedule, simulated_cycle_history
+
+# Pair evaluations below this count run inline
+POOL_MIN_PAIRS = 32
+# Cost weights: a late delivery outweighs any lateness, which outweighs arrival time
+LATE_WEIGHT = 1e9
+LATENESS_WEIGHT = 1e3
+
+def hungarian(cost):
+    """
+    Minimum-cost assignment for a rectangular cost matrix.
+
+    Returns a list of (row, column) pairs covering every row if there are no
+    more rows than columns, else every column.
+    """
+    n, m = len(cost), len(cost[0]) if cost else 0
+    if n > m:
+        return [(r, c) for c, r in hungarian([list(col) for col in zip(*cost)])]
+
+    # Shortest augmenting paths with potentials, 1-indexed; O(n^2 m)
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    match = [0] * (m + 1)  # column -> row
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = [math.inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = match[j0], math.inf, 0
+            row = cost[i0 - 1]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    return sorted((match[j] - 1, j - 1) for j in range(1, m + 1) if match[j])
+
+def _road_miles(table, i, j, a, b):
+    from geopy.distance import geodesic
+    value = table[i][j] if table else None
+    return value if value is not None else geodesic(a, b).miles
+
+def _lane_miles(load):
+    from geopy.distance import geodesic
+    route = router.get_route(load['pickup_coords'], load['dropoff_coords'])
+    return route['distance'] if route else geodesic(load['pickup_coords'], load['dropoff_coords']).miles
+
+def _evaluate(args):
+    legs, stops, origin, cycle_hours, use_sleeper_berth, departure, rolling_window, clocks = args
+    plan = plan_hos_schedule(legs, stops, origin, cycle_hours, use_sleeper_berth=use_sleeper_berth,
+                             rolling_window=rolling_window, departure=departure,
+                             driving_hours_used=clocks[0], window_hours_used=clocks[1])
+    return plan['finish']
+
+def assign_loads(drivers, loads, now=None, workers=None):
+    """
+    Assign `loads` to `drivers` (Driver instances).
+
+    Each load is a dict with pickup/dropoff `*_location` and `*_coords`,
+    `pickup_dwell_minutes`, `dropoff_dwell_minutes` and an optional naive
+    `deliver_by` datetime. Returns a dict with the `assignments` (driver and
+    load indexes, ETA and lateness), the `unassigned` load indexes and the
+    `late` count.
+    """
+    now = now or timezone.now()
+    # The scheduler works in naive local time
+    start = timezone.localtime(now).replace(tzinfo=None, second=0, microsecond=0)
+    if not drivers or not loads:
+        return {'assignments': [], 'unassigned': list(range(len(loads))), 'late': 0, 'evaluated': 0}
+
+    origins = [tuple(d.current_location_coords) for d in drivers]
+    pickups = [tuple(load['pickup_coords']) for load in loads]
+    m = len(origins)
+    table = router.get_distance_matrix(origins + pickups, sources=range(m),
+                                       destinations=range(m, m + len(pickups)))
+    deadhead = [[_road_miles(table, i, j, a, b) for j, b in enumerate(pickups)] for i, a in enumerate(origins)]
+    lanes = [_lane_miles(load) for load in loads]
+    stops = [
+        [make_stop(load['pickup_location'], load['pickup_coords'], 'pickup', load['pickup_dwell_minutes']),
+         make_stop(load['dropoff_location'], load['dropoff_coords'], 'dropoff', load['dropoff_dwell_minutes'])]
+        for load in loads
+    ]
+
+    jobs = []
+    for i, driver in enumerate(drivers):
+        clocks = driver.clocks(now)
+        rolling_window = simulated_cycle_history(driver.cycle_hours)
+        for j in range(len(loads)):
+            jobs.append(([deadhead[i][j], lanes[j]], stops[j], driver.current_location, driver.cycle_hours,
+                         driver.use_sleeper_berth, start, rolling_window, clocks))
+
+    if len(jobs) >= POOL_MIN_PAIRS and workers != 1:
+        finishes = list(get_pool(workers).map(_evaluate, jobs, chunksize=8))
+    else:
+        finishes = [_evaluate(job) for job in jobs]
+
+    n = len(loads)
+    cost, lateness = [], []
+    for i in range(m):
+        cost_row, late_row = [], []
+        for j, load in enumerate(loads):
+            finish = finishes[i * n + j]
+            late = max(0.0, (finish - load['deliver_by']).total_seconds() / 60) if load.get('deliver_by') else 0.0
+            eta = (finish - start).total_seconds() / 60
+            cost_row.append((LATE_WEIGHT if late else 0) + late * LATENESS_WEIGHT + eta)
+            late_row.append(late)
+        cost.append(cost_row)
+        lateness.append(late_row)
+
+    pairs = hungarian(cost)
+    assignments = []
+    for i, j in pairs:
+        assignments.append({
+            'driver': i,
+            'load': j,
+            'eta': finishes[i * n + j],
+            'deadhead_miles': round(deadhead[i][j], 1),
+            'late_minutes': round(lateness[i][j]),
+        })
+    assigned = {a['load'] for a in assignments}
+    return {
+        'assignments': assignments,
+        'unassigned': [j for j in range(n) if j not in assigned],
+        'late': sum(1 for i, j in pairs if lateness[i][j] > 0),
+        'evaluated': len(jobs),
+    }
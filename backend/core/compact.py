@@ -0,0 +1,133 @@
+"""
+Compact per-day duty-status encoding.
+
+A day of logs is stored as run-length encoded minutes: each run is one
+little-endian uint16 holding the status code in the top 3 bits and the run
+length in minutes (1-1440) in the low 13. A typical day packs into 10-30
+bytes instead of 5-15 LogEntry rows. Remarks are kept separately, keyed by
+the minute their entry starts, and entries are rebuilt by splitting runs at
+those minutes.
+"""
+import struct
+from datetime import time
+
+from django.db import transaction
+
+from .models import LogDay, LogDayRemark, LogEntry
+
+MINUTES_PER_DAY = 1440
+# Code 0 marks minutes not covered by any entry
+STATUS_CODES = {
+    LogEntry.Status.OFF_DUTY: 1,
+    LogEntry.Status.SLEEPER_BERTH: 2,
+    LogEntry.Status.DRIVING: 3,
+    LogEntry.Status.ON_DUTY: 4,
+}
+STATUSES = {code: str(status) for status, code in STATUS_CODES.items()}
+LENGTH_BITS = 13
+LENGTH_MASK = (1 << LENGTH_BITS) - 1
+
+def _minute(value):
+    """Minute of day for a time or 'HH:MM:SS' string; the end of day (23:59:59) is 1440."""
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    if value.hour == 23 and value.minute == 59 and value.second == 59:
+        return MINUTES_PER_DAY
+    return value.hour * 60 + value.minute
+
+def _clock(minute):
+    if minute >= MINUTES_PER_DAY:
+        return '23:59:59'
+    return f'{minute // 60:02d}:{minute % 60:02d}:00'
+
+def encode_day(entries):
+    """
+    Pack one day's entries (dicts with status, start_time, end_time and
+    remarks, in time order and not overlapping). Returns (runs, remarks)
+    where remarks maps start minute to text.
+    """
+    runs = []
+    remarks = {}
+    position = 0
+    for e in entries:
+        start, end = _minute(e['start_time']), _minute(e['end_time'])
+        if end <= start:
+            continue
+        if start > position:
+            runs.append([0, start - position])
+        code = STATUS_CODES[e['status']]
+        if runs and runs[-1][0] == code and start == position:
+            runs[-1][1] += end - start
+        else:
+            runs.append([code, end - start])
+        remarks[start] = e.get('remarks', '')
+        position = end
+    return struct.pack(f'<{len(runs)}H', *((code << LENGTH_BITS) | length for code, length in runs)), remarks
+
+def decode_runs(blob):
+    """Yield (status code, start minute, end minute) for each run."""
+    position = 0
+    for (value,) in struct.iter_unpack('<H', bytes(blob)):
+        length = value & LENGTH_MASK
+        yield value >> LENGTH_BITS, position, position + length
+        position += length
+
+def status_minutes(blob):
+    """Minutes per status for the day, read from the runs alone."""
+    totals = dict.fromkeys(STATUSES.values(), 0)
+    for code, start, end in decode_runs(blob):
+        if code:
+            totals[STATUSES[code]] += end - start
+    return totals
+
+def decode_day(day, blob, remarks):
+    """Rebuild the day's entries in row form from its runs and remarks."""
+    starts = sorted(remarks)
+    entries = []
+    i = 0
+    for code, start, end in decode_runs(blob):
+        if not code:
+            continue
+        # Split the run at every entry start inside it
+        while i < len(starts) and starts[i] < start:
+            i += 1
+        cut = start
+        while i < len(starts) and starts[i] < end:
+            if starts[i] > cut:
+                entries[-1]['end_time'] = _clock(starts[i])
+            entries.append({
+                'date': day,
+                'status': STATUSES[code],
+                'start_time': _clock(starts[i]),
+                'end_time': _clock(end),
+                'remarks': remarks[starts[i]],
+            })
+            cut = starts[i]
+            i += 1
+    return entries
+
+def store_days(trip, logs):
+    """Replace the trip's LogDay rows with the given logs (row-form dicts), one row per day."""
+    by_day = {}
+    for log in logs:
+        if log['status'] in STATUS_CODES:
+            by_day.setdefault(log['date'], []).append(log)
+    with transaction.atomic():
+        LogDay.objects.filter(trip=trip).delete()
+        days, remark_rows = [], []
+        for day in sorted(by_day):
+            entries = sorted(by_day[day], key=lambda e: _minute(e['start_time']))
+            runs, remarks = encode_day(entries)
+            log_day = LogDay(trip=trip, driver_id=trip.driver_id, date=day, runs=runs)
+            days.append(log_day)
+            remark_rows.extend(LogDayRemark(day=log_day, minute=m, text=t) for m, t in remarks.items())
+        LogDay.objects.bulk_create(days)
+        LogDayRemark.objects.bulk_create(remark_rows)
+    return len(days)
+
+def read_day(trip_id, day):
+    """One day's entries in row form, or None if the day is not stored."""
+    log_day = LogDay.objects.filter(trip_id=trip_id, date=day).prefetch_related('remarks').first()
+    if log_day is None:
+        return None
+    return decode_day(day, log_day.runs, {r.minute: r.text for r in log_day.remarks.all()})
@@ -0,0 +1,63 @@
+"""
+Departure-time sweep: the arrival time of one trip for every departure slot
+in a range.
+
+The route is looked up once and every slot is run through the pure HOS
+scheduler with the same cycle history. Where the 14-hour window and the
+10-hour breaks fall depends only on the departure's time of day, so slots a
+whole number of days apart share one scheduler run.
+"""
+from datetime import datetime, timedelta
+
+from .services import plan_hos_schedule, route_legs, simulated_cycle_history
+
+DEFAULT_SWEEP_HOURS = 48
+MAX_SWEEP_HOURS = 168
+DEFAULT_STEP_MINUTES = 15
+MIN_STEP_MINUTES = 5
+
+def sweep_departures(origin, origin_coords, stops, cycle_hours=0, use_sleeper_berth=False,
+                     earliest=None, hours=DEFAULT_SWEEP_HOURS, step_minutes=DEFAULT_STEP_MINUTES):
+    """
+    Evaluate departures every `step_minutes` for `hours` from `earliest`.
+
+    `stops` are dicts as returned by services.trip_stops(). Returns a dict
+    with the `curve` (departure, arrival and trip hours per slot), the `best`
+    slot (shortest trip, then earliest arrival), the `total_distance` and
+    the number of scheduler runs actually `evaluated`.
+    """
+    if earliest is None:
+        earliest = datetime.now()
+    # Round up to the next slot boundary
+    earliest = earliest.replace(second=0, microsecond=0)
+    offset = (earliest.hour * 60 + earliest.minute) % step_minutes
+    if offset:
+        earliest += timedelta(minutes=step_minutes - offset)
+
+    leg_distances, _, _ = route_legs([origin_coords] + [s['coords'] for s in stops])
+    rolling_window = simulated_cycle_history(cycle_hours)
+
+    durations = {}  # minute of day -> trip duration
+    curve = []
+    for i in range(int(hours * 60 // step_minutes) + 1):
+        departure = earliest + timedelta(minutes=i * step_minutes)
+        minute_of_day = departure.hour * 60 + departure.minute
+        duration = durations.get(minute_of_day)
+        if duration is None:
+            plan = plan_hos_schedule(leg_distances, stops, origin, cycle_hours,
+                                     use_sleeper_berth=use_sleeper_berth,
+                                     rolling_window=rolling_window, departure=departure)
+            duration = durations[minute_of_day] = plan['finish'] - departure
+        curve.append({
+            'departure': departure,
+            'arrival': departure + duration,
+            'trip_hours': round(duration.total_seconds() / 3600, 2),
+        })
+
+    best = min(curve, key=lambda slot: (slot['trip_hours'], slot['arrival']))
+    return {
+        'curve': curve,
+        'best': best,
+        'total_distance': sum(leg_distances),
+        'evaluated': len(durations),
+    }
@@ -0,0 +1,209 @@
+import io
+import os
+import tempfile
+from collections import defaultdict
+
+from .models import LogEntry, Trip
+from .services import compute_daily_totals, draw_log_page, new_log_canvas
+
+# Pages rendered into a single part file on disk. Each part is an
+# independent ReportLab document and parts are concatenated into the output
+# one at a time, so memory use is bounded by the part size rather than the
+# size of the export.
+PAGES_PER_PART = 500
+
+def plan_export_parts(trip_ids=None, start_date=None, end_date=None, pages_per_part=PAGES_PER_PART):
+    """
+    Split an export into parts of whole trips, each holding about
+    `pages_per_part` pages (one page per trip-day).
+
+    Returns a list of trip id lists in export order.
+    """
+    pages_per_trip = defaultdict(int)
+    days = (LogEntry.objects.matching(trip_ids, start_date, end_date)
+            .values_list('trip_id', 'date').distinct().order_by('trip_id', 'date'))
+    for trip_id, _ in days.iterator(chunk_size=2000):
+        pages_per_trip[trip_id] += 1
+
+    parts, current, current_pages = [], [], 0
+    for trip_id, pages in pages_per_trip.items():
+        if current and current_pages + pages > pages_per_part:
+            parts.append(current)
+            current, current_pages = [], 0
+        current.append(trip_id)
+        current_pages += pages
+    if current:
+        parts.append(current)
+    return parts
+
+def _iter_trip_days(trip_ids, start_date=None, end_date=None):
+    """Yield (trip, day, day_logs) in export order, streaming rows from the database."""
+    trips = Trip.objects.in_bulk(trip_ids)
+    qs = (LogEntry.objects.matching(trip_ids, start_date, end_date)
+          .order_by('trip_id', 'date', 'start_time')
+          .values('trip_id', 'date', 'status', 'start_time', 'end_time', 'remarks'))
+
+    key, day_logs = None, []
+    for row in qs.iterator(chunk_size=2000):
+        row_key = (row['trip_id'], row['date'])
+        if row_key != key and day_logs:
+            yield trips[key[0]], key[1], day_logs
+            day_logs = []
+        key = row_key
+        day_logs.append({
+            'date': row['date'],
+            'status': row['status'],
+            'start_time': row['start_time'].strftime("%H:%M:%S"),
+            'end_time': row['end_time'].strftime("%H:%M:%S"),
+            'remarks': row['remarks'],
+        })
+    if day_logs:
+        yield trips[key[0]], key[1], day_logs
+
+def render_export_part(trip_ids, path, start_date=None, end_date=None):
+    """Render the log pages for `trip_ids` into the PDF file at `path`."""
+    c = new_log_canvas(path)
+    for trip, day, day_logs in _iter_trip_days(trip_ids, start_date, end_date):
+        totals = compute_daily_totals(day_logs)[day]['totals']
+        subtitle = f"Trip #{trip.id}: {trip.current_location} - {trip.pickup_location} - {trip.dropoff_location}"
+        draw_log_page(c, day, day_logs, totals, subtitle=subtitle)
+    c.save()
+    return path
+
+def _renumber(obj, base):
+    """`obj` with every indirect reference shifted by `base` (in place for containers)."""
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject
+
+    if isinstance(obj, IndirectObject):
+        return IndirectObject(obj.idnum + base, 0, None)
+    if isinstance(obj, DictionaryObject):
+        # dict methods, so references are not resolved
+        for key, value in list(dict.items(obj)):
+            dict.__setitem__(obj, key, _renumber(value, base))
+    elif isinstance(obj, ArrayObject):
+        for i, value in enumerate(list(list.__iter__(obj))):
+            list.__setitem__(obj, i, _renumber(value, base))
+    return obj
+
+class PdfConcatenator:
+    """
+    Writes the pages of several PDF files out as one document, reading one
+    input at a time. Each input's objects are copied with their numbers
+    shifted past the previous inputs', its pages are moved under a single
+    page tree, and its own catalog and page tree nodes are written as nulls.
+    Only the offset of each object and the page numbers are kept in memory.
+    """
+    PAGES = 1
+    CATALOG = 2
+
+    def __init__(self):
+        self.position = 0
+        self.offsets = {}
+        self.kids = []
+        self.next_number = 3
+
+    def _emit(self, data):
+        self.position += len(data)
+        return data
+
+    def _object(self, number, obj):
+        buf = io.BytesIO()
+        buf.write(b'%d 0 obj\n' % number)
+        obj.write_to_stream(buf)
+        buf.write(b'\nendobj\n')
+        self.offsets[number] = self.position
+        return self._emit(buf.getvalue())
+
+    def header(self):
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def add(self, path):
+        """Yield the objects of the PDF file at `path` as bytes."""
+        from pypdf import PdfReader
+        from pypdf.generic import DictionaryObject, IndirectObject, NameObject, NullObject
+
+        reader = PdfReader(path)
+        base = self.next_number - 1
+        size = reader.trailer['/Size']
+        pages = [page.indirect_reference.idnum for page in reader.pages]
+        page_numbers = set(pages)
+        root = reader.trailer.raw_get('/Root').idnum
+        for number in range(1, size):
+            obj = reader.get_object(number)
+            if number in page_numbers:
+                obj = _renumber(obj, base)
+                obj[NameObject('/Parent')] = IndirectObject(self.PAGES, 0, None)
+            elif obj is None or number == root or (isinstance(obj, DictionaryObject) and obj.get('/Type') == '/Pages'):
+                obj = NullObject()
+            else:
+                obj = _renumber(obj, base)
+            yield self._object(number + base, obj)
+        self.kids.extend(number + base for number in pages)
+        self.next_number = base + size
+
+    def finish(self):
+        """The page tree, catalog, cross-reference table and trailer."""
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+
+        pages = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(IndirectObject(n, 0, None) for n in self.kids),
+            NameObject('/Count'): NumberObject(len(self.kids)),
+        })
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGES, 0, None),
+        })
+        out = self._object(self.PAGES, pages) + self._object(self.CATALOG, catalog)
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % self.next_number]
+        xref += [b'%010d 00000 n \n' % self.offsets[n] for n in range(1, self.next_number)]
+        xref.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                    % (self.next_number, self.CATALOG, self.position))
+        return out + self._emit(b''.join(xref))
+
+def stream_export(parts, start_date=None, end_date=None, workers=1):
+    """
+    Yield the PDF of an export planned with plan_export_parts() in chunks.
+
+    Parts are rendered to temporary files and each is streamed and deleted
+    as soon as it is ready. With `workers` > 1 they are rendered ahead on
+    the shared process pool.
+    """
+    concatenator = PdfConcatenator()
+    with tempfile.TemporaryDirectory(prefix='logexport_') as tmpdir:
+        paths = [os.path.join(tmpdir, f'part_{i:05d}.pdf') for i in range(len(parts))]
+        if workers > 1 and len(parts) > 1:
+            from .procpool import get_pool
+
+            pool = get_pool(workers)
+            rendered = [pool.submit(render_export_part, part, path, start_date, end_date)
+                        for part, path in zip(parts, paths)]
+        else:
+            rendered = None
+        yield concatenator.header()
+        try:
+            for i, (part, path) in enumerate(zip(parts, paths)):
+                if rendered:
+                    rendered[i].result()
+                else:
+                    render_export_part(part, path, start_date, end_date)
+                yield from concatenator.add(path)
+                os.remove(path)
+        finally:
+            for future in rendered or []:
+                future.cancel()
+        yield concatenator.finish()
+
+def export_logs_pdf(fileobj, trip_ids=None, start_date=None, end_date=None,
+                    workers=1, pages_per_part=PAGES_PER_PART):
+    """
+    Render the logs of several trips into one PDF written to `fileobj`.
+
+    Returns the number of parts rendered (0 when nothing matched).
+    """
+    parts = plan_export_parts(trip_ids, start_date, end_date, pages_per_part)
+    if not parts:
+        return 0
+    for chunk in stream_export(parts, start_date, end_date, workers):
+        fileobj.write(chunk)
+    return len(parts)
@@ -1,42 +1,56 @@
-import requests
-import time
-from django.core.cache import cache
+import hashlib
+from functools import partial
+from . import swrcache
+from .upstream import Upstream
+
+# Autocomplete results are short-lived
+SEARCH_TTL = 60*60
+SEARCH_HARD_TTL = 60*60*24
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a location query, for cache keys."""
+    return " ".join(text.split()).casefold()
+
+def _query_key(prefix, text):
+    # Hashed: raw queries contain spaces, which memcached keys cannot
+    return f"{prefix}_{hashlib.sha1(normalize_query(text).encode()).hexdigest()}"
+
+# Nominatim usage policy: at most 1 request per second
+NOMINATIM_INTERVAL = 1.0
+NOMINATIM_MAX_CONCURRENCY = 2
 
 class NominatimGeocoder:
+    """Nominatim client; one instance is shared by all threads."""
+
     def __init__(self, user_agent="truck-log-app"):
         self.user_agent = user_agent
         self.base_url = "https://nominatim.openstreetmap.org/search"
+        self.upstream = Upstream("nominatim", max_concurrency=NOMINATIM_MAX_CONCURRENCY,
+                                 min_interval=NOMINATIM_INTERVAL, headers={"User-Agent": user_agent})
         
     def geocode(self, location_name):
         """Get coordinates for a location name with caching."""
-        # Check cache first
-        cache_key = f"geocode_{location_name}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
-        # Respect Nominatim usage policy (max 1 request per second)
-        time.sleep(1)
-        
+        cache_key = _query_key("geocode", location_name)
+        # Stale entries are served and refreshed in the background; concurrent
+        # misses for the same name share one upstream request
+        return swrcache.get_or_fetch(cache_key, partial(self._fetch_geocode, location_name, cache_key))
+
+    def _fetch_geocode(self, location_name, cache_key):
         params = {
             "q": location_name,
             "format": "json",
             "limit": 1,
         }
-        headers = {
-            "User-Agent": self.user_agent
-        }
-        
         try:
-            response = requests.get(self.base_url, params=params, headers=headers)
+            # Rate-limited across all threads of the process
+            response = self.upstream.get(self.base_url, params)
             response.raise_for_status()
             results = response.json()
             
             if results:
                 result = results[0]
                 coordinates = (float(result["lat"]), float(result["lon"]))
-                # Cache for 24 hours
-                cache.set(cache_key, coordinates, 60*60*24)
+                swrcache.store(cache_key, coordinates)
                 return coordinates
             return None
         except Exception as e:
@@ -45,24 +59,22 @@ class NominatimGeocoder:
     
     def search(self, query, limit=5):
         """Search for locations matching a query."""
-        # Respect Nominatim usage policy
-        time.sleep(1)
-        
+        cache_key = _query_key(f"search_{limit}", query)
+        return swrcache.get_or_fetch(cache_key, partial(self._fetch_search, query, limit, cache_key))
+
+    def _fetch_search(self, query, limit, cache_key):
         params = {
             "q": query,
             "format": "json",
             "limit": limit,
         }
-        headers = {
-            "User-Agent": self.user_agent
-        }
-        
         try:
-            response = requests.get(self.base_url, params=params, headers=headers)
+            # Rate-limited across all threads of the process
+            response = self.upstream.get(self.base_url, params)
             response.raise_for_status()
             results = response.json()
             
-            return [
+            locations = [
                 {
                     "name": result["display_name"],
                     "lat": float(result["lat"]),
@@ -70,6 +82,8 @@ class NominatimGeocoder:
                 }
                 for result in results
             ]
+            swrcache.store(cache_key, locations, SEARCH_TTL, SEARCH_HARD_TTL)
+            return locations
         except Exception as e:
             print(f"Location search error: {e}")
             return []
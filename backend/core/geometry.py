@@ -0,0 +1,156 @@
+import bisect
+import math
+
+# Douglas-Peucker tolerances (meters) for the map detail tiers a client may
+# request; roughly continental, regional and city zoom levels.
+ROUTE_TIERS = {
+    'low': 2000,
+    'medium': 500,
+    'high': 100,
+}
+FULL_TIER = 'full'
+
+def _project(coords):
+    """Project (lat, lon) pairs onto a local equirectangular plane in meters."""
+    lat0 = math.radians(sum(c[0] for c in coords) / len(coords))
+    kx = 111320.0 * math.cos(lat0)
+    ky = 110540.0
+    return [(lon * kx, lat * ky) for lat, lon in coords]
+
+def simplify_polyline(coords, tolerance):
+    """
+    Douglas-Peucker simplification of a (lat, lon) polyline.
+
+    `tolerance` is the maximum allowed deviation in meters. The first and last
+    points are always kept.
+    """
+    n = len(coords)
+    if n < 3:
+        return list(coords)
+
+    pts = _project(coords)
+    tol2 = tolerance * tolerance
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = pts[first]
+        x2, y2 = pts[last]
+        dx, dy = x2 - x1, y2 - y1
+        seg_len2 = dx*dx + dy*dy
+
+        max_d2, index = -1.0, 0
+        for i in range(first + 1, last):
+            px, py = pts[i]
+            if seg_len2 == 0:
+                d2 = (px - x1)**2 + (py - y1)**2
+            else:
+                # Squared perpendicular distance to the chord
+                cross = dx * (py - y1) - dy * (px - x1)
+                d2 = cross * cross / seg_len2
+            if d2 > max_d2:
+                max_d2, index = d2, i
+
+        if max_d2 > tol2:
+            keep[index] = True
+            if index - first > 1:
+                stack.append((first, index))
+            if last - index > 1:
+                stack.append((index, last))
+
+    return [c for c, k in zip(coords, keep) if k]
+
+def build_route_tiers(coords):
+    """Return {tier: simplified coordinates} for every entry in ROUTE_TIERS."""
+    return {tier: simplify_polyline(coords, tol) for tier, tol in ROUTE_TIERS.items()}
+
+def join_route_tiers(*tier_sets):
+    """Concatenate per-leg tiers, dropping the duplicated joint points."""
+    joined = {}
+    for tier in ROUTE_TIERS:
+        coords = []
+        for tiers in tier_sets:
+            leg = tiers[tier]
+            coords.extend(leg[1:] if coords else leg)
+        joined[tier] = coords
+    return joined
+
+EARTH_RADIUS_MILES = 3958.8
+
+def haversine_miles(a, b):
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = math.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
+
+class RouteIndex:
+    """
+    Cumulative-distance index over a (lat, lon) polyline.
+
+    Built once in O(n); locate() finds the point at a given distance along
+    the route with a binary search over the prefix sums.
+    """
+
+    def __init__(self, coords):
+        self.coords = list(coords)
+        self.cumulative = [0.0]
+        for a, b in zip(self.coords, self.coords[1:]):
+            self.cumulative.append(self.cumulative[-1] + haversine_miles(a, b))
+        self.length = self.cumulative[-1]
+
+    def locate(self, miles):
+        """Return the (lat, lon) point `miles` along the route, clamped to its ends."""
+        if miles <= 0 or len(self.coords) == 1:
+            return tuple(self.coords[0])
+        if miles >= self.length:
+            return tuple(self.coords[-1])
+        i = bisect.bisect_right(self.cumulative, miles) - 1
+        seg = self.cumulative[i + 1] - self.cumulative[i]
+        t = (miles - self.cumulative[i]) / seg if seg else 0.0
+        (lat1, lon1), (lat2, lon2) = self.coords[i], self.coords[i + 1]
+        return (lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t)
+
+    def locate_fraction(self, fraction):
+        """Return the point at `fraction` (0-1) of the route length."""
+        return self.locate(fraction * self.length)
+
+    def project(self, point, lo=0.0, hi=None):
+        """
+        Closest approach of `point` to the route between `lo` and `hi` miles.
+
+        Returns (off-route miles, miles along the route of the closest point).
+        Segments are measured on a local equirectangular plane, which is
+        accurate at corridor scale.
+        """
+        hi = self.length if hi is None else hi
+        first = max(0, bisect.bisect_right(self.cumulative, lo) - 1)
+        last = min(len(self.coords) - 1, bisect.bisect_left(self.cumulative, hi))
+        plat, plon = point
+        kx = 69.172 * math.cos(math.radians(plat))
+        ky = 69.0
+        coords, cumulative = self.coords, self.cumulative
+        best_d2, best_i, best_t = math.inf, first, 0.0
+        lat1, lon1 = coords[first]
+        ax, ay = (lon1 - plon) * kx, (lat1 - plat) * ky
+        for i in range(first + 1, max(first + 1, last + 1)):
+            lat2, lon2 = coords[i]
+            bx, by = (lon2 - plon) * kx, (lat2 - plat) * ky
+            dx, dy = bx - ax, by - ay
+            seg2 = dx*dx + dy*dy
+            t = -(ax*dx + ay*dy) / seg2 if seg2 else 0.0
+            if t <= 0.0:
+                t, cx, cy = 0.0, ax, ay
+            elif t >= 1.0:
+                t, cx, cy = 1.0, bx, by
+            else:
+                cx, cy = ax + t*dx, ay + t*dy
+            d2 = cx*cx + cy*cy
+            if d2 < best_d2:
+                best_d2, best_i, best_t = d2, i - 1, t
+            ax, ay = bx, by
+        if best_d2 == math.inf:
+            return haversine_miles(point, coords[first]), cumulative[first]
+        along = cumulative[best_i] + best_t * (cumulative[best_i + 1] - cumulative[best_i])
+        return math.sqrt(best_d2), along
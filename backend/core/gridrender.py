@@ -0,0 +1,135 @@
+"""
+Server-side rendering of one day's log grid from stored `grid_positions`.
+
+The layout mirrors frontend/src/components/LogGridSvg.jsx so clients can swap
+the in-browser grid for a cached image.
+"""
+import hashlib
+import io
+import json
+
+from django.core.cache import cache
+
+WIDTH = 800
+HEIGHT = 400
+LEFT_MARGIN = 100
+TOP_MARGIN = 40
+RIGHT_MARGIN = 40
+BOTTOM_MARGIN = 40
+GRID_WIDTH = WIDTH - LEFT_MARGIN - RIGHT_MARGIN
+GRID_HEIGHT = HEIGHT - TOP_MARGIN - BOTTOM_MARGIN
+ROW_HEIGHT = GRID_HEIGHT / 4
+SLOT_WIDTH = GRID_WIDTH / 96
+
+STATUS_COLORS = {
+    'Off-Duty': '#e74c3c',
+    'Sleeper Berth': '#f39c12',
+    'Driving': '#27ae60',
+    'On-Duty': '#3498db',
+}
+STATUS_ROWS = {'Off-Duty': 0, 'Sleeper Berth': 1, 'Driving': 2, 'On-Duty': 3}
+
+# Rendered images are addressed by content, so they never go stale
+GRID_CACHE_TTL = 60*60*24*7
+
+def _hour_label(i):
+    hour = i % 24
+    if hour == 0:
+        return 'Mid'
+    if hour == 12:
+        return 'Noon'
+    return str(hour - 12 if hour > 12 else hour)
+
+def _blocks(positions):
+    """Yield (x, y, width, color) for each drawable grid position."""
+    for p in positions:
+        row = STATUS_ROWS.get(p.get('status')) if p else None
+        if row is None:
+            continue
+        x = LEFT_MARGIN + p['start_slot'] * SLOT_WIDTH
+        w = (p['end_slot'] - p['start_slot']) * SLOT_WIDTH
+        yield x, TOP_MARGIN + row * ROW_HEIGHT, w, STATUS_COLORS[p['status']]
+
+def grid_digest(positions):
+    """Content hash of a day's grid positions, used as cache key and ETag."""
+    payload = json.dumps(positions, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def render_grid_svg(positions):
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}" font-family="sans-serif">',
+        f'<rect x="{LEFT_MARGIN}" y="{TOP_MARGIN}" width="{GRID_WIDTH}" height="{GRID_HEIGHT}" fill="none" stroke="#000" stroke-width="2"/>',
+    ]
+
+    ticks = []
+    for h in range(24):
+        for q in range(1, 4):
+            x = LEFT_MARGIN + h * GRID_WIDTH / 24 + q * SLOT_WIDTH
+            ticks.append(f'M{x:.2f} {TOP_MARGIN}V{TOP_MARGIN + GRID_HEIGHT}')
+    parts.append(f'<path d="{"".join(ticks)}" stroke="#ccc" stroke-width="0.5"/>')
+
+    lines = [f'M{LEFT_MARGIN} {TOP_MARGIN + i * ROW_HEIGHT:.2f}H{LEFT_MARGIN + GRID_WIDTH}' for i in range(1, 4)]
+    lines += [f'M{LEFT_MARGIN + i * GRID_WIDTH / 24:.2f} {TOP_MARGIN}V{TOP_MARGIN + GRID_HEIGHT}' for i in range(1, 24)]
+    parts.append(f'<path d="{"".join(lines)}" stroke="#000" stroke-width="1"/>')
+
+    for status, row in STATUS_ROWS.items():
+        y = TOP_MARGIN + row * ROW_HEIGHT + ROW_HEIGHT / 2
+        parts.append(f'<text x="{LEFT_MARGIN - 10}" y="{y:.2f}" text-anchor="end" dominant-baseline="middle" font-size="12" font-weight="bold">{status}</text>')
+    for i in range(25):
+        x = LEFT_MARGIN + i * GRID_WIDTH / 24
+        parts.append(f'<text x="{x:.2f}" y="{TOP_MARGIN - 5}" text-anchor="middle" font-size="10">{_hour_label(i)}</text>')
+
+    for x, y, w, color in _blocks(positions):
+        parts.append(f'<rect x="{x:.2f}" y="{y:.2f}" width="{w:.2f}" height="{ROW_HEIGHT:.2f}" fill="{color}" opacity="0.7"/>')
+
+    parts.append('</svg>')
+    return ''.join(parts)
+
+def render_grid_png(positions):
+    from PIL import Image, ImageDraw
+
+    img = Image.new('RGB', (WIDTH, HEIGHT), 'white')
+    draw = ImageDraw.Draw(img, 'RGBA')
+    bottom = TOP_MARGIN + GRID_HEIGHT
+
+    for x, y, w, color in _blocks(positions):
+        r, g, b = (int(color[i:i+2], 16) for i in (1, 3, 5))
+        draw.rectangle([x, y, x + w, y + ROW_HEIGHT], fill=(r, g, b, 178))
+
+    for h in range(24):
+        for q in range(1, 4):
+            x = LEFT_MARGIN + h * GRID_WIDTH / 24 + q * SLOT_WIDTH
+            draw.line([(x, TOP_MARGIN), (x, bottom)], fill='#ccc')
+    for i in range(1, 4):
+        y = TOP_MARGIN + i * ROW_HEIGHT
+        draw.line([(LEFT_MARGIN, y), (LEFT_MARGIN + GRID_WIDTH, y)], fill='black')
+    for i in range(1, 24):
+        x = LEFT_MARGIN + i * GRID_WIDTH / 24
+        draw.line([(x, TOP_MARGIN), (x, bottom)], fill='black')
+    draw.rectangle([LEFT_MARGIN, TOP_MARGIN, LEFT_MARGIN + GRID_WIDTH, bottom], outline='black', width=2)
+
+    for status, row in STATUS_ROWS.items():
+        y = TOP_MARGIN + row * ROW_HEIGHT + ROW_HEIGHT / 2
+        draw.text((LEFT_MARGIN - 10, y), status, fill='black', anchor='rm')
+    for i in range(25):
+        draw.text((LEFT_MARGIN + i * GRID_WIDTH / 24, TOP_MARGIN - 5), _hour_label(i), fill='black', anchor='ms')
+
+    out = io.BytesIO()
+    img.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+RENDERERS = {
+    'svg': (lambda positions: render_grid_svg(positions).encode(), 'image/svg+xml'),
+    'png': (render_grid_png, 'image/png'),
+}
+
+def get_grid_image(positions, fmt):
+    """Return (digest, body, content_type), rendering at most once per distinct grid."""
+    render, content_type = RENDERERS[fmt]
+    digest = grid_digest(positions)
+    cache_key = f"grid_{fmt}_{digest}"
+    body = cache.get(cache_key)
+    if body is None:
+        body = render(positions)
+        cache.set(cache_key, body, GRID_CACHE_TTL)
+    return digest, body, content_type
@@ -0,0 +1,238 @@
+"""
+Streaming export and chunked import of log history.
+
+Exports iterate the LogEntry queryset with `.iterator(chunk_size=...)` and
+yield one text line at a time, so a response or file of any size is written
+in constant memory. Three formats are supported: CSV, NDJSON and an ELD
+output file following the layout of 49 CFR 395 Subpart B Appendix A section
+4.8.2, with event, line and file data check values. Imports parse CSV or
+NDJSON lazily and bulk-insert in chunks.
+
+The ELD file is a partial export: it holds the header, user list and duty
+status events this app has data for. The header's driver fields come from
+the exported trips' driver (left empty when they have none or several),
+carrier and ELD fields from the ELD_* settings. License, vehicle and
+engine data, event locations and the other event segments are not tracked,
+so those fields and segments are empty.
+"""
+import csv
+import io
+import json
+from datetime import date, time
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Driver, LogEntry, Trip
+
+CHUNK_SIZE = 2000
+FORMATS = ('csv', 'ndjson', 'eld')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'eld': 'text/plain',
+}
+FIELDS = ('id', 'trip_id', 'date', 'status', 'start_time', 'end_time', 'remarks', 'grid_positions')
+
+# Multiday basis of the 70-hour/8-day rule used by the scheduler
+ELD_MULTIDAY_BASIS = 8
+# ELD event codes for a change in duty status (event type 1)
+ELD_STATUS_CODES = {
+    LogEntry.Status.OFF_DUTY: 1,
+    LogEntry.Status.SLEEPER_BERTH: 2,
+    LogEntry.Status.DRIVING: 3,
+    LogEntry.Status.ON_DUTY: 4,
+}
+
+def _rows(trip_ids=None, start_date=None, end_date=None, chunk_size=CHUNK_SIZE):
+    qs = (LogEntry.objects.matching(trip_ids, start_date, end_date)
+          .order_by('trip_id', 'date', 'start_time')
+          .values_list(*FIELDS))
+    return qs.iterator(chunk_size=chunk_size)
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in rows:
+        *values, grid = row
+        writer.writerow(values + [json.dumps(grid) if grid is not None else ''])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header line when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def iter_ndjson(rows):
+    for row in rows:
+        record = dict(zip(FIELDS, row))
+        record['date'] = record['date'].isoformat()
+        record['start_time'] = record['start_time'].isoformat()
+        record['end_time'] = record['end_time'].isoformat()
+        yield json.dumps(record) + '\n'
+
+def _char_value(c):
+    """ELD check value mapping: 1-9, A-Z and a-z map to their ASCII code minus 48, anything else to 0."""
+    if c.isascii() and (c.isalpha() or c in '123456789'):
+        return ord(c) - 48
+    return 0
+
+def _rotl(value, bits, width):
+    mask = (1 << width) - 1
+    return ((value << bits) | (value >> (width - bits))) & mask
+
+def _check_byte(text, mask):
+    total = sum(_char_value(c) for c in text) & 0xFF
+    return f"{_rotl(total, 3, 8) ^ mask:02X}"
+
+def event_check_value(*fields):
+    """Two-hex-digit event data check value over the event's fields (Appendix A 4.4.5.1)."""
+    return _check_byte(''.join(fields), 0xC3)
+
+def line_check_value(line):
+    """Two-hex-digit line data check value (Appendix A 4.4.5.2)."""
+    return _check_byte(line, 0x96)
+
+def file_check_value(line_checks_sum):
+    """Four-hex-digit file data check value (Appendix A 4.4.5.3)."""
+    return f"{_rotl(line_checks_sum & 0xFFFF, 3, 16) ^ 0x969C:04X}"
+
+def _field(value):
+    """A header value with the field separator removed."""
+    return str(value or '').replace(',', ' ')
+
+def _last_first(driver):
+    first, _, last = _field(driver.name).rpartition(' ')
+    return last, first
+
+def eld_header(driver=None, now=None):
+    """The seven lines of the ELD File Header Segment, without check values."""
+    now = timezone.localtime(now or timezone.now())
+    last, first, username, lat, lon = '', '', '', '', ''
+    if driver is not None:
+        last, first = _last_first(driver)
+        username = str(driver.id)
+        if driver.current_location_coords:
+            lat, lon = (f"{c:.2f}" for c in driver.current_location_coords)
+    offset = -round(now.utcoffset().total_seconds() / 3600)
+    return [
+        # Driver last and first name, ELD username, license issuing state and number
+        f"{last},{first},{username},,",
+        # Co-driver last and first name and ELD username
+        ",,",
+        # CMV power unit number, VIN, trailer numbers
+        ",,",
+        # Carrier USDOT number and name, multiday basis, 24-hour period start, time zone offset from UTC
+        f"{_field(settings.ELD_CARRIER_USDOT)},{_field(settings.ELD_CARRIER_NAME)},{ELD_MULTIDAY_BASIS},000000,{offset:02d}",
+        # Shipping document number, exempt driver configuration (0 = not exempt)
+        ",0",
+        # Current date, time, latitude, longitude, total vehicle miles and engine hours
+        f"{now:%m%d%y},{now:%H%M%S},{lat},{lon},,",
+        # ELD registration ID, ELD identifier, authentication value, output file comment
+        f"{_field(settings.ELD_REGISTRATION_ID)},{_field(settings.ELD_IDENTIFIER)},,",
+    ]
+
+def iter_eld(rows, driver=None, now=None):
+    """
+    ELD output file. Only the segments this app has data for are filled; each
+    log entry becomes a duty-status change event at its start time, recorded
+    by the driver (user 1).
+    """
+    checks = 0
+
+    def line(text):
+        nonlocal checks
+        check = line_check_value(text)
+        checks += int(check, 16)
+        return f"{text},{check}\r\n"
+
+    username = str(driver.id) if driver is not None else ''
+    yield "ELD File Header Segment:\r\n"
+    for text in eld_header(driver, now):
+        yield line(text)
+    yield "User List:\r\n"
+    if driver is not None:
+        # Order number, account type (D = driver), last and first name
+        yield line("1,D,{},{}".format(*_last_first(driver)))
+    yield "CMV List:\r\n"
+    yield "ELD Event List:\r\n"
+    sequence = 0
+    for _id, trip_id, day, status, start, _end, remarks, _grid in rows:
+        code = ELD_STATUS_CODES.get(status)
+        if code is None:
+            continue
+        event_date, event_time = f"{day:%m%d%y}", f"{start:%H%M%S}"
+        # Sequence ID, record status (1 = active), origin (2 = driver), type, code, date, time,
+        # miles, engine hours, lat, lon, distance since last coordinates, CMV and user order numbers,
+        # malfunction and diagnostic indicators
+        event_check = event_check_value('1', str(code), event_date, event_time, str(trip_id), username)
+        yield line(f"{sequence & 0xFFFF:X},1,2,1,{code},{event_date},{event_time},,,,,,{trip_id},1,0,0,{event_check}")
+        sequence += 1
+    for segment in ("ELD Event Annotations or Comments:", "Driver's Certification/Recertification Actions:",
+                    "Malfunctions and Data Diagnostic Events:", "ELD Login/Logout Report:",
+                    "CMV Engine Power-Up and Shut Down Activity:", "Unidentified Driver Profile Records:"):
+        yield f"{segment}\r\n"
+    yield "End of File:\r\n"
+    yield f"{file_check_value(checks)}\r\n"
+
+def _export_driver(trip_ids=None, start_date=None, end_date=None):
+    """The driver of the exported trips if they all have the same one, else None."""
+    logs = LogEntry.objects.matching(trip_ids, start_date, end_date)
+    driver_ids = list(Trip.objects.filter(id__in=logs.values('trip_id'))
+                      .values_list('driver_id', flat=True).distinct()[:2])
+    if len(driver_ids) != 1 or driver_ids[0] is None:
+        return None
+    return Driver.objects.get(id=driver_ids[0])
+
+ITERATORS = {'csv': iter_csv, 'ndjson': iter_ndjson, 'eld': iter_eld}
+
+def stream_history(fmt, trip_ids=None, start_date=None, end_date=None):
+    """Yield the matching log entries as lines of `fmt`."""
+    rows = _rows(trip_ids, start_date, end_date)
+    if fmt == 'eld':
+        return iter_eld(rows, _export_driver(trip_ids, start_date, end_date))
+    return ITERATORS[fmt](rows)
+
+def read_history(fileobj, fmt):
+    """Lazily parse an exported CSV or NDJSON text file into LogEntry field dicts."""
+    if fmt == 'csv':
+        records = csv.DictReader(fileobj)
+    elif fmt == 'ndjson':
+        records = (json.loads(line) for line in fileobj if line.strip())
+    else:
+        raise ValueError(f"Cannot import {fmt} files")
+    for record in records:
+        grid = record.get('grid_positions')
+        if isinstance(grid, str):
+            grid = json.loads(grid) if grid else None
+        yield {
+            'trip_id': int(record['trip_id']),
+            'date': date.fromisoformat(record['date']),
+            'status': record['status'],
+            'start_time': time.fromisoformat(record['start_time']),
+            'end_time': time.fromisoformat(record['end_time']),
+            'remarks': record['remarks'],
+            'grid_positions': grid,
+        }
+
+def import_history(records, chunk_size=CHUNK_SIZE):
+    """
+    Bulk-insert parsed records `chunk_size` at a time, one transaction per
+    chunk. Records of trips that do not exist are skipped. Returns
+    (imported, skipped).
+    """
+    imported = skipped = 0
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return imported, skipped
+        trips = set(Trip.objects.filter(id__in={r['trip_id'] for r in chunk}).values_list('id', flat=True))
+        entries = [LogEntry(**r) for r in chunk if r['trip_id'] in trips]
+        with transaction.atomic():
+            LogEntry.objects.bulk_create(entries, batch_size=chunk_size)
+        imported += len(entries)
+        skipped += len(chunk) - len(entries)
@@ -0,0 +1,170 @@
+"""
+Buffered ingestion of ELD duty-status and GPS events.
+
+Events are parsed from NDJSON batches and appended to a per-process buffer.
+The buffer is written with one `bulk_create` per flush, inside a
+transaction that also advances the affected drivers' HOS clocks in memory
+and saves them with one `bulk_update`. A flush happens when the buffer
+reaches FLUSH_SIZE events or, from a background thread, FLUSH_INTERVAL
+seconds after the oldest buffered event arrived.
+
+If the bulk write fails, the events are written one at a time and only the
+ones the database rejects are dropped. If the database cannot be reached
+at all, the batch goes back into the buffer for the next flush.
+"""
+import atexit
+import json
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import Driver, DriverEvent, LogEntry
+
+FLUSH_SIZE = 5000
+FLUSH_INTERVAL = 1.0
+STATUSES = set(LogEntry.Status.values)
+NUMBER_FIELDS = (('lat', 'lat'), ('lon', 'lon'), ('odometer', 'odometer_miles'))
+
+logger = logging.getLogger(__name__)
+
+class EventError(ValueError):
+    pass
+
+def parse_event(line):
+    """Parse one NDJSON line into DriverEvent field values."""
+    try:
+        data = json.loads(line)
+        driver_id = int(data['driver'])
+        recorded_at = datetime.fromisoformat(data['ts'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise EventError(f"Invalid event: {e}")
+    if timezone.is_naive(recorded_at):
+        recorded_at = timezone.make_aware(recorded_at, dt_timezone.utc)
+
+    kind = data.get('type', DriverEvent.Kind.STATUS if 'status' in data else DriverEvent.Kind.GPS)
+    status = data.get('status', '')
+    if kind == DriverEvent.Kind.STATUS and status not in STATUSES:
+        raise EventError(f"Unknown duty status: {status!r}")
+    if kind not in (DriverEvent.Kind.STATUS, DriverEvent.Kind.GPS):
+        raise EventError(f"Unknown event type: {kind!r}")
+    event = {
+        'driver_id': driver_id,
+        'recorded_at': recorded_at,
+        'kind': kind,
+        'duty_status': status,
+    }
+    for key, field in NUMBER_FIELDS:
+        value = data.get(key)
+        if value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise EventError(f"{key} must be a number, got {value!r}")
+            if not math.isfinite(value):
+                raise EventError(f"{key} must be finite")
+        event[field] = value
+    return event
+
+class EventBuffer:
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._events = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        # Serializes flushes so clock updates apply in order
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def add(self, events):
+        """Buffer parsed events, flushing if the buffer is full."""
+        with self._lock:
+            if not self._events:
+                self._oldest = time.monotonic()
+            self._events.extend(events)
+            full = len(self._events) >= self.flush_size
+        if full:
+            self.flush()
+        else:
+            self._ensure_timer()
+
+    def _ensure_timer(self):
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Thread(target=self._run, daemon=True)
+            self._timer.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._events:
+                    self._timer = None
+                    break
+                wait = self._oldest + self.flush_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush ELD events; retrying")
+                time.sleep(self.flush_interval)
+        connection.close()
+
+    def _requeue(self, events):
+        with self._lock:
+            if not self._events:
+                self._oldest = time.monotonic()
+            self._events[:0] = events
+
+    def _create(self, rows):
+        """Insert `rows`, falling back to one insert per row. Returns the rows stored."""
+        try:
+            with transaction.atomic():
+                DriverEvent.objects.bulk_create(rows, batch_size=1000)
+            return rows
+        except (DatabaseError, ValueError, TypeError) as e:
+            logger.warning(f"Bulk insert of {len(rows)} ELD events failed ({e}); inserting one by one")
+        stored = []
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    row.save(force_insert=True)
+                stored.append(row)
+            except (DatabaseError, ValueError, TypeError) as e:
+                logger.warning(f"Dropped ELD event for driver {row.driver_id} at {row.recorded_at}: {e}")
+        return stored
+
+    def flush(self):
+        """Write buffered events and update driver clocks. Returns the count written."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return 0
+            events.sort(key=lambda e: (e['driver_id'], e['recorded_at']))
+            try:
+                with transaction.atomic():
+                    drivers = Driver.objects.select_for_update().in_bulk({e['driver_id'] for e in events})
+                    rows = self._create([DriverEvent(**e) for e in events if e['driver_id'] in drivers])
+                    for row in rows:
+                        driver = drivers[row.driver_id]
+                        if row.kind == DriverEvent.Kind.STATUS:
+                            driver.apply_status(row.duty_status, row.recorded_at)
+                        if row.lat is not None and row.lon is not None:
+                            driver.current_location_coords = [row.lat, row.lon]
+                    Driver.objects.bulk_update(drivers.values(), [
+                        'duty_status', 'status_since', 'driving_hours_used', 'window_started_at',
+                        'cycle_hours', 'current_location_coords',
+                    ])
+            except DatabaseError:
+                self._requeue(events)
+                raise
+            return len(rows)
+
+event_buffer = EventBuffer()
+atexit.register(event_buffer.flush)
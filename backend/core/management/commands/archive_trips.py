@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.archive import archive_trips
+
+class Command(BaseCommand):
+    help = "Move trips older than a cutoff, with their logs and PDFs, into the monthly archive files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help="Archive trips created more than this many days ago")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        counts = archive_trips(before, dry_run=options['dry_run'])
+        for month, count in sorted(counts.items()):
+            self.stdout.write(f"{month}: {count} trips")
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {sum(counts.values())} trips created before {before:%Y-%m-%d}"))
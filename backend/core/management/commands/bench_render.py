@@ -0,0 +1,87 @@
+import gzip
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.geometry import build_route_tiers
+from core.middleware import BROTLI_QUALITY, GZIP_LEVEL, brotli
+from core.renderers import FastJSONRenderer
+from core.services import (calculate_grid_positions, compute_daily_totals, locate_log_entries, make_stop,
+                           plan_hos_schedule)
+
+ORIGIN = ('Los Angeles, CA', (34.0522, -118.2437))
+PICKUP = ('Albuquerque, NM', (35.0844, -106.6504))
+DROPOFF = ('New York, NY', (40.7128, -74.0060))
+
+def cross_country_payload(points):
+    """A TripView-shaped result for a Los Angeles - New York trip with `points` route coordinates."""
+    legs = [670, 2010]
+    waypoints = [ORIGIN[1], PICKUP[1], DROPOFF[1]]
+    coords = []
+    per_leg = points // 2
+    for (a_lat, a_lon), (b_lat, b_lon), miles in zip(waypoints, waypoints[1:], legs):
+        for i in range(per_leg):
+            f = i / per_leg
+            # Wiggle like a real road so the coordinates do not compress unrealistically well
+            coords.append((round(a_lat + (b_lat - a_lat) * f + 0.003 * ((i * 7919) % 13 - 6), 5),
+                           round(a_lon + (b_lon - a_lon) * f + 0.003 * ((i * 104729) % 11 - 5), 5)))
+    coords.append(DROPOFF[1])
+
+    stops = [make_stop(PICKUP[0], PICKUP[1], 'pickup'), make_stop(DROPOFF[0], DROPOFF[1], 'dropoff')]
+    plan = plan_hos_schedule(legs, stops, ORIGIN[0], 20, start_time=datetime(2025, 3, 3, 6),
+                             rolling_window=[5.0] * 7 + [0.0])
+    logs = plan['logs']
+    locate_log_entries(logs, coords, sum(legs))
+    for log in logs:
+        log['grid_positions'] = calculate_grid_positions(log)
+    for day, day_data in compute_daily_totals(logs).items():
+        logs.append({'date': day, 'status': 'Total', 'start_time': None, 'end_time': None,
+                     'remarks': f"Daily Total - Driving: {day_data['totals']['driving']:.1f} hrs", 'miles': 0})
+    return {
+        'route': [ORIGIN[0], PICKUP[0], DROPOFF[0]],
+        'route_coordinates': coords,
+        'route_tiers': build_route_tiers(coords),
+        'logs': logs,
+        'total_distance': sum(legs),
+        'hos_compliant': True,
+        'violations': [],
+        'pdf_url': 'logs/trip_1_2025-03-03.pdf',
+    }
+
+class Command(BaseCommand):
+    help = "Measure JSON rendering time and response size of a cross-country trip result."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=30000, help="Route coordinates in the payload")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        payload = cross_country_payload(options['points'])
+        self.stdout.write(f"{len(payload['route_coordinates'])} route points, {len(payload['logs'])} log entries")
+
+        bodies = {}
+        for name, renderer in (('DRF JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+            start = time.process_time()
+            for _ in range(options['repeat']):
+                body = renderer.render(payload)
+            ms = (time.process_time() - start) / options['repeat'] * 1000
+            bodies[name] = body
+            self.stdout.write(f"{name:18} {ms:8.1f} ms CPU  {len(body):>10,} bytes")
+
+        body = bodies['FastJSONRenderer']
+        encoders = [
+            ('gzip -6 (Django)', lambda b: gzip.compress(b, compresslevel=6, mtime=0)),
+            (f'gzip -{GZIP_LEVEL}', lambda b: gzip.compress(b, compresslevel=GZIP_LEVEL, mtime=0)),
+        ]
+        if brotli is not None:
+            encoders.append((f'brotli q{BROTLI_QUALITY}', lambda b: brotli.compress(b, quality=BROTLI_QUALITY)))
+        else:
+            self.stdout.write("brotli is not installed; skipping it")
+        for name, compress in encoders:
+            start = time.process_time()
+            for _ in range(options['repeat']):
+                compressed = compress(body)
+            ms = (time.process_time() - start) / options['repeat'] * 1000
+            self.stdout.write(f"{name:18} {ms:8.1f} ms CPU  {len(compressed):>10,} bytes on the wire")
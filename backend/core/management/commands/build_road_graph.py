@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.roadgraph import RoadGraphError, build_road_graph
+
+class Command(BaseCommand):
+    help = "Convert an OSM XML extract into the memory-mapped road graph used for offline routing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file', help="OSM XML extract (.osm)")
+        parser.add_argument('output', help="Road graph file to write (point ROAD_GRAPH_PATH at it)")
+        parser.add_argument('--cell-size', type=float, default=0.05, help="Snapping grid cell size in degrees")
+
+    def handle(self, *args, **options):
+        try:
+            nodes, edges = build_road_graph(options['osm_file'], options['output'], options['cell_size'])
+        except RoadGraphError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']} ({nodes} nodes, {edges} edges)"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.compact import store_days
+from core.models import LogEntry, Trip
+
+class Command(BaseCommand):
+    help = "Build the compact per-day log encoding (LogDay rows) from existing log entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trip', type=int, action='append', dest='trips', help="Only this trip (repeatable)")
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.order_by('id')
+        if options['trips']:
+            trips = trips.filter(id__in=options['trips'])
+        trip_count = day_count = 0
+        for trip in trips.iterator():
+            rows = (LogEntry.objects.filter(trip=trip)
+                    .order_by('date', 'start_time')
+                    .values('date', 'status', 'start_time', 'end_time', 'remarks'))
+            day_count += store_days(trip, rows)
+            trip_count += 1
+        self.stdout.write(self.style.SUCCESS(f"Compacted {day_count} log days across {trip_count} trips"))
@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import PAGES_PER_PART, export_logs_pdf
+
+class Command(BaseCommand):
+    help = "Render the logs of several trips and/or a date range into a single PDF file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the PDF file to write")
+        parser.add_argument('--trips', nargs='+', type=int, help="Trip ids to export (default: all)")
+        parser.add_argument('--start', type=date.fromisoformat, help="First log date, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last log date, YYYY-MM-DD")
+        parser.add_argument('--workers', type=int, default=1, help="Processes rendering parts in parallel")
+        parser.add_argument('--pages-per-part', type=int, default=PAGES_PER_PART)
+
+    def handle(self, *args, **options):
+        with open(options['output'], 'wb') as f:
+            parts = export_logs_pdf(
+                f,
+                trip_ids=options['trips'],
+                start_date=options['start'],
+                end_date=options['end'],
+                workers=options['workers'],
+                pages_per_part=options['pages_per_part'],
+            )
+        if not parts:
+            raise CommandError("No logs matched the given trips and dates.")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']} ({parts} part(s))"))
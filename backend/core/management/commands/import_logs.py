@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.history import CHUNK_SIZE, import_history, read_history
+
+class Command(BaseCommand):
+    help = "Import log entries from a CSV or NDJSON file written by the log history export."
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="Path of the .csv or .ndjson file to read")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="File format (default: from the extension)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows inserted per transaction")
+
+    def handle(self, *args, **options):
+        path = options['input']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in ('csv', 'ndjson'):
+            raise CommandError("Specify --format csv or ndjson")
+        with open(path, newline='', encoding='utf-8') as f:
+            try:
+                imported, skipped = import_history(read_history(f, fmt), options['chunk_size'])
+            except (KeyError, ValueError) as e:
+                raise CommandError(f"Could not parse {path}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} log entries ({skipped} skipped, unknown trip)"))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_token
+
+class Command(BaseCommand):
+    help = "Print a token that makes a request profiled when sent in the X-Profile header."
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
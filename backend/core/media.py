@@ -0,0 +1,134 @@
+"""
+Serving of generated media (log PDFs).
+
+Files are handed off to the front web server when one is configured:
+nginx with `X-Accel-Redirect` (MEDIA_ACCEL_REDIRECT, the internal location
+prefix) or Apache/lighttpd with `X-Sendfile` (MEDIA_SENDFILE), so no worker
+streams the bytes. Otherwise they are served by Django with support for
+conditional requests (ETag / Last-Modified) and single byte ranges. Names
+carrying a content hash (see `hashed_name`) never change content and are
+cached for a year as immutable.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 60*60*24*365
+MUTABLE_MAX_AGE = 60*60
+BLOCK_SIZE = 64 * 1024
+
+re_hashed = re.compile(rf'_([0-9a-f]{{{HASH_LENGTH}}})\.\w+$')
+re_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def hashed_name(name, content):
+    """`name` with a short hash of `content` before the extension."""
+    root, ext = os.path.splitext(name)
+    return f"{root}_{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+class _RangeFile:
+    """Read-only view of `length` bytes of a file from `start`."""
+
+    def __init__(self, f, start, length):
+        self._f = f
+        self._left = length
+        f.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single-range header, None to serve everything, or False if unsatisfiable."""
+    match = re_range.match(header.replace(' ', ''))
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+def _cache_headers(response, path, etag, mtime):
+    hashed = re_hashed.search(path)
+    if hashed:
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={MUTABLE_MAX_AGE}'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    return response
+
+def serve_media(request, path):
+    """A file under MEDIA_ROOT, sent by the web server if configured."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found")
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+
+    hashed = re_hashed.search(path)
+    etag = quote_etag(hashed.group(1) if hashed else f'{st.st_mtime_ns:x}-{st.st_size:x}')
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if not_modified is not None:
+        return _cache_headers(not_modified, path, etag, st.st_mtime)
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '')
+    if accel_prefix or getattr(settings, 'MEDIA_SENDFILE', False):
+        # The web server sends the file, including ranges
+        response = HttpResponse(content_type=content_type)
+        if accel_prefix:
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + path.lstrip('/')
+        else:
+            response['X-Sendfile'] = full_path
+        return _cache_headers(response, path, etag, st.st_mtime)
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META:
+        # A range only applies if the client's copy is still current
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range == etag:
+            byte_range = _byte_range(request.META['HTTP_RANGE'], st.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{st.st_size}'
+        return response
+
+    f = open(full_path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(_RangeFile(f, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(f, content_type=content_type)
+    response.block_size = BLOCK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    return _cache_headers(response, path, etag, st.st_mtime)
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_trip_current_location_coords_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('location', models.CharField(max_length=255)),
+                ('location_coords', models.JSONField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('pickup', 'Pickup'), ('dropoff', 'Dropoff'), ('stop', 'Stop')], default='stop', max_length=10)),
+                ('dwell_minutes', models.PositiveIntegerField(default=60)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='core.trip')),
+            ],
+            options={
+                'ordering': ['sequence'],
+                'constraints': [models.UniqueConstraint(fields=('trip', 'sequence'), name='unique_trip_stop_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tripstop'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Driver',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('current_location', models.CharField(max_length=255)),
+                ('current_location_coords', models.JSONField(blank=True, null=True)),
+                ('duty_status', models.CharField(choices=[('Off-Duty', 'Off-Duty'), ('Sleeper Berth', 'Sleeper Berth'), ('Driving', 'Driving'), ('On-Duty', 'On-Duty')], default='Off-Duty', max_length=20)),
+                ('status_since', models.DateTimeField(default=django.utils.timezone.now)),
+                ('driving_hours_used', models.FloatField(default=0)),
+                ('window_started_at', models.DateTimeField(blank=True, null=True)),
+                ('cycle_hours', models.FloatField(default=0)),
+                ('use_sleeper_berth', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='driver',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trips', to='core.driver'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_driver'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('status', 'Duty status'), ('gps', 'GPS')], max_length=10)),
+                ('duty_status', models.CharField(blank=True, choices=[('Off-Duty', 'Off-Duty'), ('Sleeper Berth', 'Sleeper Berth'), ('Driving', 'Driving'), ('On-Duty', 'On-Duty')], max_length=20)),
+                ('lat', models.FloatField(blank=True, null=True)),
+                ('lon', models.FloatField(blank=True, null=True)),
+                ('odometer_miles', models.FloatField(blank=True, null=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='core.driver')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['driver', 'recorded_at'], name='core_driver_driver__705586_idx')],
+            },
+        ),
+    ]
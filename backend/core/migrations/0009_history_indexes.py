@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_driverevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['trip', 'date', 'start_time'], name='logentry_trip_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['-created_at', '-id'], name='trip_recent_idx'),
+        ),
+    ]
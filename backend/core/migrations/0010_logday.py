@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('runs', models.BinaryField()),
+                ('driver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.driver')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_days', to='core.trip')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LogDayRemark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.PositiveSmallIntegerField()),
+                ('text', models.TextField()),
+                ('day', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='remarks', to='core.logday')),
+            ],
+            options={
+                'ordering': ['minute'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='logday',
+            constraint=models.UniqueConstraint(fields=('trip', 'date'), name='unique_trip_log_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='logdayremark',
+            constraint=models.UniqueConstraint(fields=('day', 'minute'), name='unique_log_day_remark'),
+        ),
+    ]
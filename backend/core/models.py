@@ -1,4 +1,6 @@
+from datetime import timedelta
 from django.db import models
+from django.utils import timezone
 
 class Trip(models.Model):
     current_location = models.CharField(max_length=255)
@@ -9,8 +11,24 @@ class Trip(models.Model):
     dropoff_location_coords = models.JSONField(null=True, blank=True)
     current_cycle_hours = models.FloatField(default=0)
     use_sleeper_berth = models.BooleanField(default=False)
+    driver = models.ForeignKey('Driver', null=True, blank=True, on_delete=models.SET_NULL, related_name='trips')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['-created_at', '-id'], name='trip_recent_idx')]
+
+class LogEntryQuerySet(models.QuerySet):
+    def matching(self, trip_ids=None, start_date=None, end_date=None):
+        """Entries of `trip_ids` dated from `start_date` to `end_date`, each optional."""
+        qs = self
+        if trip_ids:
+            qs = qs.filter(trip_id__in=trip_ids)
+        if start_date:
+            qs = qs.filter(date__gte=start_date)
+        if end_date:
+            qs = qs.filter(date__lte=end_date)
+        return qs
+
 class LogEntry(models.Model):
     class Status(models.TextChoices):
         OFF_DUTY = 'Off-Duty', 'Off-Duty'
@@ -25,3 +43,123 @@ class LogEntry(models.Model):
     end_time = models.TimeField()
     remarks = models.TextField()
     grid_positions = models.JSONField(null=True, blank=True)  # For grid drawing
+
+    objects = LogEntryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['trip', 'date', 'start_time'], name='logentry_trip_day_idx')]
+
+class TripStop(models.Model):
+    """An ordered waypoint of a trip after the current location, with its on-duty dwell."""
+    class Kind(models.TextChoices):
+        PICKUP = 'pickup', 'Pickup'
+        DROPOFF = 'dropoff', 'Dropoff'
+        STOP = 'stop', 'Stop'
+
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='stops')
+    sequence = models.PositiveIntegerField()
+    location = models.CharField(max_length=255)
+    location_coords = models.JSONField(null=True, blank=True)
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.STOP)
+    dwell_minutes = models.PositiveIntegerField(default=60)
+
+    class Meta:
+        ordering = ['sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'sequence'], name='unique_trip_stop_sequence'),
+        ]
+
+class Driver(models.Model):
+    """A fleet driver and their live HOS clocks, as of `status_since`."""
+    name = models.CharField(max_length=255)
+    current_location = models.CharField(max_length=255)
+    current_location_coords = models.JSONField(null=True, blank=True)
+    duty_status = models.CharField(max_length=20, choices=LogEntry.Status.choices, default=LogEntry.Status.OFF_DUTY)
+    status_since = models.DateTimeField(default=timezone.now)
+    driving_hours_used = models.FloatField(default=0)  # toward the 11-hour limit
+    window_started_at = models.DateTimeField(null=True, blank=True)  # start of the 14-hour window
+    cycle_hours = models.FloatField(default=0)  # on-duty hours in the last 8 days
+    use_sleeper_berth = models.BooleanField(default=False)
+
+    def apply_status(self, status, at):
+        """
+        Advance the clocks to `at` and switch to duty `status`. Time spent in
+        the outgoing status counts toward the limits; 10 hours of rest reset
+        the daily clocks and 34 hours the cycle.
+        """
+        hours = (at - self.status_since).total_seconds() / 3600
+        if hours < 0:
+            return
+        if self.duty_status == LogEntry.Status.DRIVING:
+            self.driving_hours_used += hours
+            self.cycle_hours += hours
+        elif self.duty_status == LogEntry.Status.ON_DUTY:
+            self.cycle_hours += hours
+        elif hours >= 10:
+            self.driving_hours_used = 0
+            self.window_started_at = None
+            if hours >= 34:
+                self.cycle_hours = 0
+        if status in (LogEntry.Status.DRIVING, LogEntry.Status.ON_DUTY) and self.window_started_at is None:
+            self.window_started_at = at
+        self.duty_status = status
+        self.status_since = at
+
+    def clocks(self, now=None):
+        """
+        (driving hours used, 14-hour window hours used) at `now`. Ten
+        consecutive hours off duty or in the berth reset both.
+        """
+        now = now or timezone.now()
+        resting = self.duty_status in (LogEntry.Status.OFF_DUTY, LogEntry.Status.SLEEPER_BERTH)
+        if resting and now - self.status_since >= timedelta(hours=10):
+            return 0.0, 0.0
+        driving = self.driving_hours_used
+        if self.duty_status == LogEntry.Status.DRIVING:
+            driving += max(0.0, (now - self.status_since).total_seconds() / 3600)
+        window = (now - self.window_started_at).total_seconds() / 3600 if self.window_started_at else 0.0
+        return min(driving, 11.0), min(window, 14.0)
+
+class DriverEvent(models.Model):
+    """A duty-status change or GPS fix reported by a truck's ELD."""
+    class Kind(models.TextChoices):
+        STATUS = 'status', 'Duty status'
+        GPS = 'gps', 'GPS'
+
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='events')
+    recorded_at = models.DateTimeField()
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    duty_status = models.CharField(max_length=20, choices=LogEntry.Status.choices, blank=True)
+    lat = models.FloatField(null=True, blank=True)
+    lon = models.FloatField(null=True, blank=True)
+    odometer_miles = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['driver', 'recorded_at'])]
+
+class LogDay(models.Model):
+    """
+    A trip's duty statuses for one day as packed runs (see core.compact),
+    an alternative to that day's LogEntry rows.
+    """
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='log_days')
+    driver = models.ForeignKey(Driver, null=True, blank=True, on_delete=models.SET_NULL)
+    date = models.DateField()
+    runs = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'date'], name='unique_trip_log_day'),
+        ]
+
+class LogDayRemark(models.Model):
+    """Remarks of a LogDay entry, keyed by the entry's start minute."""
+    day = models.ForeignKey(LogDay, on_delete=models.CASCADE, related_name='remarks')
+    minute = models.PositiveSmallIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        ordering = ['minute']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'minute'], name='unique_log_day_remark'),
+        ]
@@ -0,0 +1,233 @@
+"""
+Stop-order optimization for multi-drop loads.
+
+Candidate orders are generated on a pairwise distance matrix (one routing
+call): exact Held-Karp dynamic programming for up to DP_MAX_STOPS stops, and
+2-opt / or-opt local search from several starts beyond that. Every candidate
+is then run through the HOS scheduler, which inserts breaks and restarts, and
+the best by the requested objective wins. Pickup stops are always visited
+before any other stop.
+"""
+import math
+import random
+from datetime import datetime
+
+from .procpool import get_pool
+from .routing import router
+from .services import plan_hos_schedule, simulated_cycle_history
+
+DP_MAX_STOPS = 10
+# Candidate evaluations below this count run inline; sending them to the
+# process pool would cost more than it saves
+POOL_MIN_CANDIDATES = 16
+OBJECTIVES = ('arrival', 'on_duty')
+
+def distance_matrix(points):
+    """Road distances (miles) between all points, geodesic where routing fails."""
+    from geopy.distance import geodesic
+    table = router.get_distance_matrix(points)
+    n = len(points)
+    return [
+        [
+            table[i][j] if table and table[i][j] is not None else geodesic(points[i], points[j]).miles
+            for j in range(n)
+        ]
+        for i in range(n)
+    ]
+
+def _path_cost(order, matrix):
+    cost, prev = 0.0, 0
+    for j in order:
+        cost += matrix[prev][j]
+        prev = j
+    return cost
+
+def _valid(order, pickups):
+    """True if every pickup precedes every other stop."""
+    seen_other = False
+    for j in order:
+        if j in pickups:
+            if seen_other:
+                return False
+        else:
+            seen_other = True
+    return True
+
+def held_karp(matrix, n, pickups):
+    """
+    Exact open-path DP from node 0 over stops 1..n.
+
+    Returns the cheapest valid order ending at each stop, cheapest first.
+    """
+    full = (1 << n) - 1
+    pickup_mask = sum(1 << (j - 1) for j in pickups)
+    other_mask = full & ~pickup_mask
+    cost = {}
+    parent = {}
+    for j in range(1, n + 1):
+        if j in pickups or not pickup_mask:
+            cost[(1 << (j - 1), j)] = matrix[0][j]
+            parent[(1 << (j - 1), j)] = None
+
+    for mask in range(1, full + 1):
+        for last in range(1, n + 1):
+            c = cost.get((mask, last))
+            if c is None:
+                continue
+            pickups_done = (mask & pickup_mask) == pickup_mask
+            row = matrix[last]
+            for j in range(1, n + 1):
+                bit = 1 << (j - 1)
+                if mask & bit:
+                    continue
+                # Pickups first: a pickup cannot follow a delivery, and a
+                # delivery cannot start until every pickup is done
+                if bit & pickup_mask:
+                    if mask & other_mask:
+                        continue
+                elif not pickups_done:
+                    continue
+                key = (mask | bit, j)
+                nc = c + row[j]
+                if nc < cost.get(key, math.inf):
+                    cost[key] = nc
+                    parent[key] = last
+
+    orders = []
+    for last in range(1, n + 1):
+        if (full, last) not in cost:
+            continue
+        order, mask, j = [], full, last
+        while j is not None:
+            order.append(j)
+            prev = parent[(mask, j)]
+            mask &= ~(1 << (j - 1))
+            j = prev
+        order.reverse()
+        orders.append((cost[(full, last)], order))
+    orders.sort()
+    return [order for _, order in orders]
+
+def _improve(order, matrix, pickups):
+    """Apply 2-opt reversals and or-opt segment moves until no move improves."""
+    best = _path_cost(order, matrix)
+    improved = True
+    while improved:
+        improved = False
+        n = len(order)
+        # 2-opt: reverse order[i:k+1]
+        for i in range(n - 1):
+            for k in range(i + 1, n):
+                cand = order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+                c = _path_cost(cand, matrix)
+                if c < best - 1e-9 and _valid(cand, pickups):
+                    order, best, improved = cand, c, True
+        # or-opt: move a segment of 1-3 stops elsewhere
+        for size in (1, 2, 3):
+            for i in range(n - size + 1):
+                segment = order[i:i + size]
+                rest = order[:i] + order[i + size:]
+                for k in range(len(rest) + 1):
+                    if k == i:
+                        continue
+                    cand = rest[:k] + segment + rest[k:]
+                    c = _path_cost(cand, matrix)
+                    if c < best - 1e-9 and _valid(cand, pickups):
+                        order, best, improved = cand, c, True
+                        break
+                else:
+                    continue
+                break
+    return order
+
+def local_search(matrix, n, pickups, restarts, seed=0):
+    """Distinct locally optimal orders from a nearest-neighbour start and random restarts."""
+    rng = random.Random(seed)
+    starts = []
+
+    # Nearest neighbour, respecting pickups-first
+    remaining, order, prev = set(range(1, n + 1)), [], 0
+    while remaining:
+        pool = (remaining & pickups) or remaining
+        j = min(pool, key=lambda j: matrix[prev][j])
+        order.append(j)
+        remaining.discard(j)
+        prev = j
+    starts.append(order)
+
+    for _ in range(restarts):
+        first = [j for j in range(1, n + 1) if j in pickups]
+        rest = [j for j in range(1, n + 1) if j not in pickups]
+        rng.shuffle(first)
+        rng.shuffle(rest)
+        starts.append(first + rest)
+
+    seen, orders = set(), []
+    for start in starts:
+        order = tuple(_improve(start, matrix, pickups))
+        if order not in seen:
+            seen.add(order)
+            orders.append(list(order))
+    orders.sort(key=lambda o: _path_cost(o, matrix))
+    return orders
+
+def _evaluate(args):
+    order, legs, stops, origin, cycle_hours, use_sleeper_berth, start_time, rolling_window = args
+    plan = plan_hos_schedule(legs, [stops[j - 1] for j in order], origin, cycle_hours,
+                             use_sleeper_berth=use_sleeper_berth, start_time=start_time,
+                             rolling_window=rolling_window)
+    on_duty = 0.0
+    for e in plan['logs']:
+        if e['status'] in ('Driving', 'On-Duty'):
+            h1, m1, s1 = map(int, e['start_time'].split(':'))
+            h2, m2, s2 = map(int, e['end_time'].split(':'))
+            on_duty += (h2*60 + m2 + s2/60) - (h1*60 + m1 + s1/60)
+    return plan['finish'], on_duty
+
+def optimize_stop_order(origin, origin_coords, stops, cycle_hours=0, use_sleeper_berth=False,
+                        objective='arrival', start_time=None, workers=None):
+    """
+    Find the stop order minimizing `objective` ('arrival' time or total
+    'on_duty' minutes) under the HOS scheduler.
+
+    `stops` are dicts as returned by services.trip_stops(). Returns a dict with
+    the best `order` (indexes into `stops`), its `finish`, `on_duty_minutes`
+    and `distance`, plus the `method` and number of `evaluated` candidates.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}")
+    n = len(stops)
+    matrix = distance_matrix([origin_coords] + [s['coords'] for s in stops])
+    pickups = {j for j in range(1, n + 1) if stops[j - 1]['kind'] == 'pickup'}
+
+    if n <= DP_MAX_STOPS:
+        method, candidates = 'dp', held_karp(matrix, n, pickups)
+    else:
+        method, candidates = 'local_search', local_search(matrix, n, pickups, restarts=2 * n)
+
+    # Every candidate sees the same start time and cycle history
+    if start_time is None:
+        start_time = datetime.now().replace(hour=6, minute=0, second=0, microsecond=0)
+    rolling_window = simulated_cycle_history(cycle_hours)
+    jobs = []
+    for order in candidates:
+        legs = [matrix[a][b] for a, b in zip([0] + order, order)]
+        jobs.append((order, legs, stops, origin, cycle_hours, use_sleeper_berth, start_time, rolling_window))
+
+    if len(jobs) >= POOL_MIN_CANDIDATES and workers != 1:
+        results = list(get_pool(workers).map(_evaluate, jobs, chunksize=4))
+    else:
+        results = [_evaluate(job) for job in jobs]
+
+    key = (lambda r: (r[0], r[1])) if objective == 'arrival' else (lambda r: (r[1], r[0]))
+    best = min(range(len(jobs)), key=lambda i: key(results[i]))
+    finish, on_duty = results[best]
+    order = candidates[best]
+    return {
+        'order': [j - 1 for j in order],
+        'finish': finish,
+        'on_duty_minutes': round(on_duty),
+        'distance': _path_cost(order, matrix),
+        'method': method,
+        'evaluated': len(jobs),
+    }
@@ -0,0 +1,90 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the whole ordering key.
+
+    DRF's CursorPagination seeks on the first ordering field and skips the
+    rows sharing its value by an offset, which loses rows when paging back
+    through many equal values (a day's log entries). Here the cursor holds
+    every ordering field of the row at the page edge, and a page is the
+    rows after it in key order: a range read of an index on that key.
+    """
+    def _position(self, row):
+        values = (getattr(row, field.lstrip('-')) for field in self.ordering)
+        return json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+
+    def _after(self, position, ordering):
+        """Rows past `position` in `ordering`: (a > x) or (a = x and (b > y or ...))."""
+        values = json.loads(position)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError(position)
+        condition = None
+        for field, value in reversed(list(zip(ordering, values))):
+            name = field.lstrip('-')
+            past = Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": value})
+            condition = past if condition is None else past | (Q(**{name: value}) & condition)
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        ordering = [_flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        try:
+            if self.cursor and self.cursor.position is not None:
+                queryset = queryset.filter(self._after(self.cursor.position, ordering))
+            rows = list(queryset[:self.page_size + 1])
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, self.cursor is not None
+        if not self.page:
+            self.has_next = self.has_previous = False
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+class TripCursorPagination(KeysetCursorPagination):
+    """Most recent trips first, seeking on (created_at, id) via trip_recent_idx."""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+class LogCursorPagination(KeysetCursorPagination):
+    """A trip's logs in time order, seeking on (date, start_time, id) via logentry_trip_day_idx."""
+    ordering = ('date', 'start_time', 'id')
+    page_size = 200
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,35 @@
+"""
+Work done once in the gunicorn master, before workers are forked.
+
+With `preload_app` the master imports the app; `warm` then also imports the
+modules a trip request needs (which the app itself only imports lazily) and
+builds the read-only indexes (truck stops, offline road graph). Workers
+inherit all of it copy-on-write instead of each loading it on its first
+request. `gc.freeze()` moves the preloaded objects out of the collector's
+reach, so collections in the workers do not touch (and copy) their pages.
+"""
+import gc
+import importlib
+
+from django.db import connections
+
+# Imported lazily by the app; loaded here so the pages are shared
+PRELOAD_MODULES = (
+    'reportlab.pdfgen.canvas',
+    'reportlab.lib.colors',
+    'geopy.distance',
+    'polyline',
+    'requests',
+)
+
+def warm():
+    from .routing import get_local_router
+    from .truckstops import get_truck_stop_index
+
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    get_truck_stop_index()
+    get_local_router()
+    # Connections must not be shared across the fork
+    connections.close_all()
+    gc.freeze()
@@ -0,0 +1,36 @@
+"""
+The process pool for CPU-bound planning work (stop-order candidates, fleet
+pair evaluations, export parts).
+
+There is one pool per process, created on first use with a fixed size
+(CPU_POOL_SIZE, or the size given by the first caller), so concurrent
+requests queue on the same workers instead of each starting their own.
+Workers are started with the 'spawn' method: forking a web worker that runs
+request threads could copy a lock another thread holds and deadlock the
+child. Each spawned worker runs django.setup() once.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+_pool = None
+_lock = threading.Lock()
+
+def _init_worker():
+    import django
+    django.setup()
+
+def get_pool(max_workers=None):
+    """The shared pool; `max_workers` only applies if this call creates it."""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=max_workers or settings.CPU_POOL_SIZE,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+    return _pool
@@ -0,0 +1,146 @@
+"""
+On-demand request profiling.
+
+A request is profiled with cProfile when it carries an `X-Profile` header
+holding a token from `python manage.py profile_token` (signed with
+SECRET_KEY, valid for PROFILE_TOKEN_MAX_AGE), or at random for a fraction
+PROFILE_SAMPLE_RATE of requests. Each profile is written to PROFILE_DIR as a
+`.prof` file named after the time, method, URL name and duration; the
+oldest are deleted once the directory holds more than PROFILE_MAX_BYTES.
+Staff users list them at `/api/profiles/`.
+
+Only the request thread is profiled; work handed to thread pools (such as
+concurrent geocoding) shows up as time spent waiting on it. Requests that
+are not profiled pay for one header lookup (and a random draw when
+sampling is on). Profiling is off unless PROFILING=True; when off the
+middleware is left out entirely.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+TOKEN_SALT = 'core.profiling'
+TOP_FUNCTIONS = 60
+
+logger = logging.getLogger(__name__)
+
+re_report = re.compile(r'^[\w.-]+\.prof$')
+_prune_lock = threading.Lock()
+
+def make_token():
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+def _valid_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+def _prune(directory, max_bytes):
+    """Delete the oldest reports until the directory fits in `max_bytes`."""
+    with _prune_lock:
+        reports = []
+        for entry in os.scandir(directory):
+            if re_report.match(entry.name):
+                st = entry.stat()
+                reports.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in reports)
+        # Always keep the newest report
+        for _, size, path in sorted(reports)[:-1]:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def save_report(profiler, request, elapsed):
+    """Write `profiler`'s stats to PROFILE_DIR and return the report name."""
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    match = request.resolver_match
+    route = match.url_name if match and match.url_name else 'unresolved'
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    name = f"{stamp}_{request.method}_{route}_{int(elapsed * 1000)}ms.prof"
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        profiler.dump_stats(tmp)
+        os.replace(tmp, os.path.join(directory, name))
+    except BaseException:
+        os.remove(tmp)
+        raise
+    _prune(directory, settings.PROFILE_MAX_BYTES)
+    return name
+
+def list_reports():
+    """Stored reports, newest first."""
+    directory = settings.PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    reports = []
+    for entry in os.scandir(directory):
+        if re_report.match(entry.name):
+            st = entry.stat()
+            reports.append({
+                'name': entry.name,
+                'size': st.st_size,
+                'created': datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat(),
+            })
+    return sorted(reports, key=lambda r: r['name'], reverse=True)
+
+def report_path(name):
+    """Full path of a stored report, or None if there is none by that name."""
+    if not re_report.match(name):
+        return None
+    path = os.path.join(settings.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+def report_text(path, sort='cumulative'):
+    """The top functions of a report as pstats prints them."""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(TOP_FUNCTIONS)
+    return out.getvalue()
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE
+
+    def _wanted(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        if token:
+            return _valid_token(token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self._wanted(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        try:
+            response['X-Profile-Report'] = save_report(profiler, request, time.perf_counter() - start)
+        except OSError as e:
+            logger.warning(f"Could not save profile: {e}")
+        return response
@@ -0,0 +1,41 @@
+"""
+JSON rendering with orjson.
+
+Trip results carry thousands of route coordinates; orjson encodes them
+several times faster than the standard library encoder DRF uses. Dates,
+times and datetimes are handed to DRF's encoder, so they are formatted
+exactly as JSONRenderer formats them (older DRF versions cut datetimes to
+milliseconds). The output then matches JSONRenderer's except that floats
+in exponent notation are written without the exponent's sign or leading
+zero (1e16, not 1e+16), and NaN and infinity become null where DRF raises.
+Falls back to DRF's JSONRenderer when orjson is not installed, for
+pretty-printed (indented) output and for anything orjson cannot encode.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+LINE_SEPARATORS = (b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+
+class FastJSONRenderer(JSONRenderer):
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Dates and types orjson does not know (Decimal, lazy strings, ...) go through DRF's encoder
+            ret = orjson.dumps(data, default=self._encoder.default,
+                               option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escape U+2028/U+2029 as DRF does, so the output is also valid JavaScript
+        if LINE_SEPARATORS[0] in ret or LINE_SEPARATORS[1] in ret:
+            ret = ret.replace(LINE_SEPARATORS[0], b'\\u2028').replace(LINE_SEPARATORS[1], b'\\u2029')
+        return ret
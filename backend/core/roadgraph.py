@@ -0,0 +1,312 @@
+"""
+Offline routing over a preprocessed road graph.
+
+`build_road_graph` converts an OSM XML extract into a single binary file
+holding the graph as forward and reverse CSR adjacency arrays plus a grid
+index for snapping coordinates to nodes. `RoadGraph` memory-maps that file, so
+loading is instant and workers share the pages, and answers shortest-path
+queries with bidirectional A*.
+
+File layout (little-endian, all sections 4-byte aligned):
+
+    header      HEADER_FORMAT
+    lat, lon    int32[n]   (microdegrees)
+    fwd_indptr  uint32[n+1], fwd_target uint32[m], fwd_time float32[m], fwd_length float32[m]
+    rev_indptr  uint32[n+1], rev_source uint32[m], rev_time float32[m], rev_length float32[m]
+    cell_indptr uint32[rows*cols+1], cell_nodes uint32[n]
+"""
+import heapq
+import math
+import mmap
+import struct
+import xml.etree.ElementTree as ET
+from array import array
+
+from .geometry import build_route_tiers
+
+MAGIC = b'TLRG'
+VERSION = 1
+# magic, version, nodes, edges, max speed (m/s), grid origin lat/lon and cell
+# size (microdegrees), grid rows, grid cols
+HEADER_FORMAT = '<4sIIIdiiiII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_MILE = 1609.34
+
+# Default speeds (km/h) for road classes a truck may use
+HIGHWAY_SPEEDS = {
+    'motorway': 105, 'motorway_link': 60,
+    'trunk': 90, 'trunk_link': 50,
+    'primary': 80, 'primary_link': 50,
+    'secondary': 70, 'secondary_link': 40,
+    'tertiary': 60, 'tertiary_link': 40,
+    'unclassified': 50, 'residential': 40,
+    'living_street': 10, 'service': 20,
+}
+
+# Rings of grid cells searched when snapping a coordinate to the graph
+MAX_SNAP_RINGS = 20
+
+class RoadGraphError(Exception):
+    pass
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+def _parse_maxspeed(value):
+    """Return a maxspeed tag in km/h, or None if it cannot be parsed."""
+    if not value:
+        return None
+    parts = value.strip().split()
+    try:
+        speed = float(parts[0])
+    except ValueError:
+        return None
+    if len(parts) > 1 and parts[1] == 'mph':
+        speed *= 1.609
+    return speed if speed > 0 else None
+
+def _read_ways(osm_path):
+    """First pass: collect drivable ways as (node refs, speed km/h, oneway)."""
+    ways = []
+    for _, elem in ET.iterparse(osm_path, events=('end',)):
+        if elem.tag == 'way':
+            tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+            highway = tags.get('highway')
+            if highway in HIGHWAY_SPEEDS and tags.get('access') not in ('no', 'private'):
+                refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                speed = _parse_maxspeed(tags.get('maxspeed')) or HIGHWAY_SPEEDS[highway]
+                oneway = tags.get('oneway')
+                if oneway == '-1':
+                    refs.reverse()
+                    oneway = 'yes'
+                is_oneway = oneway in ('yes', '1', 'true') or (
+                    highway in ('motorway', 'motorway_link') and oneway != 'no')
+                if len(refs) > 1:
+                    ways.append((refs, speed, is_oneway))
+            elem.clear()
+        elif elem.tag in ('node', 'relation'):
+            elem.clear()
+    return ways
+
+def _read_nodes(osm_path, wanted):
+    """Second pass: coordinates of the nodes referenced by drivable ways."""
+    coords = {}
+    for _, elem in ET.iterparse(osm_path, events=('end',)):
+        if elem.tag == 'node':
+            node_id = int(elem.get('id'))
+            if node_id in wanted:
+                coords[node_id] = (float(elem.get('lat')), float(elem.get('lon')))
+        elem.clear()
+    return coords
+
+def _csr(n, edges, key):
+    """Build (indptr, neighbour, time, length) arrays grouping `edges` by edges[i][key]."""
+    other = 1 - key
+    edges = sorted(edges, key=lambda e: e[key])
+    indptr = array('I', [0] * (n + 1))
+    for e in edges:
+        indptr[e[key] + 1] += 1
+    for i in range(n):
+        indptr[i + 1] += indptr[i]
+    return (indptr, array('I', (e[other] for e in edges)),
+            array('f', (e[2] for e in edges)), array('f', (e[3] for e in edges)))
+
+def build_road_graph(osm_path, out_path, cell_size=0.05):
+    """
+    Convert an OSM XML extract into a road graph file at `out_path`.
+
+    Edge weights are travel times in seconds from the way's maxspeed or its
+    highway class default. Returns (nodes, edges).
+    """
+    ways = _read_ways(osm_path)
+    coords = _read_nodes(osm_path, {ref for refs, _, _ in ways for ref in refs})
+
+    index = {}
+    lat = array('i')
+    lon = array('i')
+    edges = []
+    max_speed = 0.0
+    for refs, speed_kmh, oneway in ways:
+        speed = speed_kmh / 3.6
+        max_speed = max(max_speed, speed)
+        refs = [r for r in refs if r in coords]
+        for a, b in zip(refs, refs[1:]):
+            for ref in (a, b):
+                if ref not in index:
+                    index[ref] = len(lat)
+                    lat.append(round(coords[ref][0] * 1e6))
+                    lon.append(round(coords[ref][1] * 1e6))
+            length = _haversine_m(*coords[a], *coords[b])
+            u, v = index[a], index[b]
+            edges.append((u, v, length / speed, length))
+            if not oneway:
+                edges.append((v, u, length / speed, length))
+
+    n, m = len(lat), len(edges)
+    if not n:
+        raise RoadGraphError(f"No drivable ways found in {osm_path}")
+
+    # Grid index: nodes bucketed by cell, stored as CSR over cells
+    cell = round(cell_size * 1e6)
+    lat0, lon0 = min(lat), min(lon)
+    rows = (max(lat) - lat0) // cell + 1
+    cols = (max(lon) - lon0) // cell + 1
+    cell_of = [((lat[i] - lat0) // cell) * cols + (lon[i] - lon0) // cell for i in range(n)]
+    order = sorted(range(n), key=cell_of.__getitem__)
+    cell_indptr = array('I', [0] * (rows * cols + 1))
+    for c in cell_of:
+        cell_indptr[c + 1] += 1
+    for i in range(rows * cols):
+        cell_indptr[i + 1] += cell_indptr[i]
+
+    with open(out_path, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, n, m, max_speed, lat0, lon0, cell, rows, cols))
+        for arr in (lat, lon, *_csr(n, edges, 0), *_csr(n, edges, 1), cell_indptr, array('I', order)):
+            arr.tofile(f)
+    return n, m
+
+class RoadGraph:
+    """A memory-mapped road graph file answering shortest-path queries."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.n, self.m, self.max_speed,
+         self.lat0, self.lon0, self.cell, self.rows, self.cols) = struct.unpack_from(HEADER_FORMAT, self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise RoadGraphError(f"{path} is not a version {VERSION} road graph")
+
+        view = memoryview(self._mmap)
+        offset = HEADER_SIZE
+
+        def section(fmt, count):
+            nonlocal offset
+            size = count * 4
+            arr = view[offset:offset + size].cast(fmt)
+            offset += size
+            return arr
+
+        n, m = self.n, self.m
+        self.lat = section('i', n)
+        self.lon = section('i', n)
+        self.fwd = (section('I', n + 1), section('I', m), section('f', m), section('f', m))
+        self.rev = (section('I', n + 1), section('I', m), section('f', m), section('f', m))
+        self.cell_indptr = section('I', self.rows * self.cols + 1)
+        self.cell_nodes = section('I', n)
+
+    def coords(self, node):
+        return (self.lat[node] / 1e6, self.lon[node] / 1e6)
+
+    def nearest_node(self, lat, lon):
+        """Snap (lat, lon) to the closest graph node, or None if none is near."""
+        row = (round(lat * 1e6) - self.lat0) // self.cell
+        col = (round(lon * 1e6) - self.lon0) // self.cell
+        best, best_d = None, math.inf
+        for ring in range(MAX_SNAP_RINGS + 1):
+            for r in range(row - ring, row + ring + 1):
+                if not 0 <= r < self.rows:
+                    continue
+                for c in range(col - ring, col + ring + 1):
+                    if not 0 <= c < self.cols or max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    cell = r * self.cols + c
+                    for i in range(self.cell_indptr[cell], self.cell_indptr[cell + 1]):
+                        node = self.cell_nodes[i]
+                        d = _haversine_m(lat, lon, *self.coords(node))
+                        if d < best_d:
+                            best, best_d = node, d
+            # One extra ring catches closer nodes just across a cell boundary
+            if best is not None and ring >= 1:
+                break
+        return best
+
+    def shortest_path(self, source, target):
+        """
+        Bidirectional A* on travel time with the symmetric (average)
+        potential, which keeps both searches consistent.
+
+        Returns (node list, seconds, meters), or None if unreachable.
+        """
+        if source == target:
+            return [source], 0.0, 0.0
+
+        s_lat, s_lon = self.coords(source)
+        t_lat, t_lon = self.coords(target)
+        inv_speed = 1.0 / self.max_speed
+        potentials = {}
+
+        def potential(v):
+            p = potentials.get(v)
+            if p is None:
+                v_lat, v_lon = self.lat[v] / 1e6, self.lon[v] / 1e6
+                p = (_haversine_m(v_lat, v_lon, t_lat, t_lon) - _haversine_m(v_lat, v_lon, s_lat, s_lon)) * inv_speed / 2
+                potentials[v] = p
+            return p
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: None}, {target: None})
+        heaps = ([(potential(source), 0.0, source)], [(-potential(target), 0.0, target)])
+        graphs = (self.fwd, self.rev)
+        signs = (1, -1)
+        best, meet = math.inf, None
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, d, u = heapq.heappop(heaps[side])
+            if d > dist[side][u]:
+                continue
+            indptr, neighbour, time, _ = graphs[side]
+            my_dist, other_dist = dist[side], dist[1 - side]
+            for e in range(indptr[u], indptr[u + 1]):
+                v = neighbour[e]
+                nd = d + time[e]
+                if nd < my_dist.get(v, math.inf):
+                    my_dist[v] = nd
+                    parent[side][v] = (u, e)
+                    heapq.heappush(heaps[side], (nd + signs[side] * potential(v), nd, v))
+                    if v in other_dist and nd + other_dist[v] < best:
+                        best, meet = nd + other_dist[v], v
+
+        if meet is None:
+            return None
+
+        path, meters = [meet], 0.0
+        node = meet
+        while parent[0][node]:
+            node, e = parent[0][node]
+            meters += self.fwd[3][e]
+            path.append(node)
+        path.reverse()
+        node = meet
+        while parent[1][node]:
+            node, e = parent[1][node]
+            meters += self.rev[3][e]
+            path.append(node)
+        return path, best, meters
+
+    def get_route(self, origin, destination):
+        """
+        Same contract as OSRMRouter.get_route: distance in miles, duration in
+        hours and the (lat, lon) geometry, or None if no route was found.
+        """
+        source = self.nearest_node(*origin)
+        target = self.nearest_node(*destination)
+        if source is None or target is None:
+            return None
+        found = self.shortest_path(source, target)
+        if not found:
+            return None
+        path, seconds, meters = found
+        coords = [tuple(origin)] + [self.coords(v) for v in path] + [tuple(destination)]
+        return {
+            "distance": meters / METERS_PER_MILE,
+            "duration": seconds / 3600,
+            "coordinates": coords,
+            "tiers": build_route_tiers(coords),
+        }
@@ -1,11 +1,57 @@
-import requests
-import polyline
-import time
-from django.core.cache import cache
+import hashlib
+import os
+import threading
+from django.conf import settings
+from functools import partial
+from .geometry import build_route_tiers, join_route_tiers
+from . import swrcache
+from .upstream import Upstream
+
+OSRM_MAX_CONCURRENCY = 8
+
+_local_router = None
+_local_router_lock = threading.Lock()
+
+def _points_key(prefix, points):
+    """Short cache key for a list of points (raw keys exceed memcached's limit)."""
+    raw = "_".join(f"{lat}_{lon}" for lat, lon in points)
+    return f"{prefix}_{hashlib.sha1(raw.encode()).hexdigest()}"
+
+def _decode_polyline(geometry):
+    # Imported on first use to keep worker startup light
+    import polyline
+    return polyline.decode(geometry)
+
+def get_local_router():
+    """Return the offline RoadGraph router, or None if no graph is configured."""
+    global _local_router
+    path = getattr(settings, 'ROAD_GRAPH_PATH', None)
+    if _local_router is None and path and os.path.exists(path):
+        # Built once even if several threads ask at the same time
+        with _local_router_lock:
+            if _local_router is None:
+                from .roadgraph import RoadGraph
+                _local_router = RoadGraph(path)
+    return _local_router
 
 class OSRMRouter:
+    """OSRM client; one instance is shared by all threads."""
+
     def __init__(self):
         self.base_url = "https://router.project-osrm.org/route/v1/driving"
+        self.table_url = "https://router.project-osrm.org/table/v1/driving"
+        self.upstream = Upstream("osrm", max_concurrency=OSRM_MAX_CONCURRENCY)
+
+    def _fallback_route(self, origin, destination):
+        """Route on the local road graph when OSRM is unavailable (not cached)."""
+        local = get_local_router()
+        if local is None:
+            return None
+        try:
+            return local.get_route(origin, destination)
+        except Exception as e:
+            print(f"Local routing error: {e}")
+            return None
         
     def get_route(self, origin, destination):
         """
@@ -18,12 +64,16 @@ class OSRMRouter:
         Returns:
             Dictionary with route details including distance, duration, and geometry
         """
-        # Check cache first
+        # Stale entries are served and refreshed in the background; concurrent
+        # misses for the same lane share one upstream request
         cache_key = f"route_{origin[0]}_{origin[1]}_{destination[0]}_{destination[1]}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
+        result = swrcache.get_or_fetch(cache_key, partial(self._fetch_route, origin, destination, cache_key))
+        if result and "tiers" not in result:
+            # Entries cached before tiers were introduced
+            result["tiers"] = build_route_tiers(result["coordinates"])
+        return result
+
+    def _fetch_route(self, origin, destination, cache_key):
         # Format coordinates for OSRM (lon,lat format)
         origin_str = f"{origin[1]},{origin[0]}"
         dest_str = f"{destination[1]},{destination[0]}"
@@ -36,12 +86,12 @@ class OSRMRouter:
         }
         
         try:
-            response = requests.get(url, params=params)
+            response = self.upstream.get(url, params)
             response.raise_for_status()
             data = response.json()
             
             if data["code"] != "Ok" or not data["routes"]:
-                return None
+                return self._fallback_route(origin, destination)
                 
             route = data["routes"][0]
             
@@ -52,7 +102,7 @@ class OSRMRouter:
             duration_hours = route["duration"] / 3600
             
             # Decode the polyline to get coordinates
-            geometry = polyline.decode(route["geometry"])
+            geometry = _decode_polyline(route["geometry"])
             
             # OSRM returns coordinates as [lat, lon]
             route_coords = geometry
@@ -60,32 +110,120 @@ class OSRMRouter:
             result = {
                 "distance": distance_miles,
                 "duration": duration_hours,
-                "coordinates": route_coords
+                "coordinates": route_coords,
+                # Simplified geometries for map display, cached with the route
+                "tiers": build_route_tiers(route_coords)
             }
             
-            # Cache for 24 hours
-            cache.set(cache_key, result, 60*60*24)
+            # Fresh for a day, served stale for a week
+            swrcache.store(cache_key, result)
             
             return result
         except Exception as e:
             print(f"Routing error: {e}")
-            return None
+            return self._fallback_route(origin, destination)
     
     def get_multi_point_route(self, points):
         """
-        Get a route through multiple points.
+        Get a route through multiple points with a single OSRM request.
         
         Args:
             points: List of (lat, lon) tuples
             
         Returns:
-            Dictionary with route details
+            Dictionary with route details and per-leg "legs" (distance in
+            miles, duration in hours), or None if any leg cannot be routed
         """
         if len(points) < 2:
             return None
-            
-        # For multi-point routes, we'll calculate each segment and combine
-        segments = []
+
+        cache_key = _points_key("route", points)
+        return swrcache.get_or_fetch(cache_key, partial(self._fetch_multi_point_route, points, cache_key))
+
+    def _fetch_multi_point_route(self, points, cache_key):
+        coords_str = ";".join(f"{lon},{lat}" for lat, lon in points)
+        url = f"{self.base_url}/{coords_str}"
+        params = {
+            "overview": "full",
+            "geometries": "polyline",
+            "steps": "false"
+        }
+
+        try:
+            response = self.upstream.get(url, params)
+            response.raise_for_status()
+            data = response.json()
+
+            if data["code"] != "Ok" or not data["routes"]:
+                return self._combine_leg_routes(points)
+
+            route = data["routes"][0]
+            route_coords = _decode_polyline(route["geometry"])
+            result = {
+                "distance": route["distance"] / 1609.34,
+                "duration": route["duration"] / 3600,
+                "coordinates": route_coords,
+                "tiers": build_route_tiers(route_coords),
+                "legs": [
+                    {"distance": leg["distance"] / 1609.34, "duration": leg["duration"] / 3600}
+                    for leg in route["legs"]
+                ]
+            }
+
+            # Fresh for a day, served stale for a week
+            swrcache.store(cache_key, result)
+
+            return result
+        except Exception as e:
+            print(f"Routing error: {e}")
+            return self._combine_leg_routes(points)
+
+    def get_distance_matrix(self, points, sources=None, destinations=None):
+        """
+        Pairwise road distances between points with a single OSRM table request.
+
+        Args:
+            points: List of (lat, lon) tuples
+            sources, destinations: Optional indexes into points for the rows
+                and columns (all points by default)
+
+        Returns:
+            List of lists of distances in miles (None where OSRM found no
+            route), or None if the request failed
+        """
+        params = {"annotations": "distance"}
+        if sources is not None:
+            params["sources"] = ";".join(map(str, sources))
+        if destinations is not None:
+            params["destinations"] = ";".join(map(str, destinations))
+        cache_key = _points_key("table", points)
+        if len(params) > 1:
+            cache_key += "_" + hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+        return swrcache.get_or_fetch(cache_key, partial(self._fetch_distance_matrix, points, params, cache_key))
+
+    def _fetch_distance_matrix(self, points, params, cache_key):
+        coords_str = ";".join(f"{lon},{lat}" for lat, lon in points)
+        try:
+            response = self.upstream.get(f"{self.table_url}/{coords_str}", params)
+            response.raise_for_status()
+            data = response.json()
+            if data["code"] != "Ok":
+                return None
+
+            result = [
+                [d / 1609.34 if d is not None else None for d in row]
+                for row in data["distances"]
+            ]
+            # Fresh for a day, served stale for a week
+            swrcache.store(cache_key, result)
+            return result
+        except Exception as e:
+            print(f"Routing error: {e}")
+            return None
+
+    def _combine_leg_routes(self, points):
+        """Route each leg separately (falling back per leg) and join them."""
+        legs = []
         total_distance = 0
         total_duration = 0
         all_coordinates = []
@@ -95,7 +233,7 @@ class OSRMRouter:
             if not route:
                 return None
                 
-            segments.append(route)
+            legs.append(route)
             total_distance += route["distance"]
             total_duration += route["duration"]
             
@@ -109,7 +247,8 @@ class OSRMRouter:
             "distance": total_distance,
             "duration": total_duration,
             "coordinates": all_coordinates,
-            "segments": segments
+            "tiers": join_route_tiers(*(leg["tiers"] for leg in legs)),
+            "legs": [{"distance": leg["distance"], "duration": leg["duration"]} for leg in legs]
         }
 
 # Create a singleton instance
@@ -1,38 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.db import transaction
 from rest_framework import serializers
-from .models import Trip, LogEntry
+from .models import Driver, Trip, TripStop, LogEntry
 from .geocoding import geocoder
 
+MAX_TRIP_STOPS = 25
+MAX_FLEET_LOADS = 500
+
+class TripStopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TripStop
+        fields = ['location', 'location_coords', 'kind', 'dwell_minutes']
+        read_only_fields = ['location_coords']
+
 class TripSerializer(serializers.ModelSerializer):
+    stops = TripStopSerializer(many=True, required=False)
+
     class Meta:
         model = Trip
         fields = '__all__'
         read_only_fields = ['current_location_coords', 'pickup_location_coords', 'dropoff_location_coords']
+        extra_kwargs = {
+            'pickup_location': {'required': False},
+            'dropoff_location': {'required': False},
+        }
 
     def validate(self, data):
-        # Validate that locations are different
-        if data.get('current_location') == data.get('pickup_location'):
-            raise serializers.ValidationError("Current location and pickup location must be different.")
-        if data.get('pickup_location') == data.get('dropoff_location'):
-            raise serializers.ValidationError("Pickup location and dropoff location must be different.")
-        if data.get('current_location') == data.get('dropoff_location'):
-            raise serializers.ValidationError("Current location and dropoff location must be different.")
+        stops = data.get('stops')
+        if stops:
+            if len(stops) > MAX_TRIP_STOPS:
+                raise serializers.ValidationError(f"A trip can have at most {MAX_TRIP_STOPS} stops.")
+            # Pickup and dropoff default to the first and last stop
+            data.setdefault('pickup_location', stops[0]['location'])
+            data.setdefault('dropoff_location', stops[-1]['location'])
+            locations = [data.get('current_location')] + [stop['location'] for stop in stops]
+            if any(a == b for a, b in zip(locations, locations[1:])):
+                raise serializers.ValidationError("Consecutive stops must be at different locations.")
+        else:
+            for field in ['pickup_location', 'dropoff_location']:
+                if not data.get(field):
+                    raise serializers.ValidationError({field: "This field is required."})
+
+            # Validate that locations are different
+            if data.get('current_location') == data.get('pickup_location'):
+                raise serializers.ValidationError("Current location and pickup location must be different.")
+            if data.get('pickup_location') == data.get('dropoff_location'):
+                raise serializers.ValidationError("Pickup location and dropoff location must be different.")
+            if data.get('current_location') == data.get('dropoff_location'):
+                raise serializers.ValidationError("Current location and dropoff location must be different.")
 
         # Validate current_cycle_hours is non-negative
         if data.get('current_cycle_hours', 0) < 0:
             raise serializers.ValidationError("Current cycle hours cannot be negative.")
 
-        # Geocode locations
-        for field in ['current_location', 'pickup_location', 'dropoff_location']:
+        # Geocode all distinct locations concurrently
+        fields = ['current_location', 'pickup_location', 'dropoff_location']
+        names = {data[field] for field in fields if data.get(field)}
+        names.update(stop['location'] for stop in stops or [])
+        names = sorted(names)
+        with ThreadPoolExecutor(max_workers=min(8, len(names) or 1)) as pool:
+            coords = dict(zip(names, pool.map(geocoder.geocode, names)))
+
+        for field in fields:
             location = data.get(field)
             if location:
-                coords = geocoder.geocode(location)
-                if not coords:
+                if not coords[location]:
                     raise serializers.ValidationError(f"Could not geocode {field.replace('_', ' ')}. Please enter a valid location.")
-                data[f"{field}_coords"] = coords
+                data[f"{field}_coords"] = coords[location]
+        for i, stop in enumerate(stops or [], start=1):
+            if not coords[stop['location']]:
+                raise serializers.ValidationError(f"Could not geocode stop {i}. Please enter a valid location.")
+            stop['location_coords'] = coords[stop['location']]
 
         return data
 
+    def create(self, validated_data):
+        stops = validated_data.pop('stops', [])
+        with transaction.atomic():
+            trip = Trip.objects.create(**validated_data)
+            TripStop.objects.bulk_create([
+                TripStop(trip=trip, sequence=i, **stop) for i, stop in enumerate(stops)
+            ])
+        return trip
+
 class LogEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = LogEntry
         fields = '__all__'
+
+class TripDetailSerializer(TripSerializer):
+    """A trip with its stops and all of its logs, for reading back."""
+    logs = LogEntrySerializer(source='logentry_set', many=True, read_only=True)
+
+class DriverSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Driver
+        fields = '__all__'
+        read_only_fields = ['current_location_coords']
+
+    def to_representation(self, driver):
+        # Both limits come from one reading of the clocks, taken at one instant
+        data = super().to_representation(driver)
+        driving, window = driver.clocks()
+        data['driving_hours_left'] = round(max(0.0, 11 - driving), 2)
+        data['window_hours_left'] = round(max(0.0, 14 - window), 2)
+        return data
+
+    def validate(self, data):
+        location = data.get('current_location')
+        if location:
+            coords = geocoder.geocode(location)
+            if not coords:
+                raise serializers.ValidationError("Could not geocode current location. Please enter a valid location.")
+            data['current_location_coords'] = coords
+        return data
+
+class LoadSerializer(serializers.Serializer):
+    """An open load offered to the fleet (not stored)."""
+    pickup_location = serializers.CharField(max_length=255)
+    dropoff_location = serializers.CharField(max_length=255)
+    deliver_by = serializers.DateTimeField(required=False, allow_null=True)
+    pickup_dwell_minutes = serializers.IntegerField(min_value=0, default=60)
+    dropoff_dwell_minutes = serializers.IntegerField(min_value=0, default=60)
+
+class AssignmentRequestSerializer(serializers.Serializer):
+    loads = LoadSerializer(many=True, allow_empty=False)
+    drivers = serializers.PrimaryKeyRelatedField(queryset=Driver.objects.all(), many=True, required=False)
+
+    def validate_loads(self, loads):
+        if len(loads) > MAX_FLEET_LOADS:
+            raise serializers.ValidationError(f"At most {MAX_FLEET_LOADS} loads per request.")
+        # Geocode all distinct locations concurrently
+        names = sorted({load[field] for load in loads for field in ('pickup_location', 'dropoff_location')})
+        with ThreadPoolExecutor(max_workers=min(8, len(names))) as pool:
+            coords = dict(zip(names, pool.map(geocoder.geocode, names)))
+        for i, load in enumerate(loads, start=1):
+            for field in ('pickup_location', 'dropoff_location'):
+                if not coords[load[field]]:
+                    raise serializers.ValidationError(f"Could not geocode load {i} {field.replace('_', ' ')}.")
+                load[field.replace('location', 'coords')] = coords[load[field]]
+        return loads
+
+    def validate_drivers(self, drivers):
+        missing = [driver.id for driver in drivers if not driver.current_location_coords]
+        if missing:
+            raise serializers.ValidationError(f"Drivers without a known location: {', '.join(map(str, missing))}.")
+        return drivers
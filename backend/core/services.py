@@ -1,16 +1,17 @@
-from geopy.distance import geodesic
 from datetime import datetime, timedelta, time, date
 import random
 from .models import LogEntry
 import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.utils import timezone
 from collections import defaultdict
 from .routing import router
+from .geometry import FULL_TIER, ROUTE_TIERS, RouteIndex
+from .truckstops import get_truck_stop_index
+from .sleeper import plan_split_sleeper
+from .media import hashed_name
+import bisect
 
 THIRTY_MIN = 30
 
@@ -236,49 +237,114 @@ def normalize_and_summarize(logs):
     violations = sorted(set(all_flags))
     return out_logs, (len(violations) == 0), violations
 
-def calculate_route_and_logs(trip):
-    # Use stored coordinates
-    locations = {
-        trip.current_location: trip.current_location_coords,
-        trip.pickup_location: trip.pickup_location_coords,
-        trip.dropoff_location: trip.dropoff_location_coords,
-    }
-    
-    # Get routes using OSRM
-    route_to_pickup = router.get_route(locations[trip.current_location], locations[trip.pickup_location])
-    route_to_dropoff = router.get_route(locations[trip.pickup_location], locations[trip.dropoff_location])
-    
-    if not route_to_pickup or not route_to_dropoff:
-        # Fallback to geodesic distance if routing fails
-        distance_to_pickup = geodesic(locations[trip.current_location], locations[trip.pickup_location]).miles
-        distance_to_dropoff = geodesic(locations[trip.pickup_location], locations[trip.dropoff_location]).miles
-        total_distance = distance_to_pickup + distance_to_dropoff
-        route_coordinates = [locations[trip.current_location], locations[trip.pickup_location], locations[trip.dropoff_location]]
-    else:
-        # Use OSRM distances and combine route coordinates
-        distance_to_pickup = route_to_pickup["distance"]
-        distance_to_dropoff = route_to_dropoff["distance"]
-        total_distance = distance_to_pickup + distance_to_dropoff
-        
-        # Combine coordinates for the full route
-        route_coordinates = route_to_pickup["coordinates"]
-        # Avoid duplicating the pickup location
-        route_coordinates.extend(route_to_dropoff["coordinates"][1:])
+# Keys of a log dict that are stored on LogEntry rows
+LOG_ENTRY_FIELDS = ('date', 'status', 'start_time', 'end_time', 'remarks')
 
-    # Enforce 14-hour window: Start after 10 consecutive off-duty hours
-    # Assume driver has had 10 hours off-duty before starting
-    current_time = datetime.now().replace(hour=6, minute=0, second=0, microsecond=0)  # Start at 6 AM
-    window_end = current_time + timedelta(hours=14)  # 14-hour window ends at 8 PM
+def locate_log_entries(logs, route_coordinates, total_distance):
+    """
+    Attach `mile_marker` and `location` (lat, lon) to each chronologically
+    sorted log entry, giving where along the route the entry starts.
 
-    driving_hours = 0
-    cumulative_driving_hours = 0  # Track cumulative driving for 30-min break
-    on_duty_hours = float(trip.current_cycle_hours)
-    next_allowed_onduty = current_time  # Earliest time we may be on-duty again
+    Miles are accumulated from driving time, as the scheduler drives at a
+    constant speed, and mapped onto the route geometry by fraction of
+    `total_distance`.
+    """
+    entries = [log for log in logs if log['status'] != 'Total']
+    driving_minutes = sum(_min_between(e['start_time'], e['end_time'])
+                          for e in entries if e['status'] == 'Driving')
+    miles_per_minute = total_distance / driving_minutes if driving_minutes else 0
+    index = RouteIndex(route_coordinates)
+
+    miles = 0.0
+    for e in entries:
+        fraction = miles / total_distance if total_distance else 0
+        lat, lon = index.locate_fraction(min(fraction, 1.0))
+        e['mile_marker'] = round(miles, 1)
+        e['location'] = [round(lat, 5), round(lon, 5)]
+        if e['status'] == 'Driving':
+            miles += _min_between(e['start_time'], e['end_time']) * miles_per_minute
+    return logs
+
+# Remarks of scheduled entries that happen at a truck stop or rest area
+STOP_REMARKS = ('break', 'restart', 'Fueling stop')
+CORRIDOR_MILES = 5.0
+# Farthest a break is moved back along the route to reach a truck stop
+MAX_SNAP_MILES = 50.0
+
+def snap_stops_to_route(logs, route_coordinates, total_distance):
+    """
+    Attach the nearest truck stop at or before each break/fueling entry's
+    mile marker, from the stops within CORRIDOR_MILES of the route. Entries
+    with no such stop within MAX_SNAP_MILES behind them are left unsnapped.
+    Does nothing when no truck stop dataset is configured.
+    """
+    stop_index = get_truck_stop_index()
+    if stop_index is None:
+        return logs
+    route = RouteIndex(route_coordinates)
+    stops = stop_index.corridor(route, CORRIDOR_MILES)
+    if not stops or not route.length:
+        return logs
+
+    # Corridor positions are along the route geometry; scale to road miles
+    scale = total_distance / route.length
+    markers = [s['mile_marker'] * scale for s in stops]
+    for e in logs:
+        if e['status'] == 'Total' or 'mile_marker' not in e:
+            continue
+        if not any(r in e.get('remarks', '') for r in STOP_REMARKS):
+            continue
+        i = bisect.bisect_right(markers, e['mile_marker']) - 1
+        if i < 0 or e['mile_marker'] - markers[i] > MAX_SNAP_MILES:
+            continue
+        stop = stops[i]
+        e['stop'] = {
+            'name': stop['name'],
+            'kind': stop['kind'],
+            'location': [stop['lat'], stop['lon']],
+            'mile_marker': round(markers[i], 1),
+        }
+    return logs
+
+STOP_ACTIVITY = {'pickup': 'Loading', 'dropoff': 'Unloading', 'stop': 'Stop'}
+
+def make_stop(location, coords, kind='stop', dwell_minutes=60):
+    """A stop as used by the scheduler, with the remarks for its dwell entry."""
+    return {
+        'location': location,
+        'coords': coords,
+        'kind': kind,
+        'dwell_minutes': dwell_minutes,
+        'remarks': f"{location}, {STOP_ACTIVITY.get(kind, 'Stop')}",
+    }
 
-    # Initialize rolling 8-day window with simulated historical on-duty hours
+def trip_stops(trip):
+    """
+    Ordered stops after the current location (see make_stop). Trips without
+    TripStop rows use their pickup and dropoff with a 1-hour load and unload.
+    """
+    stops = [make_stop(s.location, s.location_coords, s.kind, s.dwell_minutes) for s in trip.stops.all()]
+    if not stops:
+        stops = [
+            make_stop(trip.pickup_location, trip.pickup_location_coords, 'pickup'),
+            make_stop(trip.dropoff_location, trip.dropoff_location_coords, 'dropoff'),
+        ]
+    return stops
+
+def local_naive(value):
+    """`value` in naive local time, which the scheduler works in; naive values are returned as is."""
+    if timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+def simulated_cycle_history(cycle_hours):
+    """
+    Rolling 8-day on-duty window (hours per day, today last) built from the
+    driver's current cycle hours.
+    """
     # Distribute current_cycle_hours across the past 7 days, with some variation
     historical_days = 7
-    base_daily_hours = trip.current_cycle_hours / historical_days
+    base_daily_hours = cycle_hours / historical_days
     rolling_window = []
     for i in range(historical_days):
         # Add some random variation (±2 hours) but ensure non-negative
@@ -288,6 +354,62 @@ def calculate_route_and_logs(trip):
     # Current day starts at 0
     rolling_window.append(0.0)  # Index 7 is current day
 
+    return rolling_window
+
+def plan_hos_schedule(leg_distances, stops, origin, cycle_hours, use_sleeper_berth=False,
+                      start_time=None, rolling_window=None, departure=None,
+                      driving_hours_used=0, window_hours_used=0):
+    """
+    Run the HOS scheduler over a route: pre-trip at `origin`, then a drive
+    of `leg_distances[i]` miles to each of `stops` followed by its dwell.
+
+    By default the day starts at 6 AM with a 6-hour home terminal off-duty
+    block. Passing a `departure` datetime starts the pre-trip (and the
+    14-hour window) exactly then instead, and `driving_hours_used` and
+    `window_hours_used` carry over a driver's 11-hour and 14-hour clocks.
+
+    Pure function (no database or PDF work), so it can be evaluated many
+    times for candidate plans. Returns a dict with the raw `logs`, the
+    `finish` datetime and the final `cycle_hours_8_day`. With
+    `use_sleeper_berth` the fastest schedule using 8/2 and 7/3 sleeper berth
+    splits (see sleeper.plan_split_sleeper) is returned instead if it takes
+    a sleeper berth period and finishes earlier.
+    """
+    if use_sleeper_berth:
+        if rolling_window is None:
+            rolling_window = simulated_cycle_history(cycle_hours)
+        split = plan_split_sleeper(leg_distances, stops, origin, rolling_window,
+                                   start_time=start_time, departure=departure,
+                                   driving_hours_used=driving_hours_used,
+                                   window_hours_used=window_hours_used)
+        plan = plan_hos_schedule(leg_distances, stops, origin, cycle_hours, start_time=start_time,
+                                 rolling_window=rolling_window, departure=departure,
+                                 driving_hours_used=driving_hours_used, window_hours_used=window_hours_used)
+        if (split is not None and split['finish'] < plan['finish']
+                and any(log['status'] == 'Sleeper Berth' for log in split['logs'])):
+            return split
+        return plan
+
+    # Enforce 14-hour window: Start after 10 consecutive off-duty hours
+    # Assume driver has had 10 hours off-duty before starting
+    home_terminal_minutes = 360
+    if departure is not None:
+        start_time = departure.replace(second=0, microsecond=0)
+        home_terminal_minutes = 0
+    elif start_time is None:
+        start_time = datetime.now().replace(hour=6, minute=0, second=0, microsecond=0)  # Start at 6 AM
+    current_time = start_time
+    window_end = current_time + timedelta(hours=14 - window_hours_used)  # 14-hour window ends at 8 PM
+
+    driving_hours = driving_hours_used
+    cumulative_driving_hours = driving_hours_used  # Track cumulative driving for 30-min break
+    on_duty_hours = float(cycle_hours)
+    next_allowed_onduty = current_time  # Earliest time we may be on-duty again
+
+    if rolling_window is None:
+        rolling_window = simulated_cycle_history(cycle_hours)
+    rolling_window = list(rolling_window)
+
     cycle_hours_8_day = sum(rolling_window)  # Initial rolling total
 
     logs = []
@@ -414,19 +536,6 @@ def calculate_route_and_logs(trip):
             cumulative_driving_hours = 0.0
             return
 
-        # Handle sleeper berth restart: If 9+ consecutive hours off-duty with berth, reset 11/14-hour clocks
-        if status == 'Off-Duty' and trip.use_sleeper_berth and duration_minutes >= 540:  # 9 hours
-            berth_minutes = 420  # 7 hours
-            remainder_minutes = duration_minutes - berth_minutes
-            if remainder_minutes >= 120:  # At least 2 hours remainder
-                # Split into 7 hours Sleeper Berth + remainder Off-Duty
-                add_log_entry('Sleeper Berth', berth_minutes, f'{remarks} (Sleeper Berth)', 0)
-                add_log_entry('Off-Duty', remainder_minutes, f'{remarks} (Off-Duty after Berth)', 0)
-                # Reset 11/14-hour clocks
-                driving_hours = 0
-                cumulative_driving_hours = 0
-                return
-
         start_time = current_time
         end_time = current_time + timedelta(minutes=duration_minutes)
 
@@ -543,13 +652,14 @@ def calculate_route_and_logs(trip):
             current_time = end_time
 
     # Off-duty from midnight to 6 AM (home terminal time base)
-    add_log_entry('Off-Duty', 360, 'Home terminal time base')
+    if home_terminal_minutes:
+        add_log_entry('Off-Duty', home_terminal_minutes, 'Home terminal time base')
 
     # Pre-trip inspection (30 min, On-Duty)
-    add_log_entry('On-Duty', 30, f'{trip.current_location}, Pre-trip and TIV')
+    add_log_entry('On-Duty', 30, f'{origin}, Pre-trip and TIV')
 
-    # Drive to pickup (exact time, check for breaks and rolling 70-hour limit)
-    drive_minutes_to_pickup = int((distance_to_pickup / 60) * 60)  # Exact minutes at 60 mph
+    # Drive to the first stop (exact time, check for breaks and rolling 70-hour limit)
+    drive_minutes_to_pickup = int((leg_distances[0] / 60) * 60)  # Exact minutes at 60 mph
     if drive_minutes_to_pickup > 0:
         # Check for 30-min break after 8 cumulative driving hours
         if cumulative_driving_hours >= 8:
@@ -567,50 +677,100 @@ def calculate_route_and_logs(trip):
             driving_hours = 0
             cumulative_driving_hours = 0
             window_end = current_time + timedelta(hours=14)
-        add_log_entry('Driving', drive_minutes_to_pickup, f'Drive to {trip.pickup_location}', distance_to_pickup)
+        add_log_entry('Driving', drive_minutes_to_pickup, f'Drive to {stops[0]["location"]}', leg_distances[0])
 
-    # Pickup (1 hour, On-Duty)
-    add_log_entry('On-Duty', 60, f'{trip.pickup_location}, Loading')
+    # First stop (On-Duty dwell, 1 hour loading by default)
+    if stops[0]['dwell_minutes']:
+        add_log_entry('On-Duty', stops[0]['dwell_minutes'], stops[0]['remarks'])
 
-    # Drive to dropoff (split into reasonable segments, check for breaks, fueling every 1000 miles)
-    drive_minutes_to_dropoff = int((distance_to_dropoff / 60) * 60)
-    remaining_drive = drive_minutes_to_dropoff
-    remaining_miles = distance_to_dropoff
     miles_since_fueling = 0
+    for stop, leg_distance in zip(stops[1:], leg_distances[1:]):
+        # Drive to the next stop (split into reasonable segments, check for breaks, fueling every 1000 miles)
+        drive_minutes_to_dropoff = int((leg_distance / 60) * 60)
+        remaining_drive = drive_minutes_to_dropoff
+        remaining_miles = leg_distance
+
+        while remaining_drive > 0:
+            # Drive in segments, but check for 8-hour break, fueling, and rolling 70-hour limit
+            chunk_minutes = min(remaining_drive, 60)  # Max 1 hour segments
+            chunk_miles = (chunk_minutes / drive_minutes_to_dropoff) * leg_distance if drive_minutes_to_dropoff > 0 else 0
+
+            # Check for fueling every 1000 miles
+            if total_miles_driven + chunk_miles - miles_since_fueling >= 1000:
+                add_log_entry('On-Duty', 30, 'Fueling stop')
+                miles_since_fueling = total_miles_driven + chunk_miles
+
+            # Check for 30-min break after 8 cumulative driving hours
+            if cumulative_driving_hours + (chunk_minutes / 60) >= 8:
+                add_log_entry('Off-Duty', 30, '30-min break after 8 hours driving')
+                cumulative_driving_hours = 0
 
-    while remaining_drive > 0:
-        # Drive in segments, but check for 8-hour break, fueling, and rolling 70-hour limit
-        chunk_minutes = min(remaining_drive, 60)  # Max 1 hour segments
-        chunk_miles = (chunk_minutes / drive_minutes_to_dropoff) * distance_to_dropoff if drive_minutes_to_dropoff > 0 else 0
+            # Check rolling 70-hour limit before adding driving time
+            projected_rolling = cycle_hours_8_day + (chunk_minutes / 60)
+            if projected_rolling > 70:
+                # Force 34-hour restart
+                add_log_entry('Off-Duty', 2040, '34-hour restart to reset 70-hour limit', skip_limit_check=True)
+                rolling_window = [0.0] * 8
+                cycle_hours_8_day = 0
+                # Reset driving hours and window
+                driving_hours = 0
+                cumulative_driving_hours = 0
+                window_end = current_time + timedelta(hours=14)
 
-        # Check for fueling every 1000 miles
-        if total_miles_driven + chunk_miles - miles_since_fueling >= 1000:
-            add_log_entry('On-Duty', 30, 'Fueling stop')
-            miles_since_fueling = total_miles_driven + chunk_miles
+            add_log_entry('Driving', chunk_minutes, f'Drive to {stop["location"]}', chunk_miles)
+            remaining_drive -= chunk_minutes
+            remaining_miles -= chunk_miles
 
-        # Check for 30-min break after 8 cumulative driving hours
-        if cumulative_driving_hours + (chunk_minutes / 60) >= 8:
-            add_log_entry('Off-Duty', 30, '30-min break after 8 hours driving')
-            cumulative_driving_hours = 0
+        # On-Duty dwell at the stop (unloading at the final dropoff)
+        if stop['dwell_minutes']:
+            add_log_entry('On-Duty', stop['dwell_minutes'], stop['remarks'])
 
-        # Check rolling 70-hour limit before adding driving time
-        projected_rolling = cycle_hours_8_day + (chunk_minutes / 60)
-        if projected_rolling > 70:
-            # Force 34-hour restart
-            add_log_entry('Off-Duty', 2040, '34-hour restart to reset 70-hour limit', skip_limit_check=True)
-            rolling_window = [0.0] * 8
-            cycle_hours_8_day = 0
-            # Reset driving hours and window
-            driving_hours = 0
-            cumulative_driving_hours = 0
-            window_end = current_time + timedelta(hours=14)
+    return {
+        'logs': logs,
+        'finish': current_time,
+        'cycle_hours_8_day': cycle_hours_8_day,
+    }
+
+def route_legs(points):
+    """
+    Route through `points` with a single routing call.
+
+    Returns (leg_distances, route_coordinates, route_tiers), falling back to
+    geodesic legs if routing fails.
+    """
+    # All legs in a single routing call
+    route = router.get_multi_point_route(points)
+
+    if not route:
+        # Fallback to geodesic distance if routing fails
+        from geopy.distance import geodesic
+        leg_distances = [geodesic(a, b).miles for a, b in zip(points, points[1:])]
+        route_coordinates = points
+        route_tiers = {tier: route_coordinates for tier in ROUTE_TIERS}
+    else:
+        leg_distances = [leg["distance"] for leg in route["legs"]]
+        route_coordinates = route["coordinates"]
+        route_tiers = route["tiers"]
+    return leg_distances, route_coordinates, route_tiers
+
+def calculate_route_and_logs(trip, route_tier=FULL_TIER, departure=None):
+    """
+    Plan the trip and its HOS logs.
 
-        add_log_entry('Driving', chunk_minutes, f'Drive to {trip.dropoff_location}', chunk_miles)
-        remaining_drive -= chunk_minutes
-        remaining_miles -= chunk_miles
+    `route_tier` selects the geometry returned in `route_coordinates`: the full
+    route or one of the simplified tiers in geometry.ROUTE_TIERS. `departure`
+    (datetime) starts the pre-trip at that time instead of the default 6 AM
+    day with a home terminal off-duty block.
+    """
+    stops = trip_stops(trip)
+    points = [trip.current_location_coords] + [stop['coords'] for stop in stops]
+    leg_distances, route_coordinates, route_tiers = route_legs(points)
+    total_distance = sum(leg_distances)
 
-    # Unload immediately at break end (same morning)
-    add_log_entry('On-Duty', 60, f'{trip.dropoff_location}, Unloading')
+    plan = plan_hos_schedule(leg_distances, stops, trip.current_location, trip.current_cycle_hours,
+                             use_sleeper_berth=trip.use_sleeper_berth, departure=departure)
+    logs = plan['logs']
+    cycle_hours_8_day = plan['cycle_hours_8_day']
 
     # Ensure full day coverage
     by_day = defaultdict(list)
@@ -648,14 +808,19 @@ def calculate_route_and_logs(trip):
         
         logs.extend(merged_day_logs)
 
-    # Generate PDF log
-    pdf_buffer = generate_log_pdf(logs, trip)
-    pdf_file = ContentFile(pdf_buffer.getvalue(), name=f'log_{trip.id}.pdf')
-    pdf_path = default_storage.save(f'logs/{logs[0]["date"]}.pdf', pdf_file)
-
     # Compute normalized daily totals
     daily_totals = compute_daily_totals(logs)
 
+    # Generate PDF log
+    pdf_buffer = generate_log_pdf(logs, trip, daily_totals)
+    pdf_bytes = pdf_buffer.getvalue()
+    # Content-hashed name, so the file can be cached forever. It keeps the
+    # trip id (the archive finds a trip's PDFs by it), so only a trip's own
+    # identical PDFs, e.g. from recalculating it, share one file.
+    pdf_path = hashed_name(f'logs/trip_{trip.id}_{logs[0]["date"]}.pdf', pdf_bytes)
+    if not default_storage.exists(pdf_path):
+        pdf_path = default_storage.save(pdf_path, ContentFile(pdf_bytes, name=f'log_{trip.id}.pdf'))
+
     # Validate HOS compliance
     hos_compliant = True
     violations = []
@@ -687,6 +852,10 @@ def calculate_route_and_logs(trip):
         return (x['date'], start_time)
     logs.sort(key=sort_key)
 
+    # Place every entry (stops, fueling, breaks) on the route
+    locate_log_entries(logs, route_coordinates, total_distance)
+    snap_stops_to_route(logs, route_tiers['high'], total_distance)
+
     # Add totals to logs
     for day, day_data in daily_totals.items():
         totals = day_data['totals']
@@ -703,7 +872,7 @@ def calculate_route_and_logs(trip):
     for log in logs:
         if log['status'] != 'Total':  # Skip total entries
             grid_positions = calculate_grid_positions(log) if log['status'] != 'Total' else None
-            LogEntry.objects.create(trip=trip, grid_positions=grid_positions, **{k: v for k, v in log.items() if k != 'miles'})
+            LogEntry.objects.create(trip=trip, grid_positions=grid_positions, **{k: log[k] for k in LOG_ENTRY_FIELDS})
 
     # Calculate total duration from logs
     total_duration = 0
@@ -721,8 +890,14 @@ def calculate_route_and_logs(trip):
             total_duration += duration
     
     return {
-        'route': [trip.current_location, trip.pickup_location, trip.dropoff_location],
-        'route_coordinates': route_coordinates,
+        'route': [trip.current_location] + [stop['location'] for stop in stops],
+        'stops': [
+            {'name': stop['location'], 'kind': stop['kind'], 'lat': stop['coords'][0], 'lon': stop['coords'][1],
+             'dwell_minutes': stop['dwell_minutes']}
+            for stop in stops
+        ],
+        'route_coordinates': route_coordinates if route_tier == FULL_TIER else route_tiers[route_tier],
+        'route_tier': route_tier,
         'logs': logs,
         'total_distance': total_distance,
         'total_duration': round(total_duration, 2),
@@ -755,182 +930,186 @@ def calculate_grid_positions(log_entry):
 
     return {'start_slot': start_slot, 'end_slot': end_slot, 'status': log_entry['status']}
 
-def generate_log_pdf(logs, trip):
+# Log sheet layout (points). The static parts of the sheet are drawn once per
+# document as a form XObject and stamped onto every page.
+# Page geometry in points, as reportlab's units.inch and pagesizes.letter
+# (reportlab itself is only imported when a PDF is drawn)
+inch = 72.0
+PAGE_WIDTH, PAGE_HEIGHT = letter = (8.5*inch, 11*inch)
+GRID_TOP = PAGE_HEIGHT - 2*inch
+GRID_LEFT = 1.3*inch
+GRID_WIDTH = PAGE_WIDTH - 2.1*inch
+GRID_HEIGHT = 4*inch
+ROW_HEIGHT = GRID_HEIGHT / 4
+PER_HOUR = GRID_WIDTH / 24
+TOTAL_X = GRID_LEFT + GRID_WIDTH + 0.15*inch
+REMARKS_Y = GRID_TOP - GRID_HEIGHT - 0.6*inch
+LOG_SHEET_FORM = "log_sheet"
+
+GRID_ROWS = ['Off-Duty', 'Sleeper Berth', 'Driving', 'On-Duty']
+YROW = {status: GRID_TOP - ROW_HEIGHT * (i + 0.5) for i, status in enumerate(GRID_ROWS)}
+TOTALS_ROW_KEYS = ['off_duty', 'sleeper', 'driving', 'on_duty_not_driving']
+
+def _draw_log_sheet_form(c):
+    """Draw the date-independent parts of the log sheet into a reusable form."""
+    c.beginForm(LOG_SHEET_FORM)
+
+    # Title
+    c.setFont("Helvetica-Bold", 20)
+    c.drawString(0.75*inch, PAGE_HEIGHT - 0.6*inch, "DRIVER'S DAILY LOG")
+
+    # Driver info section
+    y_pos = PAGE_HEIGHT - 1.2*inch
+    c.setFont("Helvetica", 10)
+    c.drawString(0.75*inch, y_pos, "Driver: ________________")
+    c.drawString(3*inch, y_pos, "Truck #: ________________")
+    c.drawString(5.5*inch, y_pos, "Trailer #: ________________")
+
+    # Status labels - positioned to the left of grid
+    c.setFont("Helvetica-Bold", 9)
+    for i in range(4):
+        c.drawString(0.5*inch, GRID_TOP - ROW_HEIGHT * (i + 0.5), str(i + 1))
+    c.setFont("Helvetica", 8)
+    for i, label in enumerate(["Off Duty", "Sleeper Berth", "Driving", "On Duty"]):
+        c.drawString(0.65*inch, GRID_TOP - ROW_HEIGHT * (i + 0.5), label)
+
+    # Hour labels
+    hour_labels = ["12M", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11",
+                  "12N", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12M"]
+    c.setFont("Helvetica", 7)
+    for i, label in enumerate(hour_labels):
+        x = GRID_LEFT + i * PER_HOUR
+        c.drawString(x - 0.05*inch, GRID_TOP + 0.1*inch, label)
+
+    # Draw grid
+    from reportlab.lib import colors
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(1.5)
+    c.rect(GRID_LEFT, GRID_TOP - GRID_HEIGHT, GRID_WIDTH, GRID_HEIGHT)
+
+    # Horizontal lines
+    c.lines([(GRID_LEFT, GRID_TOP - i * ROW_HEIGHT, GRID_LEFT + GRID_WIDTH, GRID_TOP - i * ROW_HEIGHT)
+             for i in range(1, 4)])
+
+    # Vertical hour lines
+    c.setLineWidth(0.8)
+    c.lines([(GRID_LEFT + h * PER_HOUR, GRID_TOP, GRID_LEFT + h * PER_HOUR, GRID_TOP - GRID_HEIGHT)
+             for h in range(1, 24)])
+
+    # Quarter hour ticks
+    c.setLineWidth(0.3)
+    ticks = []
+    for h in range(24):
+        for q in range(1, 4):
+            x = GRID_LEFT + h * PER_HOUR + q * (PER_HOUR / 4)
+            ticks.append((x, GRID_TOP, x, GRID_TOP - GRID_HEIGHT))
+    c.lines(ticks)
+
+    # Total hours boxes (right side)
+    c.setLineWidth(0.8)
+    for i in range(4):
+        box_y = GRID_TOP - i * ROW_HEIGHT - ROW_HEIGHT * 0.5
+        c.rect(TOTAL_X, box_y - 0.15*inch, 0.6*inch, 0.3*inch)
+
+    # Remarks section
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(0.75*inch, REMARKS_Y, "Remarks:")
+    c.rect(0.75*inch, REMARKS_Y - 1.8*inch, PAGE_WIDTH - 1.5*inch, 1.7*inch)
+
+    # Footer info
+    footer_y = REMARKS_Y - 2.2*inch
+    c.setFont("Helvetica", 8)
+    c.drawString(0.75*inch, footer_y, "Carrier: ________________")
+    c.drawString(3.5*inch, footer_y, "Home Terminal: ________________")
+    c.drawString(0.75*inch, footer_y - 0.2*inch, "Signature: ________________")
+    c.drawString(3.5*inch, footer_y - 0.2*inch, "Date: ________________")
+
+    c.endForm()
+
+def _x_at_hms(hms):
+    H, M, S = map(int, hms.split(":"))
+    return GRID_LEFT + (H + M/60 + S/3600) * PER_HOUR
+
+def draw_log_page(c, day, day_logs, totals, subtitle=None):
+    """Stamp the log sheet form and draw one day's duty lines, totals and remarks."""
+    c.doForm(LOG_SHEET_FORM)
+
+    # Date
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(PAGE_WIDTH - 2.5*inch, PAGE_HEIGHT - 0.6*inch, f"Date: {day.strftime('%m/%d/%Y')}")
+    if subtitle:
+        c.setFont("Helvetica", 9)
+        c.drawString(0.75*inch, PAGE_HEIGHT - 0.85*inch, subtitle[:110])
+
+    # Draw log lines on grid
+    from reportlab.lib import colors
+    c.setStrokeColor(colors.blue)
+    c.setLineWidth(3)
+    segments = []
+    prev = None
+    for e in day_logs:
+        if e['status'] in YROW:
+            y = YROW[e['status']]
+            x1 = _x_at_hms(e['start_time'])
+            segments.append((x1, y, _x_at_hms(e['end_time']), y))
+
+            # Draw vertical connector if status changed
+            if prev and prev['end_time'] == e['start_time']:
+                segments.append((x1, YROW[prev['status']], x1, y))
+            prev = e
+    if segments:
+        c.lines(segments)
+
+    # Total hours values
+    c.setFont("Helvetica-Bold", 8)
+    for i, key in enumerate(TOTALS_ROW_KEYS):
+        box_y = GRID_TOP - i * ROW_HEIGHT - ROW_HEIGHT * 0.5
+        hrs = f"{totals[key]:.1f}" if totals else "0"
+        c.drawString(TOTAL_X + 0.1*inch, box_y - 0.05*inch, hrs)
+
+    # Remarks
+    c.setFont("Helvetica", 8)
+    y_offset = REMARKS_Y - 0.25*inch
+    for i, log in enumerate(day_logs[:10]):  # Show up to 10 remarks
+        if log.get('remarks'):
+            remark_text = f"{log['start_time'][:5]} - {log['end_time'][:5]}: {log['remarks']}"
+            if len(remark_text) > 90:
+                remark_text = remark_text[:87] + "..."
+            c.drawString(0.85*inch, y_offset - i * 0.15*inch, remark_text)
+
+    c.showPage()
+
+def new_log_canvas(fileobj):
+    """Return a canvas writing to `fileobj` with the log sheet form already defined."""
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(fileobj, pagesize=letter, pageCompression=1)
+    _draw_log_sheet_form(c)
+    return c
+
+def generate_log_pdf(logs, trip, daily_totals=None):
+    """
+    Render one log sheet page per date.
+
+    `daily_totals` is the structure returned by compute_daily_totals(); it is
+    computed from `logs` when not supplied.
+    """
+    if daily_totals is None:
+        daily_totals = compute_daily_totals(logs)
+
     buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
+    c = new_log_canvas(buffer)
 
     # Group logs by date
-    logs_by_date = {}
-    daily_totals_by_date = {}
+    logs_by_date = defaultdict(list)
     for log in logs:
-        date = log['date']
-        if log['status'] == 'Total':
-            daily_totals_by_date[date] = log
-        else:
-            if date not in logs_by_date:
-                logs_by_date[date] = []
-            logs_by_date[date].append(log)
+        if log['status'] != 'Total':
+            logs_by_date[log['date']].append(log)
 
     # Generate a page for each date
-    for date in sorted(logs_by_date.keys()):
-        date_logs = logs_by_date[date]
-        
-        # Title
-        c.setFont("Helvetica-Bold", 20)
-        c.drawString(0.75*inch, height - 0.6*inch, "DRIVER'S DAILY LOG")
-        
-        # Date
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(width - 2.5*inch, height - 0.6*inch, f"Date: {date.strftime('%m/%d/%Y')}")
-
-        # Driver info section
-        y_pos = height - 1.2*inch
-        c.setFont("Helvetica", 10)
-        c.drawString(0.75*inch, y_pos, f"Driver: ________________")
-        c.drawString(3*inch, y_pos, f"Truck #: ________________")
-        c.drawString(5.5*inch, y_pos, f"Trailer #: ________________")
-
-        # Grid section - move grid right to make room for labels
-        grid_top = height - 2*inch
-        grid_left = 1.3*inch  # Moved right from 0.75" to 1.3"
-        grid_width = width - 2.1*inch  # Adjusted to maintain right margin
-        grid_height = 4*inch
-        row_height = grid_height / 4
-
-        # Status labels - positioned to the left of grid
-        c.setFont("Helvetica-Bold", 9)
-        label_x = 0.5*inch
-        c.drawString(label_x, grid_top - row_height * 0.5, "1")
-        c.drawString(label_x, grid_top - row_height * 1.5, "2")
-        c.drawString(label_x, grid_top - row_height * 2.5, "3")
-        c.drawString(label_x, grid_top - row_height * 3.5, "4")
-        
-        c.setFont("Helvetica", 8)
-        text_x = 0.65*inch
-        c.drawString(text_x, grid_top - row_height * 0.5, "Off Duty")
-        c.drawString(text_x, grid_top - row_height * 1.5, "Sleeper Berth")
-        c.drawString(text_x, grid_top - row_height * 2.5, "Driving")
-        c.drawString(text_x, grid_top - row_height * 3.5, "On Duty")
-
-        # Hour labels
-        hour_labels = ["12M", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", 
-                      "12N", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12M"]
-        per_hour = grid_width / 24
-        c.setFont("Helvetica", 7)
-        for i, label in enumerate(hour_labels):
-            x = grid_left + i * per_hour
-            c.drawString(x - 0.05*inch, grid_top + 0.1*inch, label)
-
-        # Draw grid
-        c.setStrokeColor(colors.black)
-        c.setLineWidth(1.5)
-        c.rect(grid_left, grid_top - grid_height, grid_width, grid_height)
-        
-        # Horizontal lines
-        for i in range(1, 4):
-            y = grid_top - i * row_height
-            c.line(grid_left, y, grid_left + grid_width, y)
-
-        # Vertical hour lines
-        c.setLineWidth(0.8)
-        for h in range(1, 24):
-            x = grid_left + h * per_hour
-            c.line(x, grid_top, x, grid_top - grid_height)
-
-        # Quarter hour ticks
-        c.setLineWidth(0.3)
-        for h in range(24):
-            for q in range(1, 4):
-                x = grid_left + h * per_hour + q * (per_hour / 4)
-                c.line(x, grid_top, x, grid_top - grid_height)
-
-        # Draw log lines on grid
-        YROW = {
-            'Off-Duty': grid_top - row_height * 0.5,
-            'Sleeper Berth': grid_top - row_height * 1.5,
-            'Driving': grid_top - row_height * 2.5,
-            'On-Duty': grid_top - row_height * 3.5,
-        }
-
-        def x_at_hms(hms: str) -> float:
-            H, M, S = map(int, hms.split(":"))
-            return grid_left + (H + M/60 + S/3600) * per_hour
-
-        c.setStrokeColor(colors.blue)
-        c.setLineWidth(3)
-        prev = None
-        for e in sorted(date_logs, key=lambda x: x['start_time']):
-            if e['status'] in YROW:
-                y = YROW[e['status']]
-                x1 = x_at_hms(e['start_time'])
-                x2 = x_at_hms(e['end_time'])
-                c.line(x1, y, x2, y)
-                
-                # Draw vertical connector if status changed
-                if prev and prev['status'] in YROW and prev['end_time'] == e['start_time']:
-                    prev_y = YROW[prev['status']]
-                    c.line(x1, prev_y, x1, y)
-                prev = e
-
-        # Total hours boxes (right side)
-        total_x = grid_left + grid_width + 0.15*inch
-        c.setStrokeColor(colors.black)
-        c.setLineWidth(0.8)
-        c.setFont("Helvetica-Bold", 8)
-        
-        # Get daily totals
-        totals_entry = daily_totals_by_date.get(date)
-        if totals_entry:
-            # Parse totals from remarks
-            remarks = totals_entry['remarks']
-            # Extract hours from remarks string
-            import re
-            driving_match = re.search(r'Driving: ([\d.]+) hrs', remarks)
-            onduty_match = re.search(r'On-Duty Not Driving: ([\d.]+) hrs', remarks)
-            offduty_match = re.search(r'Off-Duty: ([\d.]+) hrs', remarks)
-            sleeper_match = re.search(r'Sleeper Berth: ([\d.]+) hrs', remarks)
-            
-            driving_hrs = driving_match.group(1) if driving_match else "0"
-            onduty_hrs = onduty_match.group(1) if onduty_match else "0"
-            offduty_hrs = offduty_match.group(1) if offduty_match else "0"
-            sleeper_hrs = sleeper_match.group(1) if sleeper_match else "0"
-        else:
-            driving_hrs = onduty_hrs = offduty_hrs = sleeper_hrs = "0"
-
-        # Draw total boxes with values
-        for i, hrs in enumerate([offduty_hrs, sleeper_hrs, driving_hrs, onduty_hrs]):
-            box_y = grid_top - i * row_height - row_height * 0.5
-            c.rect(total_x, box_y - 0.15*inch, 0.6*inch, 0.3*inch)
-            c.drawString(total_x + 0.1*inch, box_y - 0.05*inch, str(hrs))
-
-        # Remarks section
-        remarks_y = grid_top - grid_height - 0.6*inch
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(0.75*inch, remarks_y, "Remarks:")
-        
-        c.setLineWidth(0.8)
-        c.rect(0.75*inch, remarks_y - 1.8*inch, width - 1.5*inch, 1.7*inch)
-        
-        c.setFont("Helvetica", 8)
-        y_offset = remarks_y - 0.25*inch
-        for i, log in enumerate(date_logs[:10]):  # Show up to 10 remarks
-            if log.get('remarks'):
-                remark_text = f"{log['start_time'][:5]} - {log['end_time'][:5]}: {log['remarks']}"
-                if len(remark_text) > 90:
-                    remark_text = remark_text[:87] + "..."
-                c.drawString(0.85*inch, y_offset - i * 0.15*inch, remark_text)
-
-        # Footer info
-        footer_y = remarks_y - 2.2*inch
-        c.setFont("Helvetica", 8)
-        c.drawString(0.75*inch, footer_y, "Carrier: ________________")
-        c.drawString(3.5*inch, footer_y, "Home Terminal: ________________")
-        
-        c.drawString(0.75*inch, footer_y - 0.2*inch, "Signature: ________________")
-        c.drawString(3.5*inch, footer_y - 0.2*inch, "Date: ________________")
-
-        c.showPage()
+    for day in sorted(logs_by_date.keys()):
+        day_logs = sorted(logs_by_date[day], key=lambda x: x['start_time'])
+        day_totals = daily_totals.get(day)
+        draw_log_page(c, day, day_logs, day_totals['totals'] if day_totals else None)
 
     c.save()
     buffer.seek(0)
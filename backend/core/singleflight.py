@@ -0,0 +1,84 @@
+"""
+Request coalescing for upstream lookups.
+
+`flights.do(cache_key, fetch)` runs `fetch` once for concurrent callers
+asking for the same key. Within a process, callers arriving while the call
+is in flight wait for it and share its return value. Across processes, the
+caller that takes a short-lived lock in the shared cache runs the call and
+the others poll the cache until `fetch` stores its result there (or the
+lock is released or expires, in which case they fetch themselves). The
+cross-process part needs a cache shared by the workers, such as Redis; with
+the default per-process memory cache only the in-process part applies.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 30  # seconds a cross-process lock is held at most
+POLL_INTERVAL = 0.05
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, lock_timeout=LOCK_TIMEOUT, poll_interval=POLL_INTERVAL):
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fetch, read=None):
+        """
+        Return fetch() for `key`, sharing one call among concurrent callers.
+        `fetch` is expected to store its result in the cache under `key`,
+        where other processes look for it with `read(key)`.
+        """
+        read = read or cache.get
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fetch, read)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key, fetch, read):
+        lock_key = f"flight_{key}"
+        if cache.add(lock_key, 1, self.lock_timeout):
+            try:
+                return fetch()
+            finally:
+                cache.delete(lock_key)
+
+        # Another process is fetching: wait for its result to land in the cache
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            result = read(key)
+            if result is not None:
+                return result
+            if lock_key not in cache:
+                break
+        return read(key) or fetch()
+
+flights = SingleFlight()
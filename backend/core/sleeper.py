@@ -0,0 +1,320 @@
+"""
+Split sleeper-berth planning.
+
+With a sleeper berth a driver may replace the 10-hour break with two rest
+periods: at least 7 hours in the berth and at least 2 hours off duty or in
+the berth, 10 hours together (the 8/2 and 7/3 splits). Once the second
+period of a pair ends, the 11-hour driving and 14-hour window limits are
+recalculated from the end of the first, and neither period counts against
+the window. Where those periods fall decides how soon the driver reaches the
+last stop.
+
+`plan_split_sleeper` searches the rest taken at each decision point (a
+limit is reached, or a stop's dwell ends) depth-first, cheapest-looking
+option first, and prunes any branch whose optimistic finish cannot beat the
+best schedule found so far or whose state was already reached sooner.
+
+The search keeps its own, simpler clocks than services.plan_hos_schedule
+(the window opens at the pre-trip, and dwells are not clipped at the end of
+the window), so its schedules are not comparable with the standard ones
+unless a split is actually taken. plan_hos_schedule therefore uses a split
+schedule only when it has a sleeper berth period and finishes before the
+standard schedule.
+"""
+import math
+from datetime import datetime, timedelta
+
+DRIVE_LIMIT = 11 * 60
+WINDOW_LIMIT = 14 * 60
+BREAK_AFTER = 8 * 60
+CYCLE_LIMIT = 70 * 60
+FUEL_MILES = 1000
+# Keeps the search bounded on very long trips; the best schedule found
+# within the budget is returned
+MAX_NODES = 20000
+
+# Rest options: (status, minutes, remarks)
+RESTS = {
+    'off10': ('Off-Duty', 600, '10-hour break'),
+    'sb8': ('Sleeper Berth', 480, '8-hour sleeper berth break (8/2 split)'),
+    'sb7': ('Sleeper Berth', 420, '7-hour sleeper berth break (7/3 split)'),
+    'off2': ('Off-Duty', 120, '2-hour break (8/2 split)'),
+    'off3': ('Off-Duty', 180, '3-hour break (7/3 split)'),
+    'break30': ('Off-Duty', 30, '30-min break after 8 hours driving'),
+    'restart': ('Off-Duty', 2040, '34-hour restart to reset 70-hour limit'),
+}
+# Periods that complete a split with the other
+SPLIT_PAIRS = {('sb8', 'off2'), ('sb7', 'off3'), ('sb8', 'off3')}
+SPLIT_PAIRS |= {(b, a) for a, b in SPLIT_PAIRS}
+SPLIT_RESTS = ('sb8', 'sb7', 'off2', 'off3')
+
+# Options tried when a limit is reached, standard rule first
+LIMIT_OPTIONS = ('off10',) + SPLIT_RESTS
+BREAK_OPTIONS = ('break30',) + SPLIT_RESTS
+STOP_OPTIONS = (None,) + SPLIT_RESTS
+
+class _State:
+    __slots__ = ('t', 'task', 'done', 'drive', 'window', 'since_break', 'pending',
+                 'p_drive', 'p_window', 'fuel_miles', 'cycle', 'actions')
+
+    def copy(self):
+        s = _State.__new__(_State)
+        for name in _State.__slots__:
+            setattr(s, name, getattr(self, name))
+        return s
+
+def _tasks(leg_distances, stops, origin):
+    """The trip as ('drive', minutes, miles, label) and ('dwell', minutes, remarks) tasks."""
+    tasks = [('dwell', 30, f'{origin}, Pre-trip and TIV')]
+    for stop, miles in zip(stops, leg_distances):
+        minutes = int(miles)  # 60 mph, as in plan_hos_schedule
+        if minutes > 0:
+            tasks.append(('drive', minutes, miles, f'Drive to {stop["location"]}'))
+        if stop['dwell_minutes']:
+            tasks.append(('dwell', stop['dwell_minutes'], stop['remarks']))
+    return tasks
+
+def _elapse(s, minutes, on_duty, day0):
+    """Advance the clock, rolling the 8-day cycle at each midnight."""
+    cycle = s.cycle
+    t = s.t
+    while minutes > 0:
+        to_midnight = 1440 - (day0 + t) % 1440
+        step = min(minutes, to_midnight)
+        if on_duty:
+            cycle = cycle[:-1] + (cycle[-1] + step,)
+        t += step
+        minutes -= step
+        if step == to_midnight:
+            cycle = cycle[1:] + (0,)
+    s.t = t
+    s.cycle = cycle
+
+def _rest(s, option, day0):
+    status, minutes, remarks = RESTS[option]
+    _elapse(s, minutes, False, day0)
+    s.actions = (s.actions, (status, minutes, remarks, 0))
+    s.since_break = 0
+    if minutes >= 600:
+        s.drive = s.window = s.p_drive = s.p_window = 0
+        s.pending = None
+        if option == 'restart':
+            s.cycle = (0,) * len(s.cycle)
+    elif option in SPLIT_RESTS:
+        if (s.pending, option) in SPLIT_PAIRS:
+            # Pair complete: limits count from the end of the first period
+            s.drive, s.window = s.p_drive, s.p_window
+        else:
+            s.window += minutes
+        s.pending, s.p_drive, s.p_window = option, 0, 0
+    else:
+        s.window += minutes
+        s.p_window += minutes
+
+def _work(s, minutes, driving, miles, remarks, day0):
+    _elapse(s, minutes, True, day0)
+    s.window += minutes
+    s.p_window += minutes
+    if driving:
+        s.drive += minutes
+        s.p_drive += minutes
+        s.since_break += minutes
+        s.fuel_miles += miles
+    elif minutes >= 30:
+        s.since_break = 0
+    last = s.actions[1] if s.actions else None
+    if driving and last and last[0] == 'Driving' and last[2] == remarks:
+        s.actions = (s.actions[0], ('Driving', last[1] + minutes, remarks, last[3] + miles))
+    else:
+        s.actions = (s.actions, ('Driving' if driving else 'On-Duty', minutes, remarks, miles))
+
+def _search(tasks, rolling_window, day0, drive=0, window=0):
+    remaining_after = [0] * (len(tasks) + 1)
+    for i in range(len(tasks) - 1, -1, -1):
+        remaining_after[i] = remaining_after[i + 1] + tasks[i][1]
+    drive_after = [0] * (len(tasks) + 1)
+    for i in range(len(tasks) - 1, -1, -1):
+        drive_after[i] = drive_after[i + 1] + (tasks[i][1] if tasks[i][0] == 'drive' else 0)
+
+    root = _State()
+    root.t = root.task = root.done = 0
+    root.drive = root.since_break = drive
+    root.window = window
+    root.p_drive = root.p_window = root.fuel_miles = 0
+    root.pending = None
+    root.cycle = tuple(h * 60 for h in rolling_window)
+    root.actions = None
+
+    best = [math.inf, None]
+    seen = {}
+    nodes = 0
+
+    def bound(s):
+        """
+        Optimistic finish: the remaining work plus the least rest that can
+        make up the driving time still needed beyond the current limit. A
+        pending split period can restore hours after a 2-hour rest; every
+        further 11 hours needs another 10 hours of rest.
+        """
+        left = remaining_after[s.task] - s.done
+        to_drive = drive_after[s.task] - (s.done if tasks[s.task][0] == 'drive' else 0)
+        extra = to_drive - max(0, DRIVE_LIMIT - s.drive)
+        if extra <= 0:
+            return s.t + left
+        shifts = math.ceil(extra / DRIVE_LIMIT)
+        return s.t + left + RESTS['off2'][1] + (shifts - 1) * RESTS['off10'][1]
+
+    def dominated(s):
+        """
+        True if a state at least as far along, as early and with no worse
+        clocks was already explored; otherwise record this one. While the
+        70-hour limit could still be reached, only states on the same day
+        with the same cycle history are compared.
+        """
+        left = remaining_after[s.task] - s.done
+        if sum(s.cycle) + left > CYCLE_LIMIT:
+            key = (s.task, s.pending, (day0 + s.t) // 1440, s.cycle)
+        else:
+            key = (s.task, s.pending)
+        clocks = (s.t, -s.done, s.drive, s.window, s.since_break,
+                  s.p_drive, s.p_window, s.fuel_miles)
+        front = seen.setdefault(key, [])
+        for other in front:
+            if all(a <= b for a, b in zip(other, clocks)):
+                return True
+        front[:] = [other for other in front if not all(a <= b for a, b in zip(clocks, other))]
+        front.append(clocks)
+        return False
+
+    def visit(s):
+        nonlocal nodes
+        while True:
+            if s.task == len(tasks):
+                if s.t < best[0]:
+                    best[0], best[1] = s.t, s
+                return
+            nodes += 1
+            if nodes > MAX_NODES or bound(s) >= best[0] or dominated(s):
+                return
+
+            task = tasks[s.task]
+            if task[0] == 'dwell':
+                _work(s, task[1], False, 0, task[2], day0)
+                s.task += 1
+                if not 1 < s.task < len(tasks):
+                    continue
+                # Between stops the driver may also start or finish a split
+                for option in STOP_OPTIONS:
+                    child = s.copy()
+                    if option:
+                        _rest(child, option, day0)
+                    visit(child)
+                return
+
+            _, minutes, miles, label = task
+            per_minute = miles / minutes
+            avail = min(
+                minutes - s.done,
+                DRIVE_LIMIT - s.drive,
+                WINDOW_LIMIT - s.window,
+                BREAK_AFTER - s.since_break,
+                CYCLE_LIMIT - sum(s.cycle),
+                math.ceil((FUEL_MILES - s.fuel_miles) / per_minute),
+            )
+            if avail > 0:
+                _work(s, avail, True, avail * per_minute, label, day0)
+                s.done += avail
+                if s.done == minutes:
+                    s.task, s.done = s.task + 1, 0
+                continue
+
+            if s.fuel_miles >= FUEL_MILES:
+                _work(s, 30, False, 0, 'Fueling stop', day0)
+                s.fuel_miles = 0
+                continue
+            if sum(s.cycle) >= CYCLE_LIMIT:
+                _rest(s, 'restart', day0)
+                continue
+            if s.drive >= DRIVE_LIMIT or s.window >= WINDOW_LIMIT:
+                options = LIMIT_OPTIONS
+            else:
+                options = BREAK_OPTIONS
+            for option in options:
+                child = s.copy()
+                _rest(child, option, day0)
+                visit(child)
+            return
+
+    visit(root)
+    return best[1], nodes
+
+def _actions_to_logs(actions, start):
+    """Unwind the action chain into log entries, split at midnight."""
+    chain = []
+    while actions:
+        actions, action = actions
+        chain.append(action)
+    chain.reverse()
+
+    logs = []
+    current = start
+    for status, minutes, remarks, miles in chain:
+        end = current + timedelta(minutes=minutes)
+        day_start = current
+        while day_start.date() != end.date():
+            midnight = datetime.combine(day_start.date() + timedelta(days=1), datetime.min.time())
+            part = (midnight - day_start).total_seconds() / 60
+            if part > 1:
+                logs.append({
+                    'date': day_start.date(), 'status': status,
+                    'start_time': day_start.strftime('%H:%M:%S'), 'end_time': '23:59:59',
+                    'remarks': f'{remarks} (continued next day)', 'miles': miles * part / minutes,
+                })
+            day_start = midnight
+        part = (end - day_start).total_seconds() / 60
+        if part > 1 or day_start == current:
+            logs.append({
+                'date': day_start.date(), 'status': status,
+                'start_time': day_start.strftime('%H:%M:%S'), 'end_time': end.strftime('%H:%M:%S'),
+                'remarks': remarks if day_start == current else f'{remarks} (continued from previous day)',
+                'miles': miles * part / minutes,
+            })
+        current = end
+    return logs
+
+def plan_split_sleeper(leg_distances, stops, origin, rolling_window, start_time=None, departure=None,
+                       driving_hours_used=0, window_hours_used=0):
+    """
+    Fastest compliant schedule using 10-hour breaks or 8/2 and 7/3 sleeper
+    berth splits.
+
+    Arguments and result match services.plan_hos_schedule, with the cycle
+    history (`rolling_window`, 8 daily on-duty hours, today last) required.
+    Returns None if the search budget (MAX_NODES) runs out before any
+    schedule is complete.
+    """
+    logs = []
+    if departure is not None:
+        start = departure.replace(second=0, microsecond=0)
+    else:
+        if start_time is None:
+            start_time = datetime.now().replace(hour=6, minute=0, second=0, microsecond=0)
+        logs.append({
+            'date': start_time.date(), 'status': 'Off-Duty',
+            'start_time': start_time.strftime('%H:%M:%S'),
+            'end_time': (start_time + timedelta(minutes=360)).strftime('%H:%M:%S'),
+            'remarks': 'Home terminal time base', 'miles': 0,
+        })
+        start = start_time + timedelta(minutes=360)
+
+    tasks = _tasks(leg_distances, stops, origin)
+    plan, _ = _search(tasks, list(rolling_window), start.hour * 60 + start.minute,
+                      drive=round(driving_hours_used * 60), window=round(window_hours_used * 60))
+    if plan is None:
+        return None
+    logs += _actions_to_logs(plan.actions, start)
+    return {
+        'logs': logs,
+        'finish': start + timedelta(minutes=plan.t),
+        'cycle_hours_8_day': sum(plan.cycle) / 60,
+    }
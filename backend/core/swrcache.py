@@ -0,0 +1,84 @@
+"""
+Stale-while-revalidate cache entries.
+
+Values are stored with a soft expiry inside the entry and the hard expiry as
+the cache timeout. Past the soft expiry `lookup` still returns the value,
+flagged stale, and the caller schedules `refresh` to fetch a new one in the
+background, so hot keys are refreshed before they ever miss. Refreshes run
+on a small thread pool, at most one per key across workers (through a lock
+in the cache), and are dropped when too many are queued. Soft expiries are
+jittered so entries cached together do not all go stale together.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+
+from .singleflight import flights
+
+SOFT_TTL = 60*60*24
+HARD_TTL = 60*60*24*7
+JITTER = 0.1  # soft expiry varies by up to this fraction of the TTL
+REFRESH_WORKERS = 4
+MAX_PENDING_REFRESHES = 64
+REFRESH_LOCK_TIMEOUT = 60
+
+_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+_pending = set()
+_pending_lock = threading.Lock()
+
+def store(key, value, soft_ttl=SOFT_TTL, hard_ttl=HARD_TTL):
+    soft = soft_ttl * (1 + random.uniform(-JITTER, JITTER))
+    cache.set(key, {'value': value, 'stale_at': time.time() + soft}, hard_ttl)
+
+def lookup(key):
+    """(value, stale) for a cached key, or (None, False) on a miss."""
+    entry = cache.get(key)
+    if entry is None:
+        return None, False
+    if not isinstance(entry, dict) or 'stale_at' not in entry:
+        # Stored before entries had a soft expiry
+        return entry, True
+    return entry['value'], time.time() >= entry['stale_at']
+
+def refresh(key, fetch):
+    """
+    Run `fetch` (which stores the new value with `store`) in the background,
+    unless a refresh of `key` is already pending here or in another worker.
+    Returns True if a refresh was scheduled.
+    """
+    with _pending_lock:
+        if key in _pending or len(_pending) >= MAX_PENDING_REFRESHES:
+            return False
+        _pending.add(key)
+    if not cache.add(f"refresh_{key}", 1, REFRESH_LOCK_TIMEOUT):
+        with _pending_lock:
+            _pending.discard(key)
+        return False
+    _pool.submit(_run_refresh, key, fetch)
+    return True
+
+def _run_refresh(key, fetch):
+    try:
+        fetch()
+    except Exception as e:
+        print(f"Cache refresh error for {key}: {e}")
+    finally:
+        cache.delete(f"refresh_{key}")
+        with _pending_lock:
+            _pending.discard(key)
+
+def get_or_fetch(key, fetch):
+    """
+    The cached value for `key`, refreshing it in the background if stale.
+    On a miss, fetch() is called (once for concurrent callers) and its
+    result returned.
+    """
+    value, stale = lookup(key)
+    if value is not None:
+        if stale:
+            refresh(key, fetch)
+        return value
+    return flights.do(key, fetch, read=lambda k: lookup(k)[0])
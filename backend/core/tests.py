@@ -1,3 +1,1282 @@
-from django.test import TestCase
+import base64
+import cProfile
+import decimal
+import gzip
+import heapq
+import io
+import itertools
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+import brotli
+import polyline
+from pypdf import PdfReader
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError
+from django.http import HttpResponse, JsonResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import admission, archive, swrcache
+from .admission import Lane
+from .assignment import assign_loads, hungarian
+from .compact import decode_day, encode_day, read_day, status_minutes, store_days
+from .exports import export_logs_pdf, plan_export_parts
+from .geocoding import NominatimGeocoder
+from .geometry import (FULL_TIER, ROUTE_TIERS, RouteIndex, build_route_tiers, haversine_miles, join_route_tiers,
+                       simplify_polyline)
+from .history import event_check_value, file_check_value, line_check_value, stream_history
+from .middleware import CompressionMiddleware
+from .ingest import EventBuffer, EventError, parse_event
+from .media import _byte_range, hashed_name
+from .models import Driver, DriverEvent, LogEntry, Trip, TripStop
+from .optimizer import _path_cost, _valid, held_karp, local_search, optimize_stop_order
+from .profiling import list_reports, save_report
+from .roadgraph import HIGHWAY_SPEEDS, RoadGraph, build_road_graph
+from .renderers import FastJSONRenderer
+from .routing import OSRMRouter
+from .serializers import TripDetailSerializer, TripSerializer
+from .views import TripView
+from .services import (LOG_SHEET_FORM, calculate_grid_positions, compute_daily_totals, generate_log_pdf,
+                       locate_log_entries, make_stop, plan_hos_schedule, snap_stops_to_route)
+from .singleflight import SingleFlight
+from .sleeper import plan_split_sleeper
+from .truckstops import KDTree, TruckStopIndex, _unit_vector
+
+ROW_FIELDS = ('date', 'status', 'start_time', 'end_time', 'remarks')
+
+def planned_days():
+    """Logs of a fixed multi-day plan, grouped by day in row form."""
+    stops = [make_stop('Phoenix, AZ', (33.45, -112.07), 'pickup'),
+             make_stop('Dallas, TX', (32.78, -96.8), 'dropoff')]
+    plan = plan_hos_schedule([370, 1065], stops, 'Los Angeles, CA', 20,
+                             start_time=datetime(2025, 1, 6, 6), rolling_window=[3.0] * 7 + [0.0])
+    days = defaultdict(list)
+    for log in plan['logs']:
+        days[log['date']].append({k: log[k] for k in ROW_FIELDS})
+    return days
+
+class CompactDayTests(SimpleTestCase):
+    def test_round_trip_matches_rows(self):
+        for day, entries in planned_days().items():
+            runs, remarks = encode_day(entries)
+            self.assertEqual(decode_day(day, runs, remarks), entries)
+
+    def test_adjacent_entries_share_a_run(self):
+        entries = [
+            {'status': 'Driving', 'start_time': '06:00:00', 'end_time': '07:00:00', 'remarks': 'Drive to A'},
+            {'status': 'Driving', 'start_time': '07:00:00', 'end_time': '08:30:00', 'remarks': 'Drive to B'},
+            {'status': 'Off-Duty', 'start_time': '08:30:00', 'end_time': '23:59:59', 'remarks': 'Rest'},
+        ]
+        runs, remarks = encode_day(entries)
+        # Leading gap, one driving run, one off-duty run
+        self.assertEqual(len(runs), 6)
+        self.assertEqual([{k: e[k] for k in ('start_time', 'end_time', 'remarks')} for e in decode_day(None, runs, remarks)],
+                         [{k: e[k] for k in ('start_time', 'end_time', 'remarks')} for e in entries])
+        self.assertEqual(status_minutes(runs)['Driving'], 150)
+        self.assertEqual(status_minutes(runs)['Off-Duty'], 930)
+
+class StoredDayTests(TestCase):
+    def test_stored_days_match_log_entries(self):
+        trip = Trip.objects.create(current_location='Los Angeles, CA', pickup_location='Phoenix, AZ',
+                                   dropoff_location='Dallas, TX')
+        days = planned_days()
+        LogEntry.objects.bulk_create(LogEntry(trip=trip, **e) for entries in days.values() for e in entries)
+        rows = list(LogEntry.objects.filter(trip=trip).order_by('date', 'start_time').values(*ROW_FIELDS))
+
+        store_days(trip, rows)
+        for day in days:
+            expected = [dict(r, start_time=r['start_time'].isoformat(), end_time=r['end_time'].isoformat())
+                        for r in rows if r['date'] == day]
+            self.assertEqual(read_day(trip.id, day), expected)
+        self.assertIsNone(read_day(trip.id, date(2000, 1, 1)))
+
+class FakeUpstream:
+    """Stands in for requests.Session.get, recording calls, overlap and the sessions used."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = Counter()
+        self.starts = []
+        self.in_flight = self.max_in_flight = 0
+        self.session_threads = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def get(self, session, url, params=None, timeout=None):
+        with self.lock:
+            self.calls[(url, tuple(sorted((params or {}).items())))] += 1
+            self.starts.append(time.monotonic())
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.session_threads[id(session)].add(threading.get_ident())
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        response = mock.Mock()
+        response.json.return_value = self.respond(url, params)
+        return response
+
+class ConcurrentLookupTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def run_concurrently(self, fn, args, threads=64):
+        with ThreadPoolExecutor(threads) as pool:
+            return list(pool.map(fn, args))
+
+    def test_concurrent_geocodes(self):
+        fake = FakeUpstream(lambda url, params: [{'lat': str(len(params['q'])), 'lon': '1.0', 'display_name': params['q']}])
+        geocoder = NominatimGeocoder()
+        geocoder.upstream.min_interval = 0.002
+        names = [f'City {i:02d}, ST' for i in range(40)] * 10
+        with mock.patch('requests.Session.get', lambda session, *a, **kw: fake.get(session, *a, **kw)):
+            results = self.run_concurrently(geocoder.geocode, names)
+
+        self.assertEqual(results, [(float(len(name)), 1.0) for name in names])
+        # One upstream call per distinct name, never more in flight than allowed
+        self.assertEqual(len(fake.calls), 40)
+        self.assertEqual(set(fake.calls.values()), {1})
+        self.assertLessEqual(fake.max_in_flight, geocoder.upstream.max_concurrency)
+        # Calls were spaced out by the rate limit
+        self.assertGreaterEqual(max(fake.starts) - min(fake.starts), 39 * geocoder.upstream.min_interval)
+        # Sessions are never shared between threads
+        self.assertTrue(all(len(threads) == 1 for threads in fake.session_threads.values()))
+
+    def test_concurrent_routes(self):
+        def respond(url, params):
+            (lon1, lat1), (lon2, lat2) = (map(float, p.split(',')) for p in url.rsplit('/', 1)[1].split(';'))
+            return {'code': 'Ok', 'routes': [{
+                'distance': lat2 * 1609.34, 'duration': 3600,
+                'geometry': polyline.encode([(lat1, lon1), (lat2, lon2)]),
+            }]}
+
+        fake = FakeUpstream(respond)
+        router = OSRMRouter()
+        lanes = [((30.0, -90.0), (31.0 + i, -91.0)) for i in range(20)] * 10
+        with mock.patch('requests.Session.get', lambda session, *a, **kw: fake.get(session, *a, **kw)):
+            results = self.run_concurrently(lambda lane: router.get_route(*lane), lanes)
+
+        self.assertEqual([round(r['distance'], 6) for r in results], [round(dest[0], 6) for _, dest in lanes])
+        self.assertEqual([r['coordinates'][-1] for r in results], [dest for _, dest in lanes])
+        self.assertEqual(len(fake.calls), 20)
+        self.assertEqual(set(fake.calls.values()), {1})
+        self.assertLessEqual(fake.max_in_flight, router.upstream.max_concurrency)
+        self.assertTrue(all(len(threads) == 1 for threads in fake.session_threads.values()))
+
+class AdmissionLaneTests(SimpleTestCase):
+    def test_queue_then_reject_with_estimate(self):
+        lane = Lane('test', limit=2, queue=2, max_wait=5.0, service_time=0.1)
+        self.assertIsNone(lane.acquire())
+        self.assertIsNone(lane.acquire())
+        results = []
+        waiters = [threading.Thread(target=lambda: results.append(lane.acquire())) for _ in range(2)]
+        for t in waiters:
+            t.start()
+        while lane.waiting < 2:
+            time.sleep(0.01)
+        # Queue full: rejected at once with a positive retry estimate
+        self.assertGreater(lane.acquire(), 0)
+        lane.release(0.1)
+        lane.release(0.1)
+        for t in waiters:
+            t.join()
+        self.assertEqual(results, [None, None])
+        self.assertEqual(lane.in_flight, 2)
+
+    def test_rejects_when_expected_wait_exceeds_deadline(self):
+        lane = Lane('test', limit=1, queue=10, max_wait=1.0, service_time=3.0)
+        self.assertIsNone(lane.acquire())
+        start = time.monotonic()
+        self.assertEqual(lane.acquire(), 3.0)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+class ProfileReportTests(SimpleTestCase):
+    def test_directory_stays_under_limit(self):
+        profiler = cProfile.Profile()
+        profiler.runcall(planned_days)
+        request = RequestFactory().get('/api/drivers/')
+        request.resolver_match = None
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILE_DIR=directory, PROFILE_MAX_BYTES=10**9):
+                size = os.path.getsize(os.path.join(directory, save_report(profiler, request, 0.1)))
+            with override_settings(PROFILE_DIR=directory, PROFILE_MAX_BYTES=size * 3):
+                names = [save_report(profiler, request, 0.1) for _ in range(5)]
+                reports = list_reports()
+            self.assertEqual(len(reports), 3)
+            self.assertEqual(reports[0]['name'], names[-1])
+
+class IngestTests(TestCase):
+    def setUp(self):
+        self.driver = Driver.objects.create(name='Ann', current_location='Denver, CO')
+
+    def event_line(self, minute, **extra):
+        return '{"driver": %d, "ts": "2025-01-06T06:%02d:00", "status": "Driving"%s}' % (
+            self.driver.id, minute, ''.join(f', "{k}": {v}' for k, v in extra.items()))
+
+    def test_non_numeric_fields_are_rejected(self):
+        for field in ('lat', 'lon', 'odometer'):
+            with self.assertRaises(EventError):
+                parse_event(self.event_line(0, **{field: '"abc"'}))
+        event = parse_event(self.event_line(0, lat='"39.7"', lon=-104.9, odometer=1200))
+        self.assertEqual((event['lat'], event['lon'], event['odometer_miles']), (39.7, -104.9, 1200.0))
+
+    def test_bad_row_does_not_drop_the_batch(self):
+        events = [parse_event(self.event_line(i, lat=39.7, lon=-104.9 - i)) for i in range(5)]
+        # Bypasses parse_event, as a row the database rejects would
+        events.append(dict(events[-1], lat='abc'))
+        buffer = EventBuffer(flush_size=len(events))
+        with self.assertLogs('core.ingest', 'WARNING') as logs:
+            buffer.add(events)
+        self.assertIn('Dropped ELD event', logs.output[-1])
+        self.assertEqual(DriverEvent.objects.filter(driver=self.driver).count(), 5)
+        self.driver.refresh_from_db()
+        self.assertEqual(self.driver.current_location_coords, [39.7, -108.9])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_failed_flush_keeps_events_buffered(self):
+        events = [parse_event(self.event_line(i)) for i in range(3)]
+        buffer = EventBuffer(flush_size=len(events))
+        with mock.patch.object(Driver.objects, 'select_for_update', side_effect=OperationalError("down")):
+            with self.assertRaises(OperationalError):
+                buffer.add(events)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(DriverEvent.objects.filter(driver=self.driver).count(), 3)
+
+    def test_unknown_drivers_are_reported(self):
+        body = '\n'.join([self.event_line(0), self.event_line(1).replace(f'"driver": {self.driver.id}', '"driver": 999'),
+                          'not json', '', self.event_line(2)])
+        with mock.patch('core.views.event_buffer') as buffer:
+            response = self.client.post('/api/eld/events/', body, content_type='application/x-ndjson',
+                                        HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['accepted'], 2)
+        self.assertEqual([(e['line'], e['error'].split(':')[0]) for e in response.json()['errors']],
+                         [(2, 'Unknown driver'), (3, 'Invalid event')])
+        self.assertEqual([e['driver_id'] for e in buffer.add.call_args.args[0]], [self.driver.id] * 2)
+
+class DepartureSweepTests(TestCase):
+    def test_timezone_aware_earliest(self):
+        coords = {'Los Angeles, CA': [34.05, -118.24], 'Phoenix, AZ': [33.45, -112.07], 'Dallas, TX': [32.78, -96.8]}
+        body = {'current_location': 'Los Angeles, CA', 'pickup_location': 'Phoenix, AZ',
+                'dropoff_location': 'Dallas, TX', 'current_cycle_hours': 10, 'hours': 1, 'step_minutes': 30}
+        with mock.patch('core.serializers.geocoder.geocode', side_effect=coords.get), \
+                mock.patch('core.departures.route_legs', return_value=([370, 1065], None, None)):
+            responses = [self.client.post('/api/trip/departures/', dict(body, earliest=earliest),
+                                          content_type='application/json', HTTP_HOST='localhost')
+                         for earliest in ('2025-01-06T06:00:00Z', '2025-01-06T01:00:00-05:00', '2025-01-06T06:00:00')]
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+        curves = [[slot['departure'] for slot in r.json()['curve']] for r in responses]
+        self.assertEqual(curves[0], curves[1])
+        self.assertEqual(curves[0], curves[2])
+        self.assertEqual(curves[0][0], '2025-01-06T06:00:00')
+
+class DriverListTests(TestCase):
+    def test_hours_left_from_one_clock_reading(self):
+        now = timezone.now()
+        Driver.objects.create(name='Ann', current_location='Denver, CO', duty_status=LogEntry.Status.DRIVING,
+                              status_since=now - timedelta(hours=3), driving_hours_used=2,
+                              window_started_at=now - timedelta(hours=4))
+        Driver.objects.create(name='Bob', current_location='Reno, NV', status_since=now - timedelta(hours=12),
+                              driving_hours_used=9, window_started_at=now - timedelta(hours=20))
+        with mock.patch.object(Driver, 'clocks', autospec=True, side_effect=Driver.clocks) as clocks:
+            response = self.client.get('/api/drivers/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(clocks.call_count, 2)
+        ann, bob = response.json()
+        self.assertAlmostEqual(ann['driving_hours_left'], 6.0, places=1)
+        self.assertAlmostEqual(ann['window_hours_left'], 10.0, places=1)
+        self.assertEqual((bob['driving_hours_left'], bob['window_hours_left']), (11.0, 14.0))
+
+class AssignFleetValidationTests(TestCase):
+    def test_driver_without_location_is_rejected(self):
+        located = Driver.objects.create(name='Ann', current_location='Denver, CO', current_location_coords=[39.7, -105.0])
+        unlocated = Driver.objects.create(name='Bob', current_location='')
+        body = {'loads': [{'pickup_location': 'Phoenix, AZ', 'dropoff_location': 'Dallas, TX'}],
+                'drivers': [located.id, unlocated.id]}
+        coords = {'Phoenix, AZ': [33.45, -112.07], 'Dallas, TX': [32.78, -96.8]}
+        with mock.patch('core.serializers.geocoder.geocode', side_effect=coords.get):
+            response = self.client.post('/api/fleet/assign/', body, content_type='application/json',
+                                        HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(unlocated.id), response.json()['drivers'][0])
+
+class ExportTests(TestCase):
+    def test_parts_concatenate_into_one_document(self):
+        from pypdf import PdfReader
+
+        days = planned_days()
+        trips = []
+        for _ in range(3):
+            trip = Trip.objects.create(current_location='Los Angeles, CA', pickup_location='Phoenix, AZ',
+                                       dropoff_location='Dallas, TX')
+            LogEntry.objects.bulk_create(LogEntry(trip=trip, **e) for entries in days.values() for e in entries)
+            trips.append(trip.id)
+        self.assertEqual(len(plan_export_parts(trips, pages_per_part=len(days))), 3)
+
+        out = io.BytesIO()
+        self.assertEqual(export_logs_pdf(out, trip_ids=trips, pages_per_part=len(days)), 3)
+        reader = PdfReader(io.BytesIO(out.getvalue()), strict=True)
+        self.assertEqual(len(reader.pages), 3 * len(days))
+        self.assertIn(f'Trip #{trips[2]}', reader.pages[-1].extract_text())
+
+class SnapStopsTests(SimpleTestCase):
+    def test_breaks_snap_only_to_stops_just_behind(self):
+        route = [(35.0, -118.0 + i * 0.1) for i in range(100)]
+        length = RouteIndex(route).length
+        index = mock.Mock()
+        index.corridor.return_value = [
+            {'name': 'A', 'kind': 'truck_stop', 'lat': 35.0, 'lon': -116.0, 'mile_marker': 100.0},
+            {'name': 'B', 'kind': 'rest_area', 'lat': 35.0, 'lon': -112.0, 'mile_marker': 400.0},
+        ]
+        logs = [{'status': 'Off Duty', 'remarks': '30-minute break', 'mile_marker': miles}
+                for miles in (50, 120, 300, 420)]
+        with mock.patch('core.services.get_truck_stop_index', return_value=index):
+            snap_stops_to_route(logs, route, length)
+        self.assertEqual([e.get('stop', {}).get('name') for e in logs], [None, 'A', None, 'B'])
+
+class LocateEntriesTests(SimpleTestCase):
+    # Along the equator: two one-degree segments, the second split in half
+    route = [(0.0, 0.0), (0.0, 1.0), (0.0, 1.5), (0.0, 2.0)]
+
+    def test_route_index_positions(self):
+        index = RouteIndex(self.route)
+        degree = index.cumulative[1]
+        self.assertAlmostEqual(degree, 69.09, places=1)
+        self.assertEqual([round(c / degree, 6) for c in index.cumulative], [0.0, 1.0, 1.5, 2.0])
+        self.assertEqual(index.locate(-1), (0.0, 0.0))
+        self.assertEqual(index.locate(index.length + 1), (0.0, 2.0))
+        self.assertEqual(index.locate(degree), (0.0, 1.0))
+        for miles, lon in ((degree / 4, 0.25), (degree * 1.25, 1.25), (degree * 1.75, 1.75)):
+            _, found = index.locate(miles)
+            self.assertAlmostEqual(found, lon)
+        self.assertEqual(index.locate_fraction(0.5), (0.0, 1.0))
+
+    def test_entries_are_placed_by_driven_miles(self):
+        logs = [
+            {'status': 'On-Duty', 'start_time': '06:00:00', 'end_time': '06:30:00'},
+            {'status': 'Driving', 'start_time': '06:30:00', 'end_time': '09:30:00'},
+            {'status': 'Off Duty', 'start_time': '09:30:00', 'end_time': '10:00:00'},
+            {'status': 'Driving', 'start_time': '10:00:00', 'end_time': '11:00:00'},
+            {'status': 'On-Duty', 'start_time': '11:00:00', 'end_time': '11:30:00'},
+            {'status': 'Total', 'start_time': '00:00:00', 'end_time': '24:00:00'},
+        ]
+        # Road miles differ from the geometry's length; positions go by fraction
+        locate_log_entries(logs, self.route, 200.0)
+        self.assertEqual([e['mile_marker'] for e in logs[:5]], [0.0, 0.0, 150.0, 150.0, 200.0])
+        self.assertEqual([e['location'] for e in logs[:5]],
+                         [[0.0, 0.0], [0.0, 0.0], [0.0, 1.5], [0.0, 1.5], [0.0, 2.0]])
+        self.assertNotIn('mile_marker', logs[-1])
+
+    def test_no_driving_stays_at_the_start(self):
+        logs = [{'status': 'Off Duty', 'start_time': '00:00:00', 'end_time': '10:00:00'}]
+        locate_log_entries(logs, self.route, 0)
+        self.assertEqual((logs[0]['mile_marker'], logs[0]['location']), (0.0, [0.0, 0.0]))
+
+class TruckStopIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        # A bending route from Los Angeles toward Phoenix and stops scattered around it
+        self.route = [(34.0 + 0.4 * math.sin(i / 15), -118.0 + i * 0.05) for i in range(120)]
+        self.stops = [{'name': f'S{i}', 'lat': rng.uniform(33.3, 34.7), 'lon': rng.uniform(-118.3, -111.8)}
+                      for i in range(400)]
+        self.index = TruckStopIndex(self.stops)
+
+    def test_ball_query_matches_brute_force(self):
+        points = self.index.tree.points
+        rng = random.Random(5)
+        for _ in range(20):
+            center = _unit_vector(rng.uniform(33.5, 34.5), rng.uniform(-118, -112))
+            radius = rng.uniform(0.001, 0.02)
+            expected = {i for i, p in enumerate(points) if math.dist(p, center) <= radius}
+            self.assertEqual(set(self.index.tree.query_ball(center, radius)), expected)
+
+    def test_small_trees(self):
+        self.assertEqual(KDTree([]).query_ball((1.0, 0.0, 0.0), 1.0), [])
+        self.assertEqual(KDTree([(1.0, 0.0, 0.0)]).query_ball((1.0, 0.0, 0.0), 0.0), [0])
+
+    def test_near_matches_haversine(self):
+        for lat, lon in self.route[::10]:
+            expected = {i for i, s in enumerate(self.stops) if haversine_miles((lat, lon), (s['lat'], s['lon'])) <= 20}
+            self.assertEqual(set(self.index.near(lat, lon, 20)), expected)
+
+    def test_corridor_matches_brute_force(self):
+        route = RouteIndex(self.route)
+        for radius in (2.0, 5.0, 10.0):
+            expected = []
+            for stop in self.stops:
+                off, _ = route.project((stop['lat'], stop['lon']))
+                if off <= radius:
+                    expected.append(stop['name'])
+            found = self.index.corridor(self.route, radius)
+            self.assertTrue(expected)
+            self.assertEqual(sorted(s['name'] for s in found), sorted(expected))
+            markers = [s['mile_marker'] for s in found]
+            self.assertEqual(markers, sorted(markers))
+            self.assertTrue(all(s['off_route_miles'] <= radius for s in found))
+
+    def test_empty_index(self):
+        self.assertEqual(TruckStopIndex([]).corridor(self.route), [])
+
+class RouteTierTests(SimpleTestCase):
+    def wiggly_route(self, n=2000, seed=7):
+        # A road heading east with bends from a few meters to a few kilometers
+        rng = random.Random(seed)
+        lat, route = 35.0, []
+        for i in range(n):
+            lat += rng.gauss(0, 0.0005) + (0.01 if i % 400 < 200 else -0.01) / 200
+            route.append((lat, -118.0 + i * 0.005))
+        return route
+
+    def test_tiers_keep_endpoints_and_shrink_with_tolerance(self):
+        route = self.wiggly_route()
+        tiers = build_route_tiers(route)
+        self.assertEqual(set(tiers), set(ROUTE_TIERS))
+        for coords in tiers.values():
+            self.assertEqual((coords[0], coords[-1]), (route[0], route[-1]))
+            # Simplification only drops points, in order
+            remaining = iter(route)
+            self.assertTrue(all(point in remaining for point in coords))
+        counts = [len(tiers[tier]) for tier in sorted(ROUTE_TIERS, key=ROUTE_TIERS.get, reverse=True)]
+        self.assertEqual(counts, sorted(counts))
+        self.assertLess(counts[0], counts[-1])
+        self.assertLess(counts[-1], len(route))
+
+    def test_short_and_straight_polylines(self):
+        self.assertEqual(simplify_polyline([(35.0, -118.0)], 100), [(35.0, -118.0)])
+        self.assertEqual(simplify_polyline([(35.0, -118.0), (35.0, -117.0)], 100), [(35.0, -118.0), (35.0, -117.0)])
+        line = [(35.0, -118.0 + i * 0.01) for i in range(50)]
+        self.assertEqual(simplify_polyline(line, 1), [line[0], line[-1]])
+
+    def test_joined_legs_drop_the_shared_point(self):
+        route = self.wiggly_route()
+        joined = join_route_tiers(build_route_tiers(route[:1000]), build_route_tiers(route[999:]))
+        for tier, coords in joined.items():
+            self.assertEqual((coords[0], coords[-1]), (route[0], route[-1]))
+            self.assertEqual(coords.count(route[999]), 1, tier)
+
+class RouteTierRequestTests(TestCase):
+    def test_unknown_route_tier_is_rejected(self):
+        body = {'current_location': 'Los Angeles, CA', 'pickup_location': 'Phoenix, AZ',
+                'dropoff_location': 'Dallas, TX', 'current_cycle_hours': 10}
+        response = self.client.post('/api/trip/?route_tier=street', body,
+                                    content_type='application/json', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+        for tier in (FULL_TIER, *ROUTE_TIERS):
+            self.assertIn(tier, response.json()['error'])
+        self.assertFalse(Trip.objects.exists())
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings = override_settings(ARCHIVE_DIR=os.path.join(self.tmp.name, 'archive'),
+                                     MEDIA_ROOT=os.path.join(self.tmp.name, 'media'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def make_trip(self, created_at):
+        trip = Trip.objects.create(current_location='Los Angeles, CA', pickup_location='Phoenix, AZ',
+                                   dropoff_location='Dallas, TX')
+        Trip.objects.filter(id=trip.id).update(created_at=created_at)
+        LogEntry.objects.bulk_create(LogEntry(trip=trip, **e) for entries in planned_days().values() for e in entries)
+        pdf = f'%PDF trip {trip.id}'.encode()
+        default_storage.save(f'logs/trip_{trip.id}_2025-01-06_abcdef012345.pdf', ContentFile(pdf))
+        return trip
+
+    def test_round_trip(self):
+        created = timezone.make_aware(datetime(2025, 1, 5, 12))
+        trips = [self.make_trip(created), self.make_trip(created)]
+        # A PDF saved before names carried the trip id, written just after the second trip
+        legacy = default_storage.save('logs/2025-01-06.pdf', ContentFile(b'%PDF legacy'))
+        stamp = (created + timedelta(seconds=30)).timestamp()
+        os.utime(default_storage.path(legacy), (stamp, stamp))
+        Trip.objects.filter(id=trips[0].id).update(created_at=created - timedelta(hours=1))
+        expected = {trip.id: json.loads(json.dumps(TripDetailSerializer(Trip.objects.get(id=trip.id)).data))
+                    for trip in trips}
+
+        self.assertEqual(archive.archive_trips(timezone.make_aware(datetime(2025, 2, 1))), {'2025-01': 2})
+        self.assertFalse(Trip.objects.exists())
+        self.assertEqual(default_storage.listdir('logs')[1], [])
+        for trip in trips:
+            self.assertEqual(archive.read_trip(trip.id), expected[trip.id])
+            self.assertEqual(archive.read_file(trip.id, f'trip_{trip.id}_2025-01-06_abcdef012345.pdf'),
+                             f'%PDF trip {trip.id}'.encode())
+        self.assertEqual(archive.read_file(trips[1].id, '2025-01-06.pdf'), b'%PDF legacy')
+        self.assertIsNone(archive.read_file(trips[0].id, '2025-01-06.pdf'))
+
+        # Archiving more trips into the same month keeps the earlier ones
+        later = self.make_trip(created)
+        archive.archive_trips(timezone.make_aware(datetime(2025, 2, 1)))
+        self.assertIsNotNone(archive.read_trip(later.id))
+        self.assertEqual(archive.read_trip(trips[0].id), expected[trips[0].id])
+
+    def test_empty_archive_file(self):
+        os.makedirs(os.path.join(self.tmp.name, 'archive'))
+        open(os.path.join(self.tmp.name, 'archive', '2025-01.tla'), 'wb').close()
+        with self.assertLogs('core.archive', 'WARNING') as logs:
+            self.assertIsNone(archive.read_trip(1))
+        self.assertIn('Not an archive file', logs.output[0])
+
+    def test_corrupt_archive_file(self):
+        os.makedirs(os.path.join(self.tmp.name, 'archive'))
+        with open(os.path.join(self.tmp.name, 'archive', '2025-01.tla'), 'wb') as f:
+            f.write(b'not an archive' * 10)
+        with self.assertLogs('core.archive', 'WARNING') as logs:
+            self.assertIsNone(archive.read_trip(1))
+        self.assertIn('2025-01.tla', logs.output[0])
+
+    def test_archived_trips_leave_the_list(self):
+        created = timezone.make_aware(datetime(2025, 1, 5, 12))
+        old, recent = self.make_trip(created), self.make_trip(timezone.now())
+        archive.archive_trips(timezone.make_aware(datetime(2025, 2, 1)))
+        response = self.client.get('/api/trips/', HTTP_HOST='localhost')
+        self.assertEqual([trip['id'] for trip in response.json()['results']], [recent.id])
+        self.assertEqual(self.client.get(f'/api/trips/{old.id}/', HTTP_HOST='localhost').status_code, 200)
+
+class TripCreateTests(TestCase):
+    def test_timezone_aware_departure(self):
+        coords = {'Los Angeles, CA': [34.05, -118.24], 'Phoenix, AZ': [33.45, -112.07], 'Dallas, TX': [32.78, -96.8]}
+        body = {'current_location': 'Los Angeles, CA', 'pickup_location': 'Phoenix, AZ',
+                'dropoff_location': 'Dallas, TX', 'current_cycle_hours': 10}
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                mock.patch('core.serializers.geocoder.geocode', side_effect=coords.get), \
+                mock.patch('core.services.router.get_multi_point_route', return_value=None):
+            responses = [self.client.post('/api/trip/', dict(body, departure_time=departure),
+                                          content_type='application/json', HTTP_HOST='localhost')
+                         for departure in ('2025-01-06T08:00:00Z', '2025-01-06T03:00:00-05:00')]
+        for response in responses:
+            self.assertEqual(response.status_code, 200, response.content)
+            pre_trip = next(log for log in response.json()['logs'] if log['status'] == 'On-Duty')
+            self.assertEqual((pre_trip['date'], pre_trip['start_time']), ('2025-01-06', '08:00:00'))
+
+    def test_failed_stop_insert_leaves_no_trip(self):
+        data = {'current_location': 'Los Angeles, CA', 'pickup_location': 'Phoenix, AZ', 'dropoff_location': 'Dallas, TX',
+                'stops': [{'location': 'Phoenix, AZ', 'location_coords': [33.45, -112.07], 'kind': 'pickup'}]}
+        with mock.patch.object(TripStop.objects, 'bulk_create', side_effect=OperationalError("disk full")):
+            with self.assertRaises(OperationalError):
+                TripSerializer().create(data)
+        self.assertFalse(Trip.objects.exists())
+
+def timed_trip_view(self, request):
+    """Stand-in for TripView.post: slow unless the request is marked cached."""
+    time.sleep(0.01 if request.data.get('cached') else 0.3)
+    return Response({})
+
+@override_settings(ADMISSION_LANES={'trip': {'limit': 2, 'queue': 2, 'max_wait': 1.0, 'service_time': 0.3}})
+class AdmissionMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        admission.lanes.clear()
+        self.addCleanup(admission.lanes.clear)
+
+    def post(self, body):
+        start = time.monotonic()
+        response = Client(HTTP_HOST='localhost').post('/api/trip/', body, content_type='application/json')
+        return response.status_code, response.get('Retry-After'), time.monotonic() - start
+
+    def test_overload_is_shed_and_cached_requests_skip_the_queue(self):
+        with mock.patch.object(TripView, 'post', timed_trip_view), \
+                mock.patch('core.admission.trip_is_cached', side_effect=lambda data: data.get('cached', False)):
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                # Three times what the lane can hold (2 in flight + 2 queued)
+                slow = [pool.submit(self.post, {'n': i}) for i in range(12)]
+                time.sleep(0.05)
+                cached = [pool.submit(self.post, {'cached': True}) for _ in range(4)]
+                slow, cached = [f.result() for f in slow], [f.result() for f in cached]
+
+        admitted = [elapsed for code, _, elapsed in slow if code == 200]
+        rejected = [(retry_after, elapsed) for code, retry_after, elapsed in slow if code == 429]
+        self.assertEqual(len(admitted), 4)
+        self.assertEqual(len(rejected), 8)
+        # Rejections are immediate and say when to come back
+        for retry_after, elapsed in rejected:
+            self.assertGreaterEqual(int(retry_after), 1)
+            self.assertLess(elapsed, 0.2)
+        # Admitted requests wait at most one service time in the queue
+        self.assertLess(max(admitted), 0.3 * 2 + 0.3)
+        # Cached requests are not stuck behind the full lane
+        self.assertEqual([code for code, _, _ in cached], [200] * 4)
+        self.assertLess(max(elapsed for _, _, elapsed in cached), 0.2)
+
+    @override_settings(ADMISSION_LANES={'trip': {'limit': 1, 'queue': 0}})
+    def test_streaming_export_holds_its_slot(self):
+        rendered = []
+
+        def stream_export(parts, start_date, end_date):
+            for part in parts:
+                rendered.append(part)
+                yield b'%PDF part'
+
+        client = Client(HTTP_HOST='localhost')
+        url = '/api/logs/export/?trips=1'
+        with mock.patch('core.views.plan_export_parts', return_value=[1, 2]), \
+                mock.patch('core.views.stream_export', stream_export):
+            first = client.get(url)
+            self.assertEqual(first.status_code, 200)
+            # The view has returned but nothing is rendered yet: the slot is still taken
+            self.assertEqual(client.get(url).status_code, 429)
+            self.assertEqual(b''.join(first.streaming_content), b'%PDF part' * 2)
+            self.assertEqual(rendered, [1, 2])
+            second = client.get(url)
+            self.assertEqual(second.status_code, 200)
+            # A response closed before it is sent gives the slot back too
+            second.close()
+            self.assertEqual(client.get(url).status_code, 200)
+
+class EldOutputTests(TestCase):
+    def test_check_values(self):
+        # A, B, C map to 17, 18, 19: 54 = 0x36, rotated left 3 bits is 0xB1
+        self.assertEqual(line_check_value('ABC'), '27')  # 0xB1 ^ 0x96
+        self.assertEqual(event_check_value('A', 'BC'), '72')  # 0xB1 ^ 0xC3
+        # a maps to 49 = 0x31, rotated 0x89; 0, comma and dash count as 0
+        self.assertEqual(line_check_value('a0,-'), '1F')  # 0x89 ^ 0x96
+        self.assertEqual(file_check_value(0x27), '97A4')  # 0x0138 ^ 0x969C
+
+    @override_settings(ELD_CARRIER_USDOT='123456', ELD_CARRIER_NAME='Acme, Inc', ELD_REGISTRATION_ID='AB12',
+                       ELD_IDENTIFIER='TL0001')
+    def test_file_layout(self):
+        driver = Driver.objects.create(name='Ann Marie Smith', current_location='Denver, CO',
+                                       current_location_coords=[39.7392, -104.9903])
+        trip = Trip.objects.create(current_location='Los Angeles, CA', pickup_location='Phoenix, AZ',
+                                   dropoff_location='Dallas, TX', driver=driver)
+        LogEntry.objects.bulk_create(LogEntry(trip=trip, **e) for entries in planned_days().values() for e in entries)
+
+        lines = ''.join(stream_history('eld', [trip.id])).split('\r\n')
+        self.assertEqual(lines[-1], '')
+        lines = lines[:-1]
+        self.assertEqual(lines[0], 'ELD File Header Segment:')
+        header = [line.rsplit(',', 1)[0] for line in lines[1:8]]
+        self.assertEqual(header[0], f'Smith,Ann Marie,{driver.id},,')
+        self.assertEqual(header[3], '123456,Acme  Inc,8,000000,00')
+        self.assertRegex(header[5], r'^\d{6},\d{6},39.74,-104.99,,$')
+        self.assertEqual(header[6], 'AB12,TL0001,,')
+        self.assertEqual(lines[8:10], ['User List:', f'1,D,Smith,Ann Marie,{line_check_value("1,D,Smith,Ann Marie")}'])
+
+        events = lines[lines.index('ELD Event List:') + 1:lines.index('ELD Event Annotations or Comments:')]
+        self.assertEqual(len(events), LogEntry.objects.filter(trip=trip).count())
+        fields = events[0].split(',')
+        self.assertEqual(len(fields), 18)
+        self.assertEqual(fields[:4], ['0', '1', '2', '1'])
+        self.assertEqual(fields[16], event_check_value(*fields[3:7], fields[12], str(driver.id)))
+
+        # Every data line ends in its check value, and the file check covers them all
+        data_lines = [line for line in lines[:-2] if not line.endswith(':')]
+        for line in data_lines:
+            text, check = line.rsplit(',', 1)
+            self.assertEqual(check, line_check_value(text))
+        self.assertEqual(lines[-2:], ['End of File:', file_check_value(sum(int(l[-2:], 16) for l in data_lines))])
+
+class MediaTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(MEDIA_ROOT=tmp.name, MEDIA_ACCEL_REDIRECT='', MEDIA_SENDFILE=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = bytes(range(256)) * 4
+        self.name = hashed_name('trip_1_2025-01-06.pdf', self.content)
+        with open(os.path.join(tmp.name, self.name), 'wb') as f:
+            f.write(self.content)
+        self.client = Client(HTTP_HOST='localhost')
+
+    def get(self, **headers):
+        response = self.client.get(f'/media/{self.name}', **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_byte_range(self):
+        self.assertEqual(_byte_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(_byte_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(_byte_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(_byte_range('bytes=500-5000', 1000), (500, 999))
+        self.assertEqual(_byte_range('bytes=-5000', 1000), (0, 999))
+        self.assertIs(_byte_range('bytes=1000-', 1000), False)
+        self.assertIs(_byte_range('bytes=-0', 1000), False)
+        self.assertIs(_byte_range('bytes=20-10', 1000), False)
+        # Malformed or multiple ranges: serve the whole file
+        self.assertIsNone(_byte_range('bytes=-', 1000))
+        self.assertIsNone(_byte_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(_byte_range('items=0-1', 1000))
+
+    def test_full_and_not_modified(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+
+        response, body = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(response['ETag'], etag)
+        response, _ = self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        response, body = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '100')
+
+        response, body = self.get(HTTP_RANGE='bytes=-24')
+        self.assertEqual((response.status_code, body), (206, self.content[-24:]))
+
+        response, _ = self.get(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, body), (206, self.content[:10]))
+        # A stale validator gets the whole current file
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_missing_and_outside_root(self):
+        self.assertEqual(self.client.get('/media/nope.pdf').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+def random_matrix(n, seed):
+    rng = random.Random(seed)
+    return [[0.0 if i == j else rng.uniform(1, 100) for j in range(n + 1)] for i in range(n + 1)]
+
+def best_order(matrix, n, pickups):
+    """Cheapest valid order by trying every permutation."""
+    orders = [list(o) for o in itertools.permutations(range(1, n + 1)) if _valid(o, pickups)]
+    return min(orders, key=lambda o: _path_cost(o, matrix))
+
+class OptimizerTests(SimpleTestCase):
+    def test_held_karp_matches_brute_force(self):
+        for seed in range(5):
+            for pickups in (set(), {2}, {1, 4}):
+                matrix = random_matrix(6, seed)
+                orders = held_karp(matrix, 6, pickups)
+                self.assertAlmostEqual(_path_cost(orders[0], matrix),
+                                       _path_cost(best_order(matrix, 6, pickups), matrix))
+                self.assertTrue(all(_valid(o, pickups) for o in orders))
+                self.assertEqual(len({o[-1] for o in orders}), len(orders))
+
+    def test_local_search_keeps_pickups_first(self):
+        matrix = random_matrix(7, 1)
+        orders = local_search(matrix, 7, {3, 5}, restarts=6)
+        self.assertTrue(all(_valid(o, {3, 5}) and sorted(o) == list(range(1, 8)) for o in orders))
+        optimum = _path_cost(best_order(matrix, 7, {3, 5}), matrix)
+        self.assertGreaterEqual(_path_cost(orders[0], matrix), optimum - 1e-9)
+
+    def test_stops_along_a_line(self):
+        # The pickup is the farthest stop, so the drops are made on the way back
+        stops = [make_stop(f'Stop {lon}', (35.0, -100.0 + lon), kind)
+                 for lon, kind in ((3, 'dropoff'), (1, 'stop'), (4, 'pickup'), (2, 'stop'))]
+        with mock.patch('core.optimizer.router.get_distance_matrix', return_value=None):
+            result = optimize_stop_order('Origin', (35.0, -100.0), stops,
+                                         start_time=datetime(2025, 1, 6, 6), workers=1)
+        self.assertEqual(result['method'], 'dp')
+        self.assertEqual(result['order'], [2, 0, 3, 1])
+
+class SleeperPlanTests(SimpleTestCase):
+    departure = datetime(2025, 1, 6, 6)
+
+    def plan(self, miles, dwell=0):
+        stops = [make_stop('Dallas, TX', (32.78, -96.8), 'dropoff', dwell)]
+        plan = plan_split_sleeper([miles], stops, 'Phoenix, AZ', [0] * 8, departure=self.departure)
+        return plan, (plan['finish'] - self.departure).total_seconds() / 60
+
+    def test_short_trip_needs_no_rest(self):
+        plan, minutes = self.plan(300, dwell=60)
+        self.assertEqual(minutes, 30 + 300 + 60)
+        self.assertEqual([e['status'] for e in plan['logs']], ['On-Duty', 'Driving', 'On-Duty'])
+
+    def test_split_replaces_the_30_minute_break(self):
+        # 16 hours of driving need 10 hours of rest; taking the 2 hours off
+        # at the 8-hour mark as the first half of an 8/2 split also covers
+        # the 30-minute break, which no schedule can beat
+        plan, minutes = self.plan(960)
+        self.assertEqual(minutes, 30 + 960 + 600)
+        rests = [e['remarks'] for e in plan['logs'] if e['status'] in ('Off-Duty', 'Sleeper Berth')]
+        self.assertTrue(any(r.startswith('8-hour sleeper berth break') for r in rests))
+        self.assertTrue(any(r.startswith('2-hour break (8/2 split)') for r in rests))
+        driving = [e for e in plan['logs'] if e['status'] == 'Driving']
+        self.assertAlmostEqual(sum(e['miles'] for e in driving), 960)
+
+        with mock.patch.multiple('core.sleeper', LIMIT_OPTIONS=('off10',),
+                                 BREAK_OPTIONS=('break30',), STOP_OPTIONS=(None,)):
+            _, without_split = self.plan(960)
+        self.assertEqual(without_split, minutes + 30)
+
+    def test_never_later_than_the_standard_schedule(self):
+        stops = [make_stop('Phoenix, AZ', (33.45, -112.07), 'pickup'),
+                 make_stop('Dallas, TX', (32.78, -96.8), 'dropoff')]
+        for legs, cycle_hours in (([370, 1065], 20), ([370, 1065], 60), ([3000, 3000], 69.5), ([700, 900], 0)):
+            rolling_window = [cycle_hours / 7] * 7 + [0.0]
+            plans = [plan_hos_schedule(legs, stops, 'Los Angeles, CA', cycle_hours, use_sleeper_berth=berth,
+                                       start_time=self.departure, rolling_window=rolling_window)
+                     for berth in (False, True)]
+            standard, sleeper = plans
+            self.assertLessEqual(sleeper['finish'], standard['finish'])
+            # Without a berth period the flag changes nothing
+            if not any(log['status'] == 'Sleeper Berth' for log in sleeper['logs']):
+                self.assertEqual(sleeper, standard)
+
+    def test_search_budget_falls_back_to_the_standard_schedule(self):
+        stops = [make_stop('Dallas, TX', (32.78, -96.8), 'dropoff', 0)]
+        with mock.patch('core.sleeper.MAX_NODES', 0):
+            self.assertIsNone(plan_split_sleeper([960], stops, 'Phoenix, AZ', [0] * 8, departure=self.departure))
+            sleeper = plan_hos_schedule([960], stops, 'Phoenix, AZ', 0, use_sleeper_berth=True,
+                                        rolling_window=[0] * 8, departure=self.departure)
+        standard = plan_hos_schedule([960], stops, 'Phoenix, AZ', 0, rolling_window=[0] * 8,
+                                     departure=self.departure)
+        self.assertEqual(sleeper, standard)
+
+def grid_osm(path, size, seed):
+    """An OSM extract of a `size` x `size` street grid with random road classes and one-way streets."""
+    rng = random.Random(seed)
+    classes = sorted(HIGHWAY_SPEEDS)
+    lines = ['<osm version="0.6">']
+    for r in range(size):
+        for c in range(size):
+            lines.append(f'<node id="{r * size + c + 1}" lat="{35 + r * 0.01}" lon="{-100 + c * 0.01}"/>')
+    # An isolated one-way road, unreachable from the grid
+    lines.append('<node id="1001" lat="35.2" lon="-99.8"/><node id="1002" lat="35.21" lon="-99.8"/>')
+    way = 1
+    for r in range(size):
+        for c in range(size):
+            for r2, c2 in ((r + 1, c), (r, c + 1)):
+                if r2 < size and c2 < size:
+                    oneway = 'yes' if rng.random() < 0.2 else 'no'
+                    lines.append(f'<way id="{way}"><nd ref="{r * size + c + 1}"/><nd ref="{r2 * size + c2 + 1}"/>'
+                                 f'<tag k="highway" v="{rng.choice(classes)}"/><tag k="oneway" v="{oneway}"/></way>')
+                    way += 1
+    lines.append(f'<way id="{way}"><nd ref="1001"/><nd ref="1002"/><tag k="highway" v="primary"/>'
+                 '<tag k="oneway" v="yes"/></way>')
+    lines.append('</osm>')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+
+def dijkstra(graph, source):
+    indptr, neighbour, time, _ = graph.fwd
+    dist, heap = {source: 0.0}, [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for e in range(indptr[u], indptr[u + 1]):
+            nd = d + time[e]
+            if nd < dist.get(neighbour[e], math.inf):
+                dist[neighbour[e]] = nd
+                heapq.heappush(heap, (nd, neighbour[e]))
+    return dist
+
+class RoadGraphTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        osm_path, graph_path = os.path.join(tmp.name, 'grid.osm'), os.path.join(tmp.name, 'grid.graph')
+        grid_osm(osm_path, 6, seed=3)
+        build_road_graph(osm_path, graph_path, cell_size=0.02)
+        self.graph = RoadGraph(graph_path)
+
+    def edge(self, u, v):
+        indptr, neighbour, time, length = self.graph.fwd
+        return min((time[e], length[e]) for e in range(indptr[u], indptr[u + 1]) if neighbour[e] == v)
+
+    def test_matches_dijkstra(self):
+        graph = self.graph
+        for source in range(graph.n):
+            dist = dijkstra(graph, source)
+            for target in range(graph.n):
+                found = graph.shortest_path(source, target)
+                if target not in dist:
+                    self.assertIsNone(found)
+                    continue
+                path, seconds, meters = found
+                self.assertAlmostEqual(seconds, dist[target], places=3)
+                self.assertEqual((path[0], path[-1]), (source, target))
+                edges = [self.edge(u, v) for u, v in zip(path, path[1:])]
+                self.assertAlmostEqual(sum(t for t, _ in edges), seconds, places=3)
+                self.assertAlmostEqual(sum(m for _, m in edges), meters, places=1)
+
+    def test_nearest_node(self):
+        node = self.graph.nearest_node(35.0301, -99.9699)
+        self.assertEqual(self.graph.coords(node), (35.03, -99.97))
+
+def best_assignment(cost):
+    """Cheapest total cost over every way of matching rows to columns."""
+    n, m = len(cost), len(cost[0])
+    if n <= m:
+        return min(sum(cost[i][j] for i, j in enumerate(cols)) for cols in itertools.permutations(range(m), n))
+    return min(sum(cost[i][j] for j, i in enumerate(rows)) for rows in itertools.permutations(range(n), m))
+
+class AssignmentTests(TestCase):
+    def test_hungarian_matches_brute_force(self):
+        rng = random.Random(7)
+        for n, m in ((1, 1), (4, 4), (5, 5), (3, 6), (6, 3)):
+            for _ in range(10):
+                # Small integers, so ties are common
+                cost = [[rng.randint(0, 9) for _ in range(m)] for _ in range(n)]
+                pairs = hungarian(cost)
+                self.assertEqual(len(pairs), min(n, m))
+                self.assertEqual(len({i for i, _ in pairs}), len(pairs))
+                self.assertEqual(len({j for _, j in pairs}), len(pairs))
+                self.assertEqual(sum(cost[i][j] for i, j in pairs), best_assignment(cost))
+
+    def test_each_driver_takes_the_nearby_load(self):
+        cities = {'Phoenix, AZ': [33.45, -112.07], 'Denver, CO': [39.74, -104.99], 'Dallas, TX': [32.78, -96.8]}
+        drivers = [Driver.objects.create(name=name, current_location=city, current_location_coords=coords)
+                   for name, (city, coords) in zip(('Ann', 'Bob', 'Cy'), cities.items())]
+        loads = [{
+            'pickup_location': city, 'pickup_coords': cities[city],
+            'dropoff_location': city, 'dropoff_coords': [cities[city][0] + 0.5, cities[city][1]],
+            'pickup_dwell_minutes': 60, 'dropoff_dwell_minutes': 60,
+        } for city in ('Dallas, TX', 'Phoenix, AZ', 'Denver, CO')]
+        loads[0]['deliver_by'] = datetime(2025, 1, 6, 6)
+        with mock.patch('core.assignment.router.get_distance_matrix', return_value=None), \
+                mock.patch('core.assignment.router.get_route', return_value=None):
+            result = assign_loads(drivers, loads, now=timezone.make_aware(datetime(2025, 1, 6, 8)), workers=1)
+        self.assertEqual(sorted((a['driver'], a['load']) for a in result['assignments']), [(0, 1), (1, 2), (2, 0)])
+        self.assertTrue(all(a['deadhead_miles'] == 0 for a in result['assignments']))
+        self.assertEqual((result['late'], result['unassigned'], result['evaluated']), (1, [], 9))
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight(lock_timeout=2, poll_interval=0.01)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(2)
+            return 'value'
+
+        with ThreadPoolExecutor(16) as pool:
+            futures = [pool.submit(self.flight.do, 'key', fetch) for _ in range(16)]
+            time.sleep(0.05)
+            release.set()
+            results = [f.result() for f in futures]
+        self.assertEqual(results, ['value'] * 16)
+        self.assertEqual(len(calls), 1)
+        # The key is free again, so a later call fetches anew
+        self.assertEqual(self.flight.do('key', lambda: 'new'), 'new')
+
+    def test_waiters_get_the_error(self):
+        started = threading.Event()
+
+        def fetch():
+            started.set()
+            time.sleep(0.05)
+            raise ValueError('upstream down')
+
+        with ThreadPoolExecutor(4) as pool:
+            leader = pool.submit(self.flight.do, 'key', fetch)
+            started.wait(2)
+            waiters = [pool.submit(self.flight.do, 'key', fetch) for _ in range(3)]
+            for future in [leader] + waiters:
+                with self.assertRaisesMessage(ValueError, 'upstream down'):
+                    future.result()
+
+    def test_waits_for_another_process(self):
+        # Another worker holds the lock and stores its result a little later
+        cache.add('flight_key', 1)
+        timer = threading.Timer(0.05, cache.set, ('key', 'theirs'))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        fetch = mock.Mock(return_value='ours')
+        self.assertEqual(self.flight.do('key', fetch), 'theirs')
+        fetch.assert_not_called()
+
+        # If the other worker gives up without a result, fetch here
+        cache.clear()
+        cache.add('flight_other', 1)
+        threading.Timer(0.05, cache.delete, ('flight_other',)).start()
+        self.assertEqual(self.flight.do('other', fetch), 'ours')
+        fetch.assert_called_once()
+
+class StaleCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def fetcher(self, value, delay=0.0):
+        calls = []
+
+        def fetch():
+            calls.append(threading.current_thread().name)
+            time.sleep(delay)
+            swrcache.store('key', value)
+            return value
+        return fetch, calls
+
+    def wait_for(self, value):
+        deadline = time.monotonic() + 2
+        while swrcache.lookup('key')[0] != value and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return swrcache.lookup('key')
+
+    def wait_for_refresh(self):
+        deadline = time.monotonic() + 2
+        while 'key' in swrcache._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_fresh_value_is_served_without_fetching(self):
+        swrcache.store('key', 'cached')
+        fetch, calls = self.fetcher('new')
+        self.assertEqual(swrcache.get_or_fetch('key', fetch), 'cached')
+        self.assertEqual(calls, [])
+
+    def test_miss_fetches_inline(self):
+        fetch, calls = self.fetcher('new')
+        self.assertEqual(swrcache.get_or_fetch('key', fetch), 'new')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(swrcache.lookup('key'), ('new', False))
+
+    def test_stale_value_is_served_while_one_refresh_runs(self):
+        swrcache.store('key', 'old', soft_ttl=-60)
+        fetch, calls = self.fetcher('new', delay=0.05)
+        results = [swrcache.get_or_fetch('key', fetch) for _ in range(5)]
+        self.assertEqual(results, ['old'] * 5)
+        self.assertEqual(self.wait_for('new'), ('new', False))
+        self.wait_for_refresh()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(calls[0].startswith('cache-refresh'))
+        # The refresh lock is released once done
+        self.assertNotIn('refresh_key', cache)
+
+    def test_failed_refresh_keeps_the_stale_value(self):
+        swrcache.store('key', 'old', soft_ttl=-60)
+        fetch = mock.Mock(side_effect=ConnectionError('upstream down'))
+        with mock.patch('builtins.print'):
+            self.assertEqual(swrcache.get_or_fetch('key', fetch), 'old')
+            self.wait_for_refresh()
+        fetch.assert_called_once()
+        self.assertEqual(swrcache.lookup('key'), ('old', True))
+
+    def test_entries_without_a_soft_expiry_are_stale(self):
+        cache.set('key', 'legacy')
+        self.assertEqual(swrcache.lookup('key'), ('legacy', True))
+
+class LogGridTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        trip = Trip.objects.create(current_location='Los Angeles, CA', pickup_location='Phoenix, AZ',
+                                   dropoff_location='Dallas, TX')
+        LogEntry.objects.bulk_create(
+            LogEntry(trip=trip, grid_positions=calculate_grid_positions(e), **e)
+            for entries in planned_days().values() for e in entries
+        )
+        self.url = f'/api/trips/{trip.id}/grid/2025-01-06'
+        self.client = Client(HTTP_HOST='localhost')
+
+    def test_svg_and_png(self):
+        response = self.client.get(f'{self.url}.svg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertTrue(response.content.startswith(b'<svg'))
+        # One block per entry of the day
+        self.assertEqual(response.content.count(b'opacity="0.7"'), len(planned_days()[date(2025, 1, 6)]))
+        png = self.client.get(f'{self.url}.png')
+        self.assertEqual(png['Content-Type'], 'image/png')
+        self.assertTrue(png.content.startswith(b'\x89PNG'))
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_not_modified(self):
+        etag = self.client.get(f'{self.url}.svg')['ETag']
+        response = self.client.get(f'{self.url}.svg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(f'{self.url}.svg', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_not_modified_after_gzip(self):
+        # GZipMiddleware weakens the ETag; the browser sends that weak tag back
+        response = self.client.get(f'{self.url}.svg', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        response = self.client.get(f'{self.url}.svg', HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(f'{self.url[:-10]}2025-13-01.svg').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url[:-10]}2025-02-01.svg').status_code, 404)
+        self.assertEqual(self.client.get('/api/trips/999/grid/2025-01-06.png').status_code, 404)
+
+class MillisecondEncoder(JSONEncoder):
+    """DRF's encoder as it was before 3.15, which cut datetimes and times to milliseconds."""
+    def default(self, obj):
+        value = super().default(obj)
+        if isinstance(obj, (datetime, dt_time)) and obj.microsecond:
+            value = value[:23] + value[26:] if isinstance(obj, datetime) else value[:12]
+        return value
+
+class RendererTests(TestCase):
+    data = {
+        'utc': datetime(2025, 1, 6, 8, 0, 0, 123456, tzinfo=dt_timezone.utc),
+        'offset': datetime(2025, 1, 6, 8, 0, 0, 123456, tzinfo=dt_timezone(timedelta(hours=-5))),
+        'naive': datetime(2025, 1, 6, 8, 30),
+        'date': date(2025, 1, 6),
+        'time': dt_time(8, 1, 2, 345678),
+        'duration': timedelta(hours=1.5),
+        'decimal': decimal.Decimal('1.10'),
+        'uuid': uuid.UUID(int=5),
+        'text': 'Caf\u00e9 \u2028 \u2029 "quoted"',
+        'nested': [{'lat': 33.45, 'lon': -112.07, 'miles': 0.1}, None, True, [], {}],
+        1: 2,
+    }
+
+    def test_matches_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        trip = Trip.objects.create(current_location='Los Angeles, CA', pickup_location='Phoenix, AZ',
+                                   dropoff_location='Dallas, TX')
+        LogEntry.objects.bulk_create(LogEntry(trip=trip, **e) for entries in planned_days().values() for e in entries)
+        data = TripDetailSerializer(Trip.objects.get(id=trip.id)).data
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_datetimes_follow_the_drf_encoder(self):
+        with mock.patch.object(FastJSONRenderer, '_encoder', MillisecondEncoder()), \
+                mock.patch.object(JSONRenderer, 'encoder_class', MillisecondEncoder):
+            fast, drf = FastJSONRenderer().render(self.data), JSONRenderer().render(self.data)
+        self.assertEqual(fast, drf)
+        self.assertIn(b'"2025-01-06T08:00:00.123Z"', fast)
+
+    def test_exponent_floats_parse_the_same(self):
+        data = [1e16, 1e-7, 12345678.9]
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+class CompressionTests(SimpleTestCase):
+    payload = {'route': [[33.45 + i / 1000, -112.07] for i in range(200)]}
+
+    def respond(self, accept, response=None):
+        request = RequestFactory().get('/api/trips/', HTTP_ACCEPT_ENCODING=accept)
+        response = response or JsonResponse(self.payload)
+        response['ETag'] = '"abc"'
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_negotiation(self):
+        body = JsonResponse(self.payload).content
+        for accept, encoding, decompress in (
+            ('gzip, deflate, br', 'br', brotli.decompress),
+            ('br;q=0, gzip', 'gzip', gzip.decompress),
+            ('gzip', 'gzip', gzip.decompress),
+        ):
+            response = self.respond(accept)
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertEqual(decompress(response.content), body)
+            self.assertEqual(response['Content-Length'], str(len(response.content)))
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(response['ETag'], 'W/"abc"')
+
+        response = self.respond('identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['ETag'], '"abc"')
+
+    def test_left_alone(self):
+        small = self.respond('br, gzip', JsonResponse({'ok': True}))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        pdf = self.respond('br, gzip', HttpResponse(b'%PDF' + b'0' * 4096, content_type='application/pdf'))
+        self.assertFalse(pdf.has_header('Content-Encoding'))
+        # Other types go to Django's gzip middleware
+        html = self.respond('br, gzip', HttpResponse('<p>hello</p>' * 200))
+        self.assertEqual(html['Content-Encoding'], 'gzip')
+
+class ReadApiTests(TestCase):
+    def setUp(self):
+        self.client = Client(HTTP_HOST='localhost')
+
+    def walk(self, url, key):
+        """Follow `next` links from `url`, then `previous` links back; returns both lists of `key`."""
+        forward, pages = [], []
+        while url:
+            page = self.client.get(url).json()
+            pages.append(page)
+            forward += [row[key] for row in page['results']]
+            url = page['next']
+        backward = []
+        url = pages[-1]['previous']
+        while url:
+            page = self.client.get(url).json()
+            backward = [row[key] for row in page['results']] + backward
+            url = page['previous']
+        return forward, backward + [row[key] for row in pages[-1]['results']], pages
+
+    def test_trip_pages_with_equal_created_at(self):
+        same = timezone.make_aware(datetime(2025, 1, 6, 12))
+        for i, created_at in enumerate([same] * 5 + [same - timedelta(hours=1), same + timedelta(hours=1)]):
+            trip = Trip.objects.create(current_location=f'Trip {i}', pickup_location='Phoenix, AZ',
+                                       dropoff_location='Dallas, TX')
+            Trip.objects.filter(id=trip.id).update(created_at=created_at)
+        expected = list(Trip.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        forward, backward, pages = self.walk('/api/trips/?page_size=2', 'id')
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 2, 1])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertIsNone(pages[-1]['next'])
+
+    def test_log_pages(self):
+        trip = Trip.objects.create(current_location='Los Angeles, CA', pickup_location='Phoenix, AZ',
+                                   dropoff_location='Dallas, TX')
+        LogEntry.objects.bulk_create(LogEntry(trip=trip, **e) for entries in planned_days().values() for e in entries)
+        other = Trip.objects.create(current_location='Elsewhere', pickup_location='A', dropoff_location='B')
+        LogEntry.objects.create(trip=other, date=date(2025, 1, 6), status='Driving',
+                                start_time='01:00:00', end_time='02:00:00', remarks='Other trip')
+        expected = list(LogEntry.objects.filter(trip=trip).order_by('date', 'start_time', 'id')
+                        .values_list('id', flat=True))
+        self.assertGreater(len(expected), 10)
+
+        forward, backward, _ = self.walk(f'/api/trips/{trip.id}/logs/?page_size=3', 'id')
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_missing_trip_and_bad_cursor(self):
+        self.assertEqual(self.client.get('/api/trips/999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/trips/999/logs/').status_code, 404)
+        for position in ('not json', '["2025-01-06"]', '["yesterday", 1]'):
+            cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            self.assertEqual(self.client.get('/api/trips/', {'cursor': cursor}).status_code, 404)
+
+class LogPdfTests(SimpleTestCase):
+    def test_one_page_per_day_with_shared_form(self):
+        logs = [entry for entries in planned_days().values() for entry in entries]
+        reader = PdfReader(generate_log_pdf(logs, None))
+        self.assertEqual(len(reader.pages), 3)
+
+        forms = set()
+        for page, (day, totals) in zip(reader.pages, sorted(compute_daily_totals(logs).items())):
+            # The static sheet is one form XObject stamped on every page, not redrawn
+            xobjects = page['/Resources']['/XObject']
+            forms.update(ref.idnum for name, ref in xobjects.items() if LOG_SHEET_FORM in name)
+            self.assertNotIn(b"DRIVER'S DAILY LOG", page.get_contents().get_data())
+
+            lines = page.extract_text().splitlines()
+            self.assertIn("DRIVER'S DAILY LOG", lines)
+            i = lines.index(f"Date: {day.strftime('%m/%d/%Y')}")
+            # Off duty, sleeper, driving and on duty totals, as drawn before the form was introduced
+            drawn = lines[i + 1:i + 5]
+            self.assertEqual(drawn, [f"{totals['totals'][key]:.1f}"
+                                     for key in ('off_duty', 'sleeper', 'driving', 'on_duty_not_driving')])
+        self.assertEqual(len(forms), 1)
+        self.assertEqual(
+            [line for page in reader.pages for line in page.extract_text().splitlines()
+             if line.replace('.', '').isdigit() and '.' in line],
+            ['10.0', '0.0', '6.5', '1.5', '12.5', '0.0', '11.0', '0.5', '4.0', '0.0', '5.8', '1.0'])
@@ -0,0 +1,144 @@
+"""
+Truck stops and rest areas along a route.
+
+Stops are loaded from a CSV file (`name,lat,lon,kind`) at
+settings.TRUCK_STOPS_PATH and indexed in a KD-tree over unit-sphere vectors,
+so ball queries are exact great-circle radius queries with no longitude
+wrap-around. `TruckStopIndex.corridor` walks the route and returns the stops within a
+given distance of it, ordered by distance along the route.
+"""
+import csv
+import math
+import os
+import threading
+
+from django.conf import settings
+
+from .geometry import EARTH_RADIUS_MILES, RouteIndex
+
+def _unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+def _chord(miles):
+    """Straight-line distance on the unit sphere for a great-circle distance."""
+    return 2 * math.sin(min(math.pi, miles / EARTH_RADIUS_MILES) / 2)
+
+class KDTree:
+    """
+    Static 3-d tree stored implicitly: the points are permuted so that each
+    subrange [lo, hi) has its splitting point at the middle index.
+    """
+
+    def __init__(self, points):
+        self.idx = list(range(len(points)))
+        self.points = points
+        self.axis = [0] * len(points)
+        stack = [(0, len(points), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= 1:
+                continue
+            mid = (lo + hi) // 2
+            axis = depth % 3
+            chunk = sorted(self.idx[lo:hi], key=lambda i: points[i][axis])
+            self.idx[lo:hi] = chunk
+            self.axis[mid] = axis
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+    def query_ball(self, center, radius):
+        """Indices of the points within Euclidean `radius` of `center`."""
+        out = []
+        r2 = radius * radius
+        cx, cy, cz = center
+        points, idx, axes = self.points, self.idx, self.axis
+        stack = [(0, len(idx))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            i = idx[mid]
+            px, py, pz = points[i]
+            if (px - cx)**2 + (py - cy)**2 + (pz - cz)**2 <= r2:
+                out.append(i)
+            if hi - lo == 1:
+                continue
+            diff = center[axes[mid]] - points[i][axes[mid]]
+            if diff <= radius:
+                stack.append((lo, mid))
+            if diff >= -radius:
+                stack.append((mid + 1, hi))
+        return out
+
+class TruckStopIndex:
+    def __init__(self, stops):
+        """`stops` is a list of dicts with at least name, lat and lon."""
+        self.stops = stops
+        self.tree = KDTree([_unit_vector(s['lat'], s['lon']) for s in stops])
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline='') as f:
+            stops = [
+                {'name': row['name'], 'lat': float(row['lat']), 'lon': float(row['lon']),
+                 'kind': row.get('kind') or 'truck_stop'}
+                for row in csv.DictReader(f)
+            ]
+        return cls(stops)
+
+    def near(self, lat, lon, radius_miles):
+        """Indices of the stops within `radius_miles` of (lat, lon)."""
+        return self.tree.query_ball(_unit_vector(lat, lon), _chord(radius_miles))
+
+    def corridor(self, route, radius_miles=5.0):
+        """
+        Stops within `radius_miles` of the route, ordered by distance along it.
+
+        `route` is a RouteIndex or a list of (lat, lon) points. A simplified
+        tier (e.g. 'high') is accurate enough for a corridor several miles wide
+        and far cheaper to measure than the full geometry. The route is
+        sampled every 2 x radius miles; a ball of radius sqrt(2) x radius
+        around each sample covers the corridor between samples, and each
+        candidate is then measured exactly against the nearby segments.
+        """
+        if not self.stops:
+            return []
+        if not isinstance(route, RouteIndex):
+            route = RouteIndex(route)
+
+        step = 2 * radius_miles
+        ball = math.sqrt(2) * radius_miles
+        found = {}
+        along = 0.0
+        while True:
+            lat, lon = route.locate(along)
+            for i in self.near(lat, lon, ball):
+                if i in found:
+                    continue
+                stop = self.stops[i]
+                off, at = route.project((stop['lat'], stop['lon']), along - step, along + step)
+                if off <= radius_miles:
+                    found[i] = (at, off)
+            if along >= route.length:
+                break
+            along = min(route.length, along + step)
+
+        return [
+            {**self.stops[i], 'mile_marker': round(at, 1), 'off_route_miles': round(off, 2)}
+            for i, (at, off) in sorted(found.items(), key=lambda item: item[1][0])
+        ]
+
+_stop_index = None
+_stop_index_lock = threading.Lock()
+
+def get_truck_stop_index():
+    """Return the TruckStopIndex for settings.TRUCK_STOPS_PATH, or None if unavailable."""
+    global _stop_index
+    path = getattr(settings, 'TRUCK_STOPS_PATH', None)
+    if _stop_index is None and path and os.path.exists(path):
+        with _stop_index_lock:
+            if _stop_index is None:
+                _stop_index = TruckStopIndex.from_csv(path)
+    return _stop_index
@@ -0,0 +1,52 @@
+"""
+HTTP access to upstream services, safe to share between threads.
+
+One `Upstream` per service (Nominatim, OSRM) is shared by every request.
+Each thread gets its own `requests.Session`, since sessions are not
+documented as thread-safe, and keeps its connections alive. A bounded
+semaphore caps the calls in flight to the service, and an optional minimum
+interval spaces calls out across all threads: each caller reserves the next
+free start time under a lock and sleeps outside it. Under gevent the
+threading primitives used here are patched into their cooperative versions.
+"""
+import threading
+import time
+
+TIMEOUT = 10  # seconds, for connect and read
+
+class Upstream:
+    def __init__(self, name, max_concurrency=4, min_interval=0.0, timeout=TIMEOUT, headers=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.headers = headers or {}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._local = threading.local()
+        self._rate_lock = threading.Lock()
+        self._next_start = 0.0
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            # Imported on first use to keep worker startup light
+            import requests
+            session = self._local.session = requests.Session()
+            session.headers.update(self.headers)
+        return session
+
+    def _wait_turn(self):
+        if not self.min_interval:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    def get(self, url, params=None):
+        """GET `url`, waiting for a free slot and the rate limit first."""
+        with self._slots:
+            self._wait_turn()
+            return self._session().get(url, params=params, timeout=self.timeout)
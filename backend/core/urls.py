@@ -1,7 +1,22 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     path('trip/', views.TripView.as_view(), name='trip'),
+    path('trip/optimize/', views.optimize_trip, name='optimize_trip'),
+    path('trip/departures/', views.departure_sweep, name='departure_sweep'),
+    path('trips/', views.trip_list, name='trip_list'),
+    path('trips/<int:trip_id>/', views.trip_detail, name='trip_detail'),
+    path('trips/<int:trip_id>/logs/', views.trip_logs, name='trip_logs'),
+    path('trips/<int:trip_id>/files/<str:name>', views.archived_file, name='archived_file'),
+    path('drivers/', views.drivers, name='drivers'),
+    path('drivers/<int:driver_id>/', views.driver_detail, name='driver_detail'),
+    path('fleet/assign/', views.assign_fleet, name='assign_fleet'),
+    path('eld/events/', views.ingest_events, name='ingest_events'),
     path('locations/search/', views.location_search, name='location_search'),
+    path('logs/export/', views.export_logs, name='export_logs'),
+    path('profiles/', views.profile_reports, name='profile_reports'),
+    path('profiles/<str:name>', views.profile_report, name='profile_report'),
+    re_path(r'^logs/history\.(?P<fmt>csv|ndjson|eld)$', views.log_history, name='log_history'),
+    re_path(r'^trips/(?P<trip_id>\d+)/grid/(?P<day>\d{4}-\d{2}-\d{2})\.(?P<fmt>svg|png)$', views.log_grid, name='log_grid'),
 ]
@@ -1,25 +1,53 @@
 import logging
+from datetime import date, datetime
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.decorators import api_view
-from .models import Trip
-from .serializers import TripSerializer
-from .services import calculate_route_and_logs
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from django.db.models import Prefetch
+from .models import Driver, Trip, LogEntry
+from .serializers import (AssignmentRequestSerializer, DriverSerializer, LogEntrySerializer, TripDetailSerializer,
+                          TripSerializer)
+from .pagination import LogCursorPagination, TripCursorPagination
+from .services import calculate_route_and_logs, local_naive, make_stop
+from .optimizer import OBJECTIVES, optimize_stop_order
+from .assignment import assign_loads
+from .ingest import EventError, event_buffer, parse_event
+from .departures import DEFAULT_STEP_MINUTES, DEFAULT_SWEEP_HOURS, MAX_SWEEP_HOURS, MIN_STEP_MINUTES, sweep_departures
 from .geocoding import geocoder
+from .exports import plan_export_parts, stream_export
+from .history import CONTENT_TYPES, stream_history
+from .gridrender import get_grid_image, GRID_CACHE_TTL
+from .geometry import FULL_TIER, ROUTE_TIERS
+from . import archive, profiling
 
 logger = logging.getLogger(__name__)
 
 class TripView(APIView):
     def post(self, request):
         logger.info(f"Received data: {request.data}")
+        route_tier = request.query_params.get('route_tier', FULL_TIER)
+        if route_tier != FULL_TIER and route_tier not in ROUTE_TIERS:
+            return Response({'error': f"route_tier must be one of: {', '.join([FULL_TIER, *ROUTE_TIERS])}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        departure = request.data.get('departure_time')
+        if departure:
+            try:
+                departure = local_naive(datetime.fromisoformat(departure))
+            except (TypeError, ValueError):
+                return Response({'error': 'departure_time must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
         try:
             serializer = TripSerializer(data=request.data)
             if serializer.is_valid():
                 trip = serializer.save()
                 logger.info(f"Trip saved with ID: {trip.id}")
-                result = calculate_route_and_logs(trip)
+                result = calculate_route_and_logs(trip, route_tier, departure=departure or None)
                 logger.info("Route and logs calculated successfully")
+                result['trip_id'] = trip.id
                 
                 # Add location data to the response
                 result['locations'] = [
@@ -27,18 +55,8 @@ class TripView(APIView):
                         'name': trip.current_location,
                         'lat': trip.current_location_coords[0],
                         'lon': trip.current_location_coords[1]
-                    },
-                    {
-                        'name': trip.pickup_location,
-                        'lat': trip.pickup_location_coords[0],
-                        'lon': trip.pickup_location_coords[1]
-                    },
-                    {
-                        'name': trip.dropoff_location,
-                        'lat': trip.dropoff_location_coords[0],
-                        'lon': trip.dropoff_location_coords[1]
                     }
-                ]
+                ] + [{'name': stop['name'], 'lat': stop['lat'], 'lon': stop['lon']} for stop in result['stops']]
                 
                 return Response(result)
             logger.error(f"Serializer validation errors: {serializer.errors}")
@@ -47,6 +65,203 @@ class TripView(APIView):
             logger.exception(f"Exception in trip creation: {e}")
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+def trip_list(request):
+    """Recent trips with their stops, newest first, cursor-paginated. Archived trips are not listed."""
+    paginator = TripCursorPagination()
+    page = paginator.paginate_queryset(Trip.objects.prefetch_related('stops'), request)
+    return paginator.get_paginated_response(TripSerializer(page, many=True).data)
+
+@api_view(['GET'])
+def trip_detail(request, trip_id):
+    """A trip with its stops and logs, each fetched with a single query, or read from the archive."""
+    logs = LogEntry.objects.order_by('date', 'start_time', 'id')
+    trip = (Trip.objects.prefetch_related('stops', Prefetch('logentry_set', queryset=logs))
+            .filter(pk=trip_id).first())
+    if trip is None:
+        archived = archive.read_trip(trip_id)
+        if archived is None:
+            return Response({'error': 'Trip not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(archived)
+    return Response(TripDetailSerializer(trip).data)
+
+@api_view(['GET'])
+def trip_logs(request, trip_id):
+    """A trip's log entries in time order, cursor-paginated. Archived trips come back in one page."""
+    if not Trip.objects.filter(pk=trip_id).exists():
+        archived = archive.read_trip(trip_id)
+        if archived is None:
+            return Response({'error': 'Trip not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'next': None, 'previous': None, 'results': archived['logs']})
+    paginator = LogCursorPagination()
+    page = paginator.paginate_queryset(LogEntry.objects.filter(trip_id=trip_id), request)
+    return paginator.get_paginated_response(LogEntrySerializer(page, many=True).data)
+
+@api_view(['POST'])
+def optimize_trip(request):
+    """
+    Find the best order for a trip's stops under the HOS rules without saving it.
+
+    Takes the same body as TripView with a `stops` list, plus an optional
+    `objective`: 'arrival' (default) or 'on_duty'.
+    """
+    objective = request.data.get('objective', 'arrival')
+    if objective not in OBJECTIVES:
+        return Response({'error': f"objective must be one of: {', '.join(OBJECTIVES)}"}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = TripSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    if len(data.get('stops') or []) < 2:
+        return Response({'error': 'At least two stops are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    stops = [make_stop(s['location'], s['location_coords'], s.get('kind', 'stop'), s.get('dwell_minutes', 60))
+             for s in data['stops']]
+    result = optimize_stop_order(
+        data['current_location'], data['current_location_coords'], stops,
+        cycle_hours=data.get('current_cycle_hours', 0),
+        use_sleeper_berth=data.get('use_sleeper_berth', False),
+        objective=objective,
+    )
+    ordered = [stops[i] for i in result['order']]
+    return Response({
+        'objective': objective,
+        'method': result['method'],
+        'candidates_evaluated': result['evaluated'],
+        'stops': [
+            {'location': s['location'], 'kind': s['kind'], 'dwell_minutes': s['dwell_minutes'],
+             'lat': s['coords'][0], 'lon': s['coords'][1]}
+            for s in ordered
+        ],
+        'arrival': result['finish'],
+        'on_duty_hours': round(result['on_duty_minutes'] / 60, 2),
+        'total_distance': result['distance'],
+    })
+
+@api_view(['POST'])
+def departure_sweep(request):
+    """
+    Arrival time of a trip for every departure slot in a range, without saving it.
+
+    Takes the same body as TripView, plus optional `earliest` (ISO datetime,
+    default now), `hours` (default 48) and `step_minutes` (default 15).
+    """
+    try:
+        earliest = request.data.get('earliest')
+        earliest = local_naive(datetime.fromisoformat(earliest)) if earliest else None
+        hours = float(request.data.get('hours', DEFAULT_SWEEP_HOURS))
+        step_minutes = int(request.data.get('step_minutes', DEFAULT_STEP_MINUTES))
+    except (TypeError, ValueError):
+        return Response({'error': 'Invalid earliest, hours or step_minutes'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < hours <= MAX_SWEEP_HOURS or step_minutes < MIN_STEP_MINUTES:
+        return Response({'error': f'hours must be in (0, {MAX_SWEEP_HOURS}] and step_minutes at least {MIN_STEP_MINUTES}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    serializer = TripSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+
+    if data.get('stops'):
+        stops = [make_stop(s['location'], s['location_coords'], s.get('kind', 'stop'), s.get('dwell_minutes', 60))
+                 for s in data['stops']]
+    else:
+        stops = [make_stop(data['pickup_location'], data['pickup_location_coords'], 'pickup'),
+                 make_stop(data['dropoff_location'], data['dropoff_location_coords'], 'dropoff')]
+    result = sweep_departures(
+        data['current_location'], data['current_location_coords'], stops,
+        cycle_hours=data.get('current_cycle_hours', 0),
+        use_sleeper_berth=data.get('use_sleeper_berth', False),
+        earliest=earliest, hours=hours, step_minutes=step_minutes,
+    )
+    return Response(result)
+
+@api_view(['GET', 'POST'])
+def drivers(request):
+    """List drivers with their remaining 11/14-hour clocks, or add one."""
+    if request.method == 'POST':
+        serializer = DriverSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(DriverSerializer(Driver.objects.order_by('id'), many=True).data)
+
+@api_view(['GET', 'PATCH'])
+def driver_detail(request, driver_id):
+    """Read a driver, or update their location and HOS clock state."""
+    try:
+        driver = Driver.objects.get(pk=driver_id)
+    except Driver.DoesNotExist:
+        return Response({'error': 'Driver not found'}, status=status.HTTP_404_NOT_FOUND)
+    if request.method == 'PATCH':
+        serializer = DriverSerializer(driver, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data)
+    return Response(DriverSerializer(driver).data)
+
+@api_view(['POST'])
+def assign_fleet(request):
+    """
+    Assign open loads to drivers, minimizing late deliveries.
+
+    Body: `loads` (pickup_location, dropoff_location, optional deliver_by and
+    dwell minutes) and optional `drivers` ids (default: every driver).
+    """
+    serializer = AssignmentRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    fleet = data.get('drivers') or list(Driver.objects.exclude(current_location_coords=None).order_by('id'))
+    loads = data['loads']
+    for load in loads:
+        if load.get('deliver_by'):
+            load['deliver_by'] = local_naive(load['deliver_by'])
+
+    result = assign_loads(fleet, loads)
+    for a in result['assignments']:
+        driver, load = fleet[a.pop('driver')], loads[a['load']]
+        a['driver_id'] = driver.id
+        a['driver_name'] = driver.name
+        a['pickup_location'] = load['pickup_location']
+        a['dropoff_location'] = load['dropoff_location']
+    return Response(result)
+
+MAX_EVENT_ERRORS = 20
+
+@api_view(['POST'])
+def ingest_events(request):
+    """
+    Accept a batch of ELD events as NDJSON, one object per line:
+    {"driver": 1, "ts": "...", "type": "status"|"gps", "status": ..., "lat": ..., "lon": ...}.
+
+    Events are buffered and written in bulk; the response reports how many
+    were accepted, and the first errors for lines that do not parse or
+    name an unknown driver.
+    """
+    parsed, errors = [], []
+    for number, line in enumerate(request.body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            parsed.append((number, parse_event(line)))
+        except EventError as e:
+            if len(errors) < MAX_EVENT_ERRORS:
+                errors.append({'line': number, 'error': str(e)})
+
+    known = set(Driver.objects.filter(id__in={event['driver_id'] for _, event in parsed})
+                .values_list('id', flat=True))
+    events = []
+    for number, event in parsed:
+        if event['driver_id'] in known:
+            events.append(event)
+        else:
+            errors.append({'line': number, 'error': f"Unknown driver: {event['driver_id']}"})
+    event_buffer.add(events)
+    errors = sorted(errors, key=lambda e: e['line'])[:MAX_EVENT_ERRORS]
+    return Response({'accepted': len(events), 'errors': errors}, status=status.HTTP_202_ACCEPTED)
+
 @api_view(['GET'])
 def location_search(request):
     query = request.query_params.get('q', '')
@@ -55,3 +270,115 @@ def location_search(request):
     
     results = geocoder.search(query)
     return Response(results)
+
+@api_view(['GET'])
+def export_logs(request):
+    """
+    Render the logs of several trips into one PDF.
+
+    Query params: `trips` (comma-separated ids), `start` and `end` (YYYY-MM-DD).
+    The document is streamed back part by part as the parts are rendered.
+    """
+    try:
+        trips = request.query_params.get('trips')
+        trip_ids = [int(t) for t in trips.split(',') if t] if trips else None
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        start_date = date.fromisoformat(start) if start else None
+        end_date = date.fromisoformat(end) if end else None
+    except ValueError:
+        return Response({"error": "Invalid trips or date parameters"}, status=400)
+
+    if not trip_ids and not (start_date and end_date):
+        return Response({"error": "Specify trips or a start and end date"}, status=400)
+
+    parts = plan_export_parts(trip_ids, start_date, end_date)
+    if not parts:
+        return Response({"error": "No logs found"}, status=404)
+    response = StreamingHttpResponse(stream_export(parts, start_date, end_date), content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="logs_export.pdf"'
+    return response
+
+@api_view(['GET'])
+def log_history(request, fmt):
+    """
+    Stream log entries as CSV, NDJSON or an ELD output file.
+
+    Same query params as export_logs; without any, every entry is exported.
+    Rows are read from the database in chunks as the response is sent.
+    """
+    try:
+        trips = request.query_params.get('trips')
+        trip_ids = [int(t) for t in trips.split(',') if t] if trips else None
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        start_date = date.fromisoformat(start) if start else None
+        end_date = date.fromisoformat(end) if end else None
+    except ValueError:
+        return Response({"error": "Invalid trips or date parameters"}, status=400)
+
+    response = StreamingHttpResponse(stream_history(fmt, trip_ids, start_date, end_date),
+                                     content_type=CONTENT_TYPES[fmt])
+    extension = 'txt' if fmt == 'eld' else fmt
+    response['Content-Disposition'] = f'attachment; filename="logs.{extension}"'
+    return response
+
+@api_view(['GET'])
+def log_grid(request, trip_id, day, fmt):
+    """Render one day's log grid as SVG or PNG from the stored grid positions."""
+    try:
+        day = date.fromisoformat(day)
+    except ValueError:
+        return Response({"error": "Invalid date"}, status=400)
+    positions = list(
+        LogEntry.objects.filter(trip_id=trip_id, date=day)
+        .order_by('start_time')
+        .values_list('grid_positions', flat=True)
+    )
+    if not positions:
+        archived = archive.read_trip(int(trip_id))
+        if archived:
+            positions = [log['grid_positions'] for log in archived['logs'] if log['date'] == day.isoformat()]
+    if not positions:
+        return Response({"error": "No logs found"}, status=404)
+
+    digest, body, content_type = get_grid_image(positions, fmt)
+    etag = quote_etag(digest)
+    # Compares weakly, so the W/ tag sent back for a gzipped grid still matches
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={GRID_CACHE_TTL}'
+    return response
+
+@api_view(['GET'])
+def archived_file(request, trip_id, name):
+    """A generated PDF of an archived trip."""
+    data = archive.read_file(trip_id, name)
+    if data is None:
+        return Response({"error": "File not found"}, status=404)
+    response = HttpResponse(data, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_reports(request):
+    """Stored request profiles, newest first."""
+    return Response(profiling.list_reports())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_report(request, name):
+    """A stored profile: the top functions as text, or the raw .prof file with ?raw=1."""
+    path = profiling.report_path(name)
+    if path is None:
+        return Response({"error": "Report not found"}, status=404)
+    if request.GET.get('raw'):
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name,
+                            content_type='application/octet-stream')
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        return Response({"error": "sort must be cumulative, tottime or calls"}, status=400)
+    return HttpResponse(profiling.report_text(path, sort), content_type='text/plain; charset=utf-8')
@@ -0,0 +1,30 @@
+"""
+Gunicorn settings (picked up from the working directory, or pass
+`-c gunicorn.conf.py`).
+
+The app is preloaded in the master and `core.preload.warm` builds the shared
+read-only data before any worker is forked.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Threaded (gthread) workers, so the admission lanes in core/admission.py
+# can queue requests within each process. More threads than the trip lane's
+# in-flight limit plus queue (4 + 8) leave threads free for cached requests
+# while slow ones wait.
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+preload_app = True
+# Trip planning can wait on geocoding and routing for several seconds
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Recycle workers now and then; new ones fork from the warm master
+max_requests = 1000
+max_requests_jitter = 100
+errorlog = '-'
+accesslog = '-'
+
+def when_ready(server):
+    from core.preload import warm
+    warm()
+    server.log.info("Preloaded shared data")
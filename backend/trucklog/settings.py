@@ -47,6 +47,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.profiling.ProfilingMiddleware',
+    # Outermost after security so it compresses the final response body
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,10 +57,22 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Last, so only requests that resolved to a view are queued
+    'core.admission.AdmissionMiddleware',
 ]
 
+# Per-process caps on slow endpoints (see core/admission.py); override lanes with ADMISSION_LANES
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'True') == 'True'
+
 ROOT_URLCONF = 'trucklog.urls'
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -126,6 +141,53 @@ STATIC_URL = 'static/'
 # Media files (User uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Let the web server send media files: MEDIA_ACCEL_REDIRECT is the internal
+# nginx location mapped to MEDIA_ROOT (e.g. /protected-media/); set
+# MEDIA_SENDFILE=True for Apache/lighttpd X-Sendfile instead
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', 'False') == 'True'
+
+# Offline road graph used when the OSRM server is unavailable
+# (build with `python manage.py build_road_graph`)
+ROAD_GRAPH_PATH = os.environ.get('ROAD_GRAPH_PATH', str(BASE_DIR / 'data' / 'roadgraph.bin'))
+
+# Truck stop / rest area dataset (CSV: name,lat,lon,kind) used to place
+# breaks and fueling stops at real locations
+TRUCK_STOPS_PATH = os.environ.get('TRUCK_STOPS_PATH', str(BASE_DIR / 'data' / 'truck_stops.csv'))
+
+# Cold archive: trips older than ARCHIVE_AFTER_DAYS are moved into monthly
+# files here by `python manage.py archive_trips`
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', str(BASE_DIR / 'data' / 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+
+# Carrier and device fields of the ELD output file header (core/history.py)
+ELD_CARRIER_USDOT = os.environ.get('ELD_CARRIER_USDOT', '')
+ELD_CARRIER_NAME = os.environ.get('ELD_CARRIER_NAME', '')
+ELD_REGISTRATION_ID = os.environ.get('ELD_REGISTRATION_ID', '')
+ELD_IDENTIFIER = os.environ.get('ELD_IDENTIFIER', '')
+
+# Size of each web worker's process pool for CPU-bound planning (see core/procpool.py)
+CPU_POOL_SIZE = int(os.environ.get('CPU_POOL_SIZE', 2))
+
+# Request profiling (see core/profiling.py), off unless PROFILING=True:
+# requests with a valid X-Profile token, plus a random PROFILE_SAMPLE_RATE
+# fraction, are profiled into PROFILE_DIR, kept under PROFILE_MAX_BYTES
+PROFILING = os.environ.get('PROFILING', 'False') == 'True'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', str(BASE_DIR / 'data' / 'profiles'))
+PROFILE_MAX_BYTES = int(os.environ.get('PROFILE_MAX_BYTES', 50 * 1024 * 1024))
+PROFILE_TOKEN_MAX_AGE = 60*60*24
+
+# Shared cache for geocodes, routes and cross-process request coalescing
+# (requires the redis package). Without REDIS_URL each worker process keeps
+# its own in-memory cache.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
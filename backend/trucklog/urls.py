@@ -15,15 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from core.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
+    # Generated PDFs, handed off to the web server when MEDIA_ACCEL_REDIRECT or
+    # MEDIA_SENDFILE is set, else served with range and conditional request support
+    re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.+)$', serve_media),
 ]
-
-# Serve media files in both development and production
-# In production, you might want to use a CDN or cloud storage instead
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -32,7 +32,7 @@ function App() {
     setLoading(true);
     setError(null);
     try {
-      const res = await axios.post('https://app-production-6389.up.railway.app/api/trip/', formData);
+      const res = await axios.post('https://app-production-6389.up.railway.app/api/trip/?route_tier=medium', formData);
       setResult(res.data);
 
       // Use the route coordinates from the response if available